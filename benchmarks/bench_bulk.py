@@ -0,0 +1,86 @@
+"""Benchmark bulk export and import throughput and memory.
+
+Usage:
+    python benchmarks/bench_bulk.py --rows 2000000
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp())
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'source.db'}"
+
+    from sqlalchemy import create_engine
+    from src.database import Base, SessionLocal, engine
+    from src.services import bulk
+
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(0)
+    words = [f"w{i}" for i in range(5000)]
+    conversations = [(str(uuid.uuid4()), f"user-{i % 1000}") for i in range(max(1, args.rows // 20))]
+
+    start = time.perf_counter()
+    raw = engine.raw_connection()
+    cursor = raw.cursor()
+    cursor.executemany(
+        "INSERT INTO conversations (id, user_id, title, created_at, updated_at) "
+        "VALUES (?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)",
+        [(cid, uid, "bench") for cid, uid in conversations],
+    )
+    for offset in range(0, args.rows, args.batch_size):
+        cursor.executemany(
+            "INSERT INTO messages (id, conversation_id, user_message, ai_response, tokens_used, created_at) "
+            "VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            [
+                (str(uuid.uuid4()), conversations[i // 20][0],
+                 " ".join(rng.choices(words, k=12)), " ".join(rng.choices(words, k=60)), 100)
+                for i in range(offset, min(offset + args.batch_size, args.rows))
+            ],
+        )
+    raw.commit()
+    raw.close()
+    print(f"Loaded {args.rows:,} messages in {time.perf_counter() - start:.1f}s "
+          f"(peak RSS {peak_rss_mb():.0f} MB)")
+
+    for fmt in bulk.FORMATS:
+        path = workdir / f"export.{fmt}"
+        db = SessionLocal()
+        start = time.perf_counter()
+        rows = bulk.export_to_file(db, str(path), fmt, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        db.close()
+        print(f"export {fmt:>7}: {rows / elapsed:,.0f} rows/s, {path.stat().st_size / 1e6:.1f} MB, "
+              f"peak RSS {peak_rss_mb():.0f} MB")
+
+        target = create_engine(f"sqlite:///{workdir / f'import_{fmt}.db'}")
+        Base.metadata.create_all(bind=target)
+        start = time.perf_counter()
+        with target.connect() as conn, open(path, "rb") as source:
+            rows = bulk.import_from_file(conn, source, fmt, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"import {fmt:>7}: {rows / elapsed:,.0f} rows/s, peak RSS {peak_rss_mb():.0f} MB")
+        target.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Benchmark logging overhead on the caller side and per chat request.
+
+Compares a synchronous text handler (the previous setup) with the queue-based
+JSON pipeline, then measures ``/chat/stream`` requests against a stub provider
+with logging disabled, at INFO, and at DEBUG with and without sampling.
+
+Usage:
+    python benchmarks/bench_logging.py --calls 100000 --requests 300
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("MEMORY_ENABLED", "False")
+os.environ.setdefault("TITLES_ENABLED", "False")
+
+
+class SlowSink:
+    """Stream whose writes block for ``delay`` seconds."""
+
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, data):
+        time.sleep(self.delay)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def per_call_us(log: logging.Logger, calls: int, fstring: bool) -> float:
+    conversation_id, turns = "3f1c2a", 12
+    start = time.perf_counter()
+    if fstring:
+        for _ in range(calls):
+            log.info(f"Context for {conversation_id}: {turns} turns")
+    else:
+        for _ in range(calls):
+            log.info("Context for %s: %d turns", conversation_id, turns)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--sink-delay", type=float, default=0.0002, help="seconds per write of the slow sink")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    import src.main as app_module
+    from src.database import init_db
+    from src.services.ai_service import PROVIDERS, AIProvider, AIService
+    from src.services.logs import configure_logging, stop_logging
+
+    devnull = open(os.devnull, "w")
+    log = logging.getLogger("bench")
+
+    # Caller-side cost of one INFO record, with a fast sink and with a sink that
+    # blocks briefly on every write (a full pipe to a log collector).
+    root = logging.getLogger()
+    print(f"{'handler':<40} {'us/call':>8}")
+    for sink_name, sink in (("/dev/null", devnull), ("slow sink", SlowSink(devnull, args.sink_delay))):
+        stop_logging()
+        sync_handler = logging.StreamHandler(sink)
+        sync_handler.setFormatter(logging.Formatter(
+            "%(asctime)s | %(levelname)-8s | %(name)s:%(funcName)s:%(lineno)d - %(message)s"
+        ))
+        root.handlers = [sync_handler]
+        root.setLevel(logging.INFO)
+        calls = args.calls if sink is devnull else args.calls // 50
+        print(f"{'sync text handler, f-string, ' + sink_name:<40} {per_call_us(log, calls, fstring=True):>8.2f}")
+        configure_logging(level="INFO", fmt="json", stream=sink)
+        print(f"{'queue + JSON, ' + sink_name:<40} {per_call_us(log, calls, fstring=False):>8.2f}")
+        stop_logging()
+
+    class StubProvider(AIProvider):
+        env_prefix = "BENCH"
+        default_model = "stub"
+
+        async def generate_response(self, prompt, conversation_history, model=None, usage=None, documents=None):
+            return "ok", 0
+
+        async def stream_response(self, prompt, conversation_history, model=None, usage=None, documents=None):
+            for chunk in ("one ", "two ", "three"):
+                yield chunk
+
+    PROVIDERS["bench"] = StubProvider
+    os.environ["AI_PROVIDER"] = "bench"
+    app_module.ai_service = AIService()
+    init_db()
+    client = TestClient(app_module.app)
+
+    configs = [
+        ("logging disabled", None),
+        ("json, INFO", dict(level="INFO")),
+        ("json, DEBUG sampled 1%", dict(level="DEBUG", debug_sample_rate=0.01)),
+        ("json, DEBUG all", dict(level="DEBUG", debug_sample_rate=1.0)),
+    ]
+    results = {}
+    for name, config in configs:
+        if config is None:
+            logging.disable(logging.CRITICAL)
+        else:
+            logging.disable(logging.NOTSET)
+            configure_logging(fmt="json", stream=devnull, **config)
+        for _ in range(20):
+            client.post("/chat/stream", json={"content": "warm up"})
+        timings = []
+        for i in range(args.requests):
+            start = time.perf_counter()
+            client.post("/chat/stream", json={"content": f"hello {i}"})
+            timings.append(time.perf_counter() - start)
+        stop_logging()
+        results[name] = statistics.median(timings) * 1000
+    logging.disable(logging.NOTSET)
+
+    baseline = results["logging disabled"]
+    print(f"\n{'/chat/stream':<40} {'p50 ms':>8} {'overhead':>9}")
+    for name, median in results.items():
+        print(f"{name:<40} {median:>8.3f} {median - baseline:>+8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark vector search latency for the flat and IVF indexes.
+
+Usage:
+    python benchmarks/bench_rag.py --vectors 200000 --dimension 384
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.services.vector_index import FlatIndex, IVFIndex, load_index  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    # Clustered synthetic embeddings (topics plus noise).
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(1000, args.dimension)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=args.vectors)]
+    vectors += rng.normal(scale=0.5, size=vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [str(i) for i in range(args.vectors)]
+    queries = vectors[rng.choice(args.vectors, args.queries, replace=False)]
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(ids, vectors)
+    print(f"IVF build ({args.vectors:,} x {args.dimension}): {time.perf_counter() - start:.1f}s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, index in (("flat", FlatIndex(np.asarray(ids), vectors)), ("ivf", ivf)):
+            index.save(Path(tmp) / name)
+            start = time.perf_counter()
+            loaded = load_index(Path(tmp) / name)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            exact = FlatIndex(np.asarray(ids), vectors)
+            timings, recall = [], []
+            for query in queries:
+                t0 = time.perf_counter()
+                hits = loaded.search(query, 10)
+                timings.append((time.perf_counter() - t0) * 1000)
+                truth = {i for i, _ in exact.search(query, 10)}
+                recall.append(len(truth & {i for i, _ in hits}) / 10)
+            timings.sort()
+            print(
+                f"{name:>5}: load={load_ms:.1f}ms p50={statistics.median(timings):.2f}ms "
+                f"p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms recall@10={np.mean(recall):.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
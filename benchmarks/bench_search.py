@@ -0,0 +1,110 @@
+"""Benchmark full-text search latency over a large synthetic message table.
+
+Usage:
+    python benchmarks/bench_search.py --rows 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Natural-language term frequencies are Zipf-distributed: a few very common
+# words and a long tail, which is what makes inverted indexes selective.
+VOCABULARY = [f"w{i}" for i in range(50_000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+
+class TextGenerator:
+    """Cut sentences out of one large pre-sampled word stream (sampling per row is slow)."""
+
+    def __init__(self, rng: random.Random, size: int = 1_000_000):
+        self.rng = rng
+        self.words = rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=size)
+
+    def sentence(self, words: int) -> str:
+        start = self.rng.randrange(len(self.words) - words)
+        return " ".join(self.words[start:start + words])
+
+
+def query_terms(rng: random.Random) -> str:
+    # Skip the ~100 stop-word-like head terms, as real queries rarely consist of them.
+    return " ".join(rng.sample(VOCABULARY[100:5000], 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    path = Path(tempfile.mkdtemp()) / "bench_search.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    from src.database import Base, SessionLocal, engine
+    from src.database.fts import create_search_index
+    from src.services.search import search_messages
+
+    # Bulk load first and build the index once; the insert triggers are for
+    # the online path, one row at a time.
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    text = TextGenerator(rng)
+    conversations = [(str(uuid.uuid4()), f"user-{i % args.users}") for i in range(max(1, args.rows // 10))]
+
+    start = time.perf_counter()
+    raw = engine.raw_connection()
+    cursor = raw.cursor()
+    cursor.executemany(
+        "INSERT INTO conversations (id, user_id, title) VALUES (?, ?, ?)",
+        [(cid, uid, "bench") for cid, uid in conversations],
+    )
+    batch = []
+    for i in range(args.rows):
+        cid = conversations[i // 10][0]
+        batch.append((str(uuid.uuid4()), cid, text.sentence(12), text.sentence(60), 0))
+        if len(batch) == 10_000:
+            cursor.executemany(
+                "INSERT INTO messages (id, conversation_id, user_message, ai_response, tokens_used) "
+                "VALUES (?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        cursor.executemany(
+            "INSERT INTO messages (id, conversation_id, user_message, ai_response, tokens_used) "
+            "VALUES (?, ?, ?, ?, ?)", batch)
+    raw.commit()
+    raw.close()
+    print(f"Loaded {args.rows:,} messages in {time.perf_counter() - start:.1f}s ({path})")
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        create_search_index(conn)
+    print(f"Built full-text index in {time.perf_counter() - start:.1f}s")
+
+    db = SessionLocal()
+    for label, scoped in (("global", False), ("per-user", True)):
+        timings = []
+        for _ in range(args.queries):
+            query = query_terms(rng)
+            user_id = f"user-{rng.randrange(args.users)}" if scoped else None
+            t0 = time.perf_counter()
+            search_messages(db, query, user_id=user_id, limit=20)
+            timings.append((time.perf_counter() - t0) * 1000)
+        timings.sort()
+        print(
+            f"{label:>9}: p50={statistics.median(timings):.2f}ms "
+            f"p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms max={timings[-1]:.2f}ms"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark building and serializing a long conversation history.
+
+Compares the previous path (ORM objects -> ``MessageResponse`` models ->
+FastAPI response validation -> ``json``) with the current one (column
+projection -> dicts -> ``orjson``), then times ``GET /conversation/{id}``
+end to end.
+
+Usage:
+    python benchmarks/bench_serialization.py --messages 1000 --runs 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def timed(fn, runs: int) -> float:
+    fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.testclient import TestClient
+
+    import src.main as app_module
+    from src.database import SessionLocal, Conversation, Message, init_db
+    from src.models.schemas import ConversationHistory, MessageResponse
+
+    init_db()
+    conversation_id = str(uuid.uuid4())
+    start = datetime.utcnow()
+    db = SessionLocal()
+    db.add(Conversation(id=conversation_id, user_id="bench", title="bench"))
+    db.add_all(
+        Message(
+            conversation_id=conversation_id,
+            user_message=f"Question {i}: how does this part of the system behave under load?",
+            ai_response="A typical answer spans a few sentences of explanation. " * 8,
+            tokens_used=180, prompt_tokens=120, completion_tokens=60, cached_tokens=0,
+            created_at=start + timedelta(seconds=i),
+        )
+        for i in range(args.messages)
+    )
+    db.commit()
+    db.close()
+
+    loop = asyncio.new_event_loop()
+    route = next(r for r in app_module.app.routes if getattr(r, "path", "") == "/conversation/{conversation_id}")
+
+    def before():
+        db = SessionLocal()
+        try:
+            conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+            history = ConversationHistory(
+                conversation_id=conv.id,
+                user_id=conv.user_id,
+                messages=[
+                    MessageResponse(
+                        id=m.id, conversation_id=m.conversation_id, user_message=m.user_message,
+                        ai_response=m.ai_response, timestamp=m.created_at, tokens_used=m.tokens_used or 0,
+                        prompt_tokens=m.prompt_tokens or 0, completion_tokens=m.completion_tokens or 0,
+                        cached_tokens=m.cached_tokens or 0,
+                    ) for m in conv.messages
+                ],
+                created_at=conv.created_at,
+                updated_at=conv.updated_at,
+                total_messages=len(conv.messages),
+            )
+            content = loop.run_until_complete(serialize_response(field=route.response_field, response_content=history))
+            return JSONResponse(content).body
+        finally:
+            db.close()
+
+    def after():
+        db = SessionLocal()
+        try:
+            conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+            return ORJSONResponse(app_module.history_payload(db, conv)).body
+        finally:
+            db.close()
+
+    print(f"{args.messages} messages, median of {args.runs} runs")
+    print(f"{'path':<46} {'ms':>8}")
+    old, new = timed(before, args.runs), timed(after, args.runs)
+    print(f"{'ORM + Pydantic + response validation + json':<46} {old:>8.2f}")
+    print(f"{'column projection + dicts + orjson':<46} {new:>8.2f}  ({old / new:.1f}x)")
+
+    client = TestClient(app_module.app)
+    url = f"/conversation/{conversation_id}"
+    for encoding in ("identity", "gzip"):
+        headers = {"Accept-Encoding": encoding}
+        elapsed = timed(lambda: client.get(url, headers=headers), args.runs)
+        print(f"{'GET /conversation/{id}, ' + encoding:<46} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Import-time profile of the application and provider construction time.
+
+Runs ``python -X importtime`` in a fresh interpreter, so module caches from
+this process do not hide import costs, and reports the slowest packages.
+
+Usage:
+    python benchmarks/bench_startup.py --provider openai --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+import src.main
+imported = time.perf_counter()
+src.main.get_ai_service()
+print(f"RESULT {imported - start:.4f} {time.perf_counter() - imported:.4f}")
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--provider", default=os.getenv("AI_PROVIDER", "openai"))
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        "AI_PROVIDER": args.provider,
+        "DATABASE_URL": "sqlite:///:memory:",
+        # Placeholder keys: construction must not need a network round trip.
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+        "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY", "bench"),
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "bench"),
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SNIPPET],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+
+    self_us = defaultdict(int)
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        own, total, _, module = match.groups()
+        self_us[module.split(".")[0]] += int(own)
+        cumulative[module] = int(total)
+
+    import_s, construct_s = map(float, re.search(r"RESULT (\S+) (\S+)", proc.stdout).groups())
+    sdks = [name for name in ("openai", "anthropic", "google", "httpx", "pyarrow") if name in self_us]
+    print(f"provider={args.provider}: import src.main {import_s * 1000:.0f} ms, "
+          f"AIService() {construct_s * 1000:.0f} ms, modules loaded {len(cumulative)}")
+    print(f"SDK / heavy packages loaded: {', '.join(sdks) or 'none'}")
+    print(f"\n{'package':<28}{'self ms':>10}")
+    for package, us in sorted(self_us.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<28}{us / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
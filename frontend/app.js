@@ -27,6 +27,7 @@ const ui = {
 // --- Initialization ---
 document.addEventListener('DOMContentLoaded', () => {
     loadConversations();
+    subscribeToTitles();
     setupEventListeners();
     autoResizeTextarea();
     
@@ -88,6 +89,14 @@ async function sendMessage() {
             })
         });
 
+        if (response.status === 429) {
+            // Usage quota reached before anything was sent to the model.
+            const wait = response.headers.get('Retry-After');
+            updateAiBubble(aiMsgId, `Limite de uso atingido.${wait ? ` Tente novamente em ${wait}s.` : ''}`);
+            setStreaming(false);
+            return;
+        }
+
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
         let fullContent = '';
@@ -113,8 +122,14 @@ async function sendMessage() {
                         } else if (data.type === 'content') {
                             fullContent += data.content;
                             updateAiBubble(aiMsgId, fullContent);
+                        } else if (data.type === 'error') {
+                            // Typed provider failure: nothing was saved, the message can be resent.
+                            const wait = data.retry_after ? ` Tente novamente em ${Math.ceil(data.retry_after)}s.` : '';
+                            updateAiBubble(aiMsgId, fullContent || `O provedor de IA está indisponível no momento.${wait}`);
+                            setStreaming(false);
                         } else if (data.type === 'done') {
                             setStreaming(false);
+                            loadConversations(); // Now persisted; its title arrives later
                         }
                     } catch (e) {
                         console.error('Error parsing SSE:', e);
@@ -140,6 +155,24 @@ async function loadConversations() {
     }
 }
 
+function subscribeToTitles() {
+    // Titles are generated in the background after the first exchange.
+    const events = new EventSource('/conversations/events');
+    events.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type !== 'title') return;
+
+        const conversation = state.conversations.find(c => c.id === data.conversation_id);
+        if (conversation) {
+            conversation.title = data.title;
+            renderConvList();
+        }
+        if (data.conversation_id === state.currentId) {
+            ui.currentTitle.innerText = data.title;
+        }
+    };
+}
+
 async function loadConversation(id) {
     state.currentId = id;
     ui.welcomeView.style.display = 'none';
@@ -156,7 +189,8 @@ async function loadConversation(id) {
         });
         
         state.messages = data.messages;
-        ui.currentTitle.innerText = data.messages[0]?.user_message.slice(0, 30) + '...' || 'Conversa';
+        const conversation = state.conversations.find(c => c.id === id);
+        ui.currentTitle.innerText = conversation?.title || data.messages[0]?.user_message.slice(0, 30) + '...' || 'Conversa';
         ui.chatMeta.innerText = `${data.total_messages} mensagens`;
         scrollToBottom();
         renderConvList(); // Refresh active state
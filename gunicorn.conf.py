@@ -0,0 +1,50 @@
+"""Gunicorn launch profile: several Uvicorn workers behind one master process.
+
+Usage:
+    gunicorn -c gunicorn.conf.py src.main:app
+
+State that must be consistent across workers (counters, TTL entries,
+pub/sub) goes through STATE_BACKEND_URL; set it to a Redis URL when running
+more than one worker or more than one container.
+"""
+import multiprocessing
+import os
+
+bind = f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('API_PORT', 8000)}"
+# A UvicornWorker that starts the app's drain when the stop signal arrives.
+worker_class = "src.workers.DrainingWorker"
+# The app is I/O bound (provider calls, DB); one event loop per core is enough.
+# With the in-memory state backend, quotas, counters and pub/sub would be
+# per worker, so a single worker is the default and more are refused.
+shared_state = not os.getenv("STATE_BACKEND_URL", "memory://").startswith("memory://")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() if shared_state else 1))
+if workers > 1 and not shared_state:
+    raise RuntimeError(
+        f"WEB_CONCURRENCY={workers} needs a shared STATE_BACKEND_URL (e.g. redis://host:6379/0); "
+        "the in-memory backend only works with one worker"
+    )
+
+# Long SSE streams must be allowed to finish during rolling restarts; keep
+# graceful_timeout above STREAM_DRAIN_TIMEOUT plus TASK_DRAIN_TIMEOUT.
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 60))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+
+# Recycle workers periodically to bound memory growth; jitter avoids restarting all at once.
+max_requests = int(os.getenv("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 1000))
+
+# Each worker builds its own provider clients and DB pool after fork.
+preload_app = False
+
+accesslog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def on_starting(server):
+    """Create tables once in the master instead of racing in every worker."""
+    from src.database import engine, init_db
+
+    init_db()
+    # Never share pooled connections with forked workers.
+    engine.dispose()
@@ -1,6 +1,6 @@
 """Database package."""
-from .config import engine, SessionLocal, Base, get_db, init_db, drop_db
-from .models import Conversation, Message
+from .config import engine, SessionLocal, Base, get_db, init_db, drop_db, warm_pool, ping_db
+from .models import Conversation, Message, MessageEmbedding, RetentionPolicy, UsageEvent, UsageRollup, Comparison, ComparisonResult
 
 __all__ = [
     "engine",
@@ -9,6 +9,14 @@ __all__ = [
     "get_db",
     "init_db",
     "drop_db",
+    "warm_pool",
+    "ping_db",
     "Conversation",
     "Message",
+    "MessageEmbedding",
+    "RetentionPolicy",
+    "UsageEvent",
+    "UsageRollup",
+    "Comparison",
+    "ComparisonResult",
 ]
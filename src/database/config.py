@@ -1,19 +1,36 @@
 """Database configuration and connection."""
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.pool import StaticPool
 
+from .fts import create_search_index
+
 # Get database URL from environment or use default
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./chatbot.db")
 
 # SQLite configuration for local development
 if DATABASE_URL.startswith("sqlite"):
+    in_memory = ":memory:" in DATABASE_URL or DATABASE_URL in ("sqlite://", "sqlite:///")
     engine = create_engine(
         DATABASE_URL,
-        connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-        poolclass=StaticPool if "sqlite" in DATABASE_URL else None,
+        connect_args={"check_same_thread": False},
+        # An in-memory database only exists on its single connection. File
+        # databases use a regular pool so several workers can share the file.
+        **({"poolclass": StaticPool} if in_memory else {}),
     )
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # SQLite ignores foreign keys (and ON DELETE CASCADE) unless enabled per connection.
+        cursor.execute("PRAGMA foreign_keys=ON")
+        if not in_memory:
+            # WAL lets readers in other processes proceed while one writes.
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+        cursor.close()
 else:
     # For other databases (PostgreSQL, MySQL, etc)
     engine = create_engine(
@@ -36,11 +53,90 @@ def get_db():
         db.close()
 
 
+def warm_pool(connections: int = 5) -> int:
+    """Open pooled connections up front so the first requests skip connection setup."""
+    # StaticPool (in-memory SQLite) has a single connection and no size().
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    opened = []
+    try:
+        for _ in range(max(1, min(connections, size))):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
+
+def ping_db() -> str:
+    """Round trip through the pool; returns the pool status for diagnostics."""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return engine.pool.status()
+
+
 def init_db():
     """Initialize database tables."""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _add_missing_cascades()
+    with engine.begin() as conn:
+        create_search_index(conn)
+
+
+def _add_missing_columns():
+    """Additively upgrade existing tables: add new nullable columns and indexes.
+
+    ``create_all`` only creates missing tables, so databases created by an
+    older release would otherwise lack columns added since.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+def _add_missing_cascades():
+    """Give existing PostgreSQL foreign keys the ``ON DELETE`` rule declared in the models.
+
+    SQLite cannot alter constraints in place; databases created before the
+    rule was declared keep plain foreign keys, which is why bulk deletes
+    remove child rows explicitly.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {fk["name"]: fk for fk in inspector.get_foreign_keys(table.name)}
+            for constraint in table.foreign_key_constraints:
+                if not constraint.ondelete:
+                    continue
+                columns = [c.name for c in constraint.columns]
+                for name, fk in existing.items():
+                    if fk["constrained_columns"] != columns:
+                        continue
+                    if (fk.get("options", {}).get("ondelete") or "").upper() == constraint.ondelete.upper():
+                        continue
+                    referred = constraint.elements[0].column
+                    conn.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{name}"'))
+                    conn.execute(text(
+                        f'ALTER TABLE {table.name} ADD CONSTRAINT "{name}" FOREIGN KEY ({", ".join(columns)}) '
+                        f"REFERENCES {referred.table.name} ({referred.name}) ON DELETE {constraint.ondelete}"
+                    ))
 
 
 def drop_db():
     """Drop all database tables."""
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS messages_fts"))
     Base.metadata.drop_all(bind=engine)
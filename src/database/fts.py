@@ -0,0 +1,70 @@
+"""Full-text index over message contents, maintained by the database on write."""
+import os
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "simple")
+
+# SQLite: FTS5 table using `messages` as external content, so the text is not
+# stored twice. It is keyed by the implicit rowid, which VACUUM may renumber
+# for tables without an INTEGER PRIMARY KEY: run rebuild_search_index() after
+# a VACUUM.
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        user_message, ai_response,
+        content='messages', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, user_message, ai_response)
+        VALUES (new.rowid, new.user_message, new.ai_response);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, user_message, ai_response)
+        VALUES ('delete', old.rowid, old.user_message, old.ai_response);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF user_message, ai_response ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, user_message, ai_response)
+        VALUES ('delete', old.rowid, old.user_message, old.ai_response);
+        INSERT INTO messages_fts(rowid, user_message, ai_response)
+        VALUES (new.rowid, new.user_message, new.ai_response);
+    END
+    """,
+]
+
+
+def postgres_document(language: str = SEARCH_LANGUAGE) -> str:
+    """SQL expression indexed on PostgreSQL; queries must use it verbatim to hit the index."""
+    return f"to_tsvector('{language}', coalesce(user_message, '') || ' ' || coalesce(ai_response, ''))"
+
+
+def create_search_index(conn: Connection):
+    """Create the full-text index for the connected dialect (no-op elsewhere)."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='messages_fts'")
+        ).first()
+        for statement in _SQLITE_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            # Index rows written before the FTS table existed.
+            conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+    elif dialect == "postgresql":
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_messages_fts ON messages USING GIN ({postgres_document()})"
+        ))
+
+
+def rebuild_search_index(conn: Connection):
+    """Rebuild the SQLite index from the messages table (PostgreSQL needs no rebuild)."""
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
@@ -1,5 +1,5 @@
 """SQLAlchemy ORM models for database."""
-from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, Integer, Boolean, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -12,13 +12,23 @@ class Conversation(Base):
     __tablename__ = "conversations"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = Column(String(255), nullable=True)
+    user_id = Column(String(255), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     title = Column(String(255), nullable=True)
+    # Set once the placeholder title was replaced by a generated one.
+    title_generated = Column(Boolean, default=False)
+    # Cold storage: messages moved to an archive blob, this row kept as a stub.
+    archived_at = Column(DateTime, nullable=True)
+    archived_messages = Column(Integer, nullable=True)
+    restored_at = Column(DateTime, nullable=True)
+    # Leaf of the branch shown and extended (see services/branches.py); NULL until the first turn.
+    # No foreign key: messages already reference conversations.
+    active_message_id = Column(String(36), nullable=True)
 
     # Relationships
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    # passive_deletes: the database cascades, so deleting a conversation does not load its messages.
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Conversation(id={self.id}, user_id={self.user_id})>"
@@ -29,14 +39,139 @@ class Message(Base):
     __tablename__ = "messages"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id = Column(String(36), ForeignKey("conversations.id"), nullable=False)
+    conversation_id = Column(String(36), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    # Previous turn on this branch; siblings share a parent (regenerated or edited turns).
+    parent_id = Column(String(36), ForeignKey("messages.id", ondelete="CASCADE"), nullable=True, index=True)
     user_message = Column(Text, nullable=False)
     ai_response = Column(Text, nullable=False)
     tokens_used = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Serves both history loading and per-conversation usage aggregates.
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+    )
+
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
+    embedding = relationship("MessageEmbedding", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Message(id={self.id}, conversation_id={self.conversation_id})>"
+
+
+class MessageEmbedding(Base):
+    """Embedding of a message turn, used for long-term semantic recall."""
+    __tablename__ = "message_embeddings"
+
+    message_id = Column(String(36), ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(String(255), nullable=False)
+    model = Column(String(100), nullable=False)
+    # float32 vector, stored raw (numpy.tobytes)
+    vector = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_message_embeddings_user_model", "user_id", "model"),
+    )
+
+    def __repr__(self):
+        return f"<MessageEmbedding(message_id={self.message_id}, user_id={self.user_id})>"
+
+
+class RetentionPolicy(Base):
+    """Per-user retention period overriding the default ``RETENTION_DAYS``."""
+    __tablename__ = "retention_policies"
+
+    user_id = Column(String(255), primary_key=True)
+    days = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RetentionPolicy(user_id={self.user_id}, days={self.days})>"
+
+
+class UsageEvent(Base):
+    """Append-only ledger of metered provider calls, written in batches."""
+    __tablename__ = "usage_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant_id = Column(String(255), nullable=False)
+    user_id = Column(String(255), nullable=True)
+    # No foreign key: the ledger outlives deleted conversations.
+    conversation_id = Column(String(36), nullable=True)
+    provider = Column(String(50), nullable=True)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_usage_events_tenant_created", "tenant_id", "created_at"),
+        Index("ix_usage_events_user_created", "user_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<UsageEvent(id={self.id}, tenant_id={self.tenant_id}, user_id={self.user_id})>"
+
+
+class UsageRollup(Base):
+    """Usage of one subject (``user:<id>`` or ``tenant:<id>``) per hour or day, added to on every ledger flush."""
+    __tablename__ = "usage_rollups"
+
+    subject = Column(String(300), primary_key=True)
+    granularity = Column(String(8), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    requests = Column(Integer, default=0, nullable=False)
+    prompt_tokens = Column(Integer, default=0, nullable=False)
+    completion_tokens = Column(Integer, default=0, nullable=False)
+    cached_tokens = Column(Integer, default=0, nullable=False)
+    total_tokens = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<UsageRollup(subject={self.subject}, granularity={self.granularity}, bucket={self.bucket})>"
+
+
+class Comparison(Base):
+    """One prompt sent to several providers/models side by side (``/chat/compare``)."""
+    __tablename__ = "comparisons"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String(255), nullable=True, index=True)
+    # No foreign key: comparisons only read a conversation's context and outlive it.
+    conversation_id = Column(String(36), nullable=True)
+    prompt = Column(Text, nullable=False)
+    deadline_ms = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    results = relationship("ComparisonResult", cascade="all, delete-orphan", passive_deletes=True,
+                           order_by="ComparisonResult.position")
+
+    def __repr__(self):
+        return f"<Comparison(id={self.id}, user_id={self.user_id})>"
+
+
+class ComparisonResult(Base):
+    """Output, latency and tokens of one model in a comparison."""
+    __tablename__ = "comparison_results"
+
+    comparison_id = Column(String(36), ForeignKey("comparisons.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    provider = Column(String(50), nullable=False)
+    model = Column(String(255), nullable=True)
+    # ok, error or timeout (cut off at the deadline; output holds what arrived)
+    status = Column(String(16), nullable=False)
+    output = Column(Text, nullable=False, default="")
+    error = Column(Text, nullable=True)
+    ttft_ms = Column(Integer, nullable=True)
+    latency_ms = Column(Integer, nullable=False)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+
+    def __repr__(self):
+        return f"<ComparisonResult(comparison_id={self.comparison_id}, model={self.model}, status={self.status})>"
@@ -3,43 +3,129 @@ Chatbot IA API - Modern FastAPI Backend
 High-performance, scalable and feature-rich chatbot API.
 """
 import os
+import time
+import secrets
 import uuid
+import asyncio
 import logging
-from datetime import datetime
-from typing import List, Optional, Any, Dict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Optional, Any, Dict, Tuple
 from pathlib import Path
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Query, UploadFile, File, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, ORJSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import case, func, select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 import json
 
 # Internal imports
-from src.database import get_db, init_db, Conversation, Message
+from src.database import get_db, init_db, warm_pool, ping_db, engine, Comparison, Conversation, Message, RetentionPolicy
 from src.models.schemas import (
     MessageRequest,
     MessageResponse,
+    EditRequest,
+    BranchRequest,
+    CompareRequest,
+    ComparisonResponse,
     ConversationHistory,
     HealthResponse,
     ErrorResponse,
+    DailyUsage,
+    UsageSummary,
+    QuotaStatus,
+    SearchHit,
+    SearchResponse,
+    RetentionPolicyRequest,
+    DeletionSummary,
 )
-from src.services.ai_service import AIService
+from src.services.ai_service import AIService, TokenUsage
+from src.services.archive import Archiver
+from src.services import branches, bulk
+from src.services.compare import OK, TIMEOUT, ModelComparer, TargetRun, save_comparison
+from src.services.compression import CompressionMiddleware, etag_matches, make_etag
+from src.services.health import DOWN, HealthMonitor
+from src.services.lifecycle import DrainingServer, Lifecycle
+from src.services.logs import RequestIdMiddleware, configure_logging
+from src.services.memory import ConversationMemory
+from src.services.metering import QuotaExceeded, UsageMeter, tenant_subject, user_subject
+from src.services import profiling
+from src.services.profiling import Profiler, SlowRequestMiddleware, instrument_queries
+from src.services import resilience
+from src.services.resilience import ProviderError
+from src.services.retention import RetentionEngine
+from src.services.tasks import TaskQueue
+from src.services.titles import TitleGenerator
+from src.services.tracing import (
+    TracingMiddleware,
+    current_trace_id,
+    install_log_correlation,
+    instrument_engine,
+    setup_tracing,
+    shutdown_tracing,
+    tracer,
+)
+from src.services.search import SearchUnsupported, search_messages
+from src.services.state import StateBackend, create_state_backend
 
 # Load configuration
 load_dotenv()
 
-# Logger setup
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)-8s | %(name)s:%(funcName)s:%(lineno)d - %(message)s",
-)
+# Logger setup: JSON lines written from a background thread; records carry
+# the request's correlation id and trace id
+install_log_correlation()
+configure_logging()
 logger = logging.getLogger("chatbot-ia-api")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and warm up the worker, then drain and release everything on shutdown."""
+    global _retention_task, _health_task, _metering_task
+    setup_tracing()
+    # Failures propagate: a worker that cannot reach its database must not start.
+    init_db()
+    service = get_ai_service()
+    _configure_titles(service)
+    await tasks.start()
+    if retention.interval > 0:
+        _retention_task = asyncio.create_task(retention.run_forever(state_backend))
+
+    warmed = warm_pool(int(os.getenv("DB_WARM_CONNECTIONS", 5)))
+    await service.warmup(float(os.getenv("PROVIDER_WARMUP_TIMEOUT", 5)))
+    health.register("ai_provider", service.provider.ping)
+    await health.probe_all()
+    _health_task = asyncio.create_task(health.run_forever())
+    _metering_task = asyncio.create_task(meter.run_forever())
+    lifecycle.ready = True
+    logger.info("Database and system initialized successfully (%s DB connections warmed).", warmed)
+
+    yield
+
+    lifecycle.begin_drain()
+    await lifecycle.wait_for_streams()
+    for task in (_retention_task, _health_task, _metering_task):
+        if task is not None:
+            task.cancel()
+    try:
+        await asyncio.to_thread(meter.flush)
+    except Exception as e:
+        logger.error("Final usage flush failed: %s", e)
+    await tasks.drain(float(os.getenv("TASK_DRAIN_TIMEOUT", 10)))
+    await service.aclose()
+    await comparer.aclose()
+    await state_backend.aclose()
+    engine.dispose()
+    shutdown_tracing()
+    logger.info("Shutdown complete.")
+
 app = FastAPI(
+    lifespan=lifespan,
+    # orjson serializes dicts, datetimes and Pydantic output several times faster than json
+    default_response_class=ORJSONResponse,
     title="Chatbot IA API",
     description="API robusta para chatbots modernos alimentados por IA generativa.",
     version="2.0.0",
@@ -56,50 +142,267 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# AI Service Instance
-ai_service = AIService()
+# gzip/brotli for JSON and text responses (never for Server-Sent Events)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", 1024)))
 
-# Constants
-FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
+# Slow requests are kept with their stack samples and SQL statements
+profiler = Profiler.from_env()
+app.add_middleware(SlowRequestMiddleware, profiler=profiler)
+instrument_queries(engine)
+
+# Tracing: one span per request and per DB statement
+app.add_middleware(TracingMiddleware)
+instrument_engine(engine)
+
+# Correlation ids (X-Request-ID) for every log line of a request
+app.add_middleware(RequestIdMiddleware)
+
+# AI service: built on startup, so importing the app loads no provider SDK
+ai_service: Optional[AIService] = None
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize system on startup."""
+
+def get_ai_service() -> AIService:
+    """The configured AI service; created on first use if startup has not run."""
+    global ai_service
+    if ai_service is None:
+        ai_service = AIService()
+    return ai_service
+
+# Side-by-side runs of one prompt on several providers/models (/chat/compare)
+comparer = ModelComparer.from_env()
+
+# Readiness and graceful drain of in-flight streams
+lifecycle = Lifecycle(drain_timeout=float(os.getenv("STREAM_DRAIN_TIMEOUT", 25)))
+
+# Shared state: in-process by default, Redis when running several workers/nodes
+state_backend = create_state_backend()
+
+
+def get_state() -> StateBackend:
+    """Dependency for the shared state backend."""
+    return state_backend
+
+# Usage ledger, rollups and quotas per user and tenant (X-Tenant-ID)
+meter = UsageMeter.from_env(state_backend)
+_metering_task: Optional[asyncio.Task] = None
+
+
+async def _admit(tenant_id: Optional[str], user_id: Optional[str], requests: int = 1):
+    """Enforce quotas before any provider call: 429 with Retry-After when over."""
     try:
-        init_db()
-        logger.info("Database and system initialized successfully.")
-    except Exception as e:
-        logger.critical(f"System startup failed: {e}")
+        await meter.admit(tenant_id, user_id, requests)
+    except QuotaExceeded as e:
+        logger.info("Rejected request of %s: %s", e.subject, e)
+        raise HTTPException(status_code=429, detail=e.to_detail(), headers={"Retry-After": str(e.retry_after)})
+
+# Cold conversations live in compressed blobs until opened again
+archiver = Archiver.from_env()
+
+# Retention policies and bulk deletes
+retention = RetentionEngine.from_env(archiver)
+_retention_task: Optional[asyncio.Task] = None
+
+# Dependency health: probed in the background, endpoints read the cached results
+health = HealthMonitor.from_env()
+health.register("database", ping_db)
+health.register("state", state_backend.ping)
+_health_task: Optional[asyncio.Task] = None
+
+# Background post-processing (embeddings, enrichment) off the request path
+tasks = TaskQueue.from_env()
+
+# Long-term memory: recent turns plus semantically recalled past turns
+memory = ConversationMemory.from_env()
+if memory is not None:
+    tasks.register(
+        "memory.index",
+        lambda items: memory.index_messages(items, run_cpu=tasks.run_cpu),
+        batch_size=int(os.getenv("MEMORY_BATCH_SIZE", 64)),
+        max_wait=float(os.getenv("MEMORY_BATCH_WAIT", 0.2)),
+    )
+
+# Generated conversation titles, pushed to clients through the state backend
+TITLE_CHANNEL = "conversation-titles"
+titles: Optional[TitleGenerator] = None
+
+
+async def _title_batch(items: List[Tuple[str, str, str]]):
+    for update in await titles.title_conversations(items):
+        await state_backend.publish(TITLE_CHANNEL, json.dumps(update))
+
+
+def _configure_titles(service: AIService):
+    global titles
+    titles = TitleGenerator.from_env(service, meter)
+    if titles is not None:
+        tasks.register(
+            "titles.generate",
+            _title_batch,
+            batch_size=int(os.getenv("TITLE_BATCH_SIZE", 20)),
+            max_wait=float(os.getenv("TITLE_BATCH_WAIT", 5)),
+        )
+
+
+async def _load_context(db: Session, leaf_id: Optional[str], user_id: Optional[str], prompt: str) -> List[Tuple[str, str]]:
+    """History sent to the model: the branch ending at ``leaf_id``, whole when memory is disabled."""
+    if memory is not None:
+        return await memory.branch_context(db, leaf_id, user_id, prompt)
+    return [tuple(turn) for turn in branches.path_to(db, leaf_id, (Message.user_message, Message.ai_response))]
+
+
+def _owner(conversation: Optional[Conversation], user_id: Optional[str]) -> Optional[str]:
+    """Whose memory a turn recalls: the conversation's owner, the requester only for a new conversation."""
+    return conversation.user_id if conversation is not None else user_id
+
+
+def _remember(message: Message, user_id: Optional[str]):
+    """Queue a persisted turn for embedding so the response is not delayed."""
+    if memory is None or not user_id:
+        return
+    tasks.submit("memory.index", (message.id, user_id, message.user_message, message.ai_response))
+
+
+def _remember_restored(user_id: Optional[str], rows: List[Dict[str, Any]]):
+    """Queue turns restored from the archive, whose embeddings were dropped when archiving."""
+    if memory is None or not user_id:
+        return
+    for row in rows:
+        tasks.submit("memory.index", (row["id"], user_id, row["user_message"], row["ai_response"]))
+
+
+archiver.on_restore = _remember_restored
+
+
+def _request_title(message: Message):
+    """Queue a new conversation's first exchange for title generation."""
+    if titles is not None:
+        tasks.submit("titles.generate", (message.conversation_id, message.user_message, message.ai_response))
+
+# Constants
+FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
 
 @app.get("/health", response_model=HealthResponse, tags=["System"])
-async def health_check(db: Session = Depends(get_db)):
-    """Comprehensive health check for API and dependencies."""
-    db_ok = True
-    try:
-        db.execute("SELECT 1")
-    except:
-        db_ok = False
-        
+async def health_check():
+    """Liveness probe with the cached status of every dependency."""
+    dependencies = health.snapshot()
     return HealthResponse(
-        status="active",
+        status=health.status,
         version="2.0.0",
         timestamp=datetime.utcnow(),
-        database_connected=db_ok,
-        ai_model_ready=True, # Assuming service init didn't fail
+        database_connected=dependencies["database"]["status"] != DOWN,
+        ai_model_ready=dependencies.get("ai_provider", {}).get("status", DOWN) != DOWN,
+        dependencies=dependencies,
     )
 
+@app.get("/ready", tags=["System"])
+async def readiness_check():
+    """Readiness probe: 503 until warmed up, while a critical dependency is down and once draining."""
+    ready = lifecycle.ready and health.ready
+    body = {**lifecycle.stats(), "ready": ready, "dependencies": health.snapshot()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/providers/stats", tags=["System"])
+async def provider_stats():
+    """Circuit breaker state per provider and retry budget usage."""
+    return resilience.stats()
+
+@app.get("/routing/stats", tags=["System"])
+async def routing_stats():
+    """Per-route request counts, latency and token usage of the model router."""
+    return get_ai_service().router.stats()
+
+@app.get("/rag/stats", tags=["System"])
+async def rag_stats():
+    """Retrieval index status and latency metrics."""
+    retriever = get_ai_service().retriever
+    if retriever is None:
+        return {"enabled": False}
+    return {"enabled": True, **retriever.stats()}
+
+@app.get("/memory/stats", tags=["System"])
+async def memory_stats():
+    """Long-term memory configuration and counters."""
+    if memory is None:
+        return {"enabled": False}
+    return {"enabled": True, **memory.stats()}
+
+@app.get("/metering/stats", tags=["System"])
+async def metering_stats():
+    """Ledger buffer, flush and quota rejection counters of this worker."""
+    return meter.stats()
+
+@app.get("/compare/stats", tags=["System"])
+async def compare_stats():
+    """Comparison targets, deadline and counters of this worker."""
+    return comparer.stats()
+
+@app.get("/tasks/stats", tags=["System"])
+async def task_stats():
+    """Background queue depth, throughput and failure counters."""
+    return tasks.stats()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency for admin endpoints: ``X-Admin-Token`` must match ``ADMIN_TOKEN``."""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
+
+
+def _flamegraph(folded: Dict[str, int], fmt: str):
+    if fmt == "collapsed":
+        return PlainTextResponse(profiling.to_collapsed(folded))
+    return profiling.to_tree(folded)
+
+@app.get("/admin/profile", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def profile_worker(
+    seconds: float = Query(5, gt=0, le=60),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    idle: bool = False,
+):
+    """Sample this worker's threads for ``seconds`` and return a flamegraph (d3 JSON or collapsed stacks)."""
+    stacks = await profiler.sampler.profile(seconds, include_idle=idle)
+    return _flamegraph(profiling.fold(stacks), format)
+
+@app.get("/admin/slow-requests", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def list_slow_requests():
+    """Requests slower than SLOW_REQUEST_MS captured by this worker, newest first."""
+    return {**profiler.stats(), "requests": profiler.slow_requests()}
+
+@app.get("/admin/slow-requests/{capture_id}", tags=["Admin"], dependencies=[Depends(require_admin)])
+async def get_slow_request(capture_id: str, format: str = Query("json", pattern="^(json|collapsed)$")):
+    """A captured request with its SQL statements and profile; ``format=collapsed`` returns only the stacks."""
+    entry = profiler.slow_request(capture_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    if format == "collapsed":
+        return _flamegraph(entry["stacks"], format)
+    detail = {key: value for key, value in entry.items() if key != "stacks"}
+    return {**detail, "flamegraph": profiling.to_tree(entry["stacks"])}
+
+def _provider_http_error(e: ProviderError) -> HTTPException:
+    headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+
 @app.post("/chat", response_model=MessageResponse, tags=["Chat"])
 async def chat_interaction(
     request: MessageRequest,
     db: Session = Depends(get_db),
+    x_tenant_id: Optional[str] = Header(None),
 ):
     """Process a chat interaction (Standard JSON response)."""
+    if lifecycle.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "1"})
+    await _admit(x_tenant_id, request.user_id)
     try:
         conversation_id = request.conversation_id or str(uuid.uuid4())
         
         # Get or create conversation
         conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-        if not conversation:
+        is_new = conversation is None
+        if is_new:
             conversation = Conversation(
                 id=conversation_id,
                 user_id=request.user_id,
@@ -107,25 +410,41 @@ async def chat_interaction(
             )
             db.add(conversation)
             db.commit()
+        else:
+            archiver.ensure_restored(db, conversation)
+        parent_id = branches.active_leaf(db, conversation)
 
         # Fetch context
-        history = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at).all()
-        context = [(m.user_message, m.ai_response) for m in history]
+        with tracer.start_as_current_span("chat.context"):
+            context = await _load_context(db, parent_id, conversation.user_id, request.content)
 
         # Generate response
-        response_text, tokens = await ai_service.generate_response(request.content, context)
+        usage = TokenUsage()
+        response_text, tokens = await get_ai_service().generate_response(request.content, context, usage=usage)
 
         # Persistence
-        new_message = Message(
-            id=str(uuid.uuid4()),
-            conversation_id=conversation_id,
-            user_message=request.content,
-            ai_response=response_text,
-            tokens_used=tokens,
-        )
-        db.add(new_message)
-        db.commit()
-        db.refresh(new_message)
+        with tracer.start_as_current_span("chat.persist"):
+            new_message = Message(
+                id=str(uuid.uuid4()),
+                conversation_id=conversation_id,
+                parent_id=parent_id,
+                user_message=request.content,
+                ai_response=response_text,
+                tokens_used=tokens,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                cached_tokens=usage.cached_tokens,
+            )
+            db.add(new_message)
+            conversation.active_message_id = new_message.id
+            # Moves the conversation up the list and invalidates cached copies (ETag).
+            conversation.updated_at = datetime.utcnow()
+            db.commit()
+            db.refresh(new_message)
+        await meter.record(x_tenant_id, request.user_id, conversation_id, get_ai_service().provider_name, usage)
+        _remember(new_message, conversation.user_id)
+        if is_new:
+            _request_title(new_message)
 
         return MessageResponse(
             id=new_message.id,
@@ -134,119 +453,589 @@ async def chat_interaction(
             ai_response=response_text,
             timestamp=new_message.created_at,
             tokens_used=tokens,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            cached_tokens=usage.cached_tokens,
+            parent_id=parent_id,
         )
 
+    except ProviderError as e:
+        logger.error("Chat provider error (%s): %s", e.kind, e)
+        raise _provider_http_error(e)
     except Exception as e:
-        logger.error(f"Chat processing error: {e}")
+        logger.error("Chat processing error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/chat/stream", tags=["Chat"])
 async def chat_stream(
     request: MessageRequest,
     db: Session = Depends(get_db),
+    x_tenant_id: Optional[str] = Header(None),
 ):
     """Process a chat interaction with Server-Sent Events (SSE) streaming."""
+    if lifecycle.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "1"})
+    # Before the response starts, so a rejection is a real 429.
+    await _admit(x_tenant_id, request.user_id)
+
     async def event_generator():
-        conversation_id = request.conversation_id or str(uuid.uuid4())
+        async with lifecycle.track_stream():
+            conversation_id = request.conversation_id or str(uuid.uuid4())
         
-        # Immediate CID feedback
-        yield f"data: {json.dumps({'type': 'setup', 'conversation_id': conversation_id})}\n\n"
+            # Immediate CID feedback
+            yield f"data: {json.dumps({'type': 'setup', 'conversation_id': conversation_id, 'trace_id': current_trace_id()})}\n\n"
 
-        # Context fetch (sync but handled by FastAPI threadpool)
-        history = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at).all()
-        context = [(m.user_message, m.ai_response) for m in history]
+            # Context fetch (sync but handled by FastAPI threadpool)
+            with tracer.start_as_current_span("chat.context"):
+                conversation = db.get(Conversation, conversation_id)
+                archiver.ensure_restored(db, conversation)
+                parent_id = branches.active_leaf(db, conversation)
+                context = await _load_context(db, parent_id, _owner(conversation, request.user_id), request.content)
+            logger.debug("Context for %s: %d turns", conversation_id, len(context))
 
-        full_response_parts = []
-        async for chunk in ai_service.stream_response(request.content, context):
-            full_response_parts.append(chunk)
-            yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
+            full_response_parts = []
+            usage = TokenUsage()
+            interrupted = False
+            stream = get_ai_service().stream_response(request.content, context, usage=usage)
+            try:
+                async for chunk in stream:
+                    full_response_parts.append(chunk)
+                    yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
+                    # Out of drain time: keep what was generated rather than being cut off.
+                    if lifecycle.deadline_passed:
+                        interrupted = True
+                        break
+            except ProviderError as e:
+                # Nothing is saved: an error is not an answer, and the client can resend.
+                logger.error("Chat stream provider error (%s): %s", e.kind, e)
+                yield f"data: {json.dumps(e.to_event())}\n\n"
+                return
+            finally:
+                await stream.aclose()
 
-        full_response = "".join(full_response_parts)
+            full_response = "".join(full_response_parts)
+            logger.debug("Streamed %d chunks (%d tokens) for %s", len(full_response_parts), usage.total_tokens, conversation_id)
         
-        # Save to DB (Synchronous)
-        try:
-            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-            if not conversation:
-                conversation = Conversation(
-                    id=conversation_id,
-                    user_id=request.user_id,
-                    title=request.content[:50],
-                )
-                db.add(conversation)
-            
-            msg = Message(
-                id=str(uuid.uuid4()),
-                conversation_id=conversation_id,
-                user_message=request.content,
-                ai_response=full_response,
-                tokens_used=0, # Estimated or fixed
-            )
-            db.add(msg)
-            db.commit()
-            yield f"data: {json.dumps({'type': 'done', 'message_id': msg.id})}\n\n"
-        except Exception as e:
-            logger.error(f"Error saving streamed response: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'content': 'Failed to save message'})}\n\n"
+            # Save to DB (Synchronous)
+            try:
+                with tracer.start_as_current_span("chat.persist"):
+                    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+                    is_new = conversation is None
+                    if is_new:
+                        conversation = Conversation(
+                            id=conversation_id,
+                            user_id=request.user_id,
+                            title=request.content[:50],
+                        )
+                        db.add(conversation)
+
+                    msg = Message(
+                        id=str(uuid.uuid4()),
+                        conversation_id=conversation_id,
+                        parent_id=parent_id,
+                        user_message=request.content,
+                        ai_response=full_response,
+                        tokens_used=usage.total_tokens,
+                        prompt_tokens=usage.prompt_tokens,
+                        completion_tokens=usage.completion_tokens,
+                        cached_tokens=usage.cached_tokens,
+                    )
+                    db.add(msg)
+                    conversation.active_message_id = msg.id
+                    conversation.updated_at = datetime.utcnow()
+                    db.commit()
+                await meter.record(x_tenant_id, request.user_id, conversation_id, get_ai_service().provider_name, usage)
+                _remember(msg, conversation.user_id)
+                if is_new:
+                    _request_title(msg)
+            except Exception as e:
+                logger.error("Error saving streamed response: %s", e)
+                yield f"data: {json.dumps({'type': 'error', 'content': 'Failed to save message'})}\n\n"
+                return
+            yield f"data: {json.dumps({'type': 'done', 'message_id': msg.id, 'tokens_used': usage.total_tokens, 'interrupted': interrupted})}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+@app.post("/chat/compare", tags=["Chat"])
+async def chat_compare(
+    request: CompareRequest,
+    db: Session = Depends(get_db),
+    x_tenant_id: Optional[str] = Header(None),
+):
+    """Send one message to several providers/models concurrently (SSE chunks tagged by model).
+
+    Nothing is added to the conversation; outputs, latencies and tokens are
+    stored as a comparison. Targets still running at the deadline are cut off.
+    """
+    if lifecycle.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "1"})
+    try:
+        targets = comparer.resolve(request.targets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    deadline = min(request.deadline or comparer.deadline, comparer.deadline)
+    # Every target is a provider call of its own.
+    await _admit(x_tenant_id, request.user_id, len(targets))
+
+    async def event_generator():
+        async with lifecycle.track_stream():
+            comparison_id = str(uuid.uuid4())
+            runs = [TargetRun(target) for target in targets]
+            setup = {
+                "type": "setup",
+                "comparison_id": comparison_id,
+                "models": [run.label for run in runs],
+                "deadline": deadline,
+                "trace_id": current_trace_id(),
+            }
+            yield f"data: {json.dumps(setup)}\n\n"
+
+            # Same context and documents for every target.
+            with tracer.start_as_current_span("chat.context"):
+                conversation = db.get(Conversation, request.conversation_id) if request.conversation_id else None
+                archiver.ensure_restored(db, conversation)
+                owner = _owner(conversation, request.user_id)
+                context = await _load_context(db, branches.active_leaf(db, conversation), owner, request.content)
+                documents = await get_ai_service().retrieve(request.content)
+
+            async for event in comparer.compare(request.content, context, runs, deadline, documents):
+                yield f"data: {json.dumps(event)}\n\n"
+
+            conversation_id = conversation.id if conversation is not None else None
+            try:
+                with tracer.start_as_current_span("chat.persist"):
+                    save_comparison(db, comparison_id, request.content, runs, deadline, request.user_id, conversation_id)
+                for run in runs:
+                    if run.usage.total_tokens:
+                        await meter.record(x_tenant_id, request.user_id, conversation_id, run.target.provider, run.usage)
+            except Exception as e:
+                logger.error("Error saving comparison %s: %s", comparison_id, e)
+                yield f"data: {json.dumps({'type': 'error', 'content': 'Failed to save comparison'})}\n\n"
+                return
+            done = {
+                "type": "done",
+                "comparison_id": comparison_id,
+                "completed": [run.label for run in runs if run.status == OK],
+                "timed_out": [run.label for run in runs if run.status == TIMEOUT],
+            }
+            yield f"data: {json.dumps(done)}\n\n"
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+@app.get("/comparisons/{comparison_id}", response_model=ComparisonResponse, tags=["Chat"])
+async def get_comparison(comparison_id: str, db: Session = Depends(get_db)):
+    """Stored outputs, latencies and tokens of a comparison."""
+    comparison = db.get(Comparison, comparison_id)
+    if comparison is None:
+        raise HTTPException(status_code=404, detail="Comparison not found")
+    return ComparisonResponse.model_validate(comparison, from_attributes=True)
+
 # Conversation Management
+def _message_count():
+    """Correlated count of a conversation's messages, for column queries on ``Conversation``."""
+    return (
+        select(func.count(Message.id)).where(Message.conversation_id == Conversation.id).scalar_subquery()
+    )
+
+
+# Same fields as MessageResponse, selected as columns instead of ORM objects.
+_MESSAGE_COLUMNS = (
+    Message.id,
+    Message.conversation_id,
+    Message.user_message,
+    Message.ai_response,
+    Message.created_at.label("timestamp"),
+    func.coalesce(Message.tokens_used, 0).label("tokens_used"),
+    func.coalesce(Message.prompt_tokens, 0).label("prompt_tokens"),
+    func.coalesce(Message.completion_tokens, 0).label("completion_tokens"),
+    func.coalesce(Message.cached_tokens, 0).label("cached_tokens"),
+    Message.parent_id,
+)
+
+
+def history_payload(db: Session, conv: Conversation) -> Dict[str, Any]:
+    """``ConversationHistory`` of the active branch as a dict, with messages projected straight from rows."""
+    rows = branches.path_to(db, branches.active_leaf(db, conv), _MESSAGE_COLUMNS)
+    messages = []
+    if rows:
+        # zip with the keys once: building RowMappings costs more than the query itself.
+        keys = rows[0]._fields + ("siblings",)
+        counts = branches.sibling_counts(db, conv.id)
+        messages = [dict(zip(keys, (*row, counts[row[-1]]))) for row in rows]
+    return {
+        "conversation_id": conv.id,
+        "user_id": conv.user_id,
+        "messages": messages,
+        "created_at": conv.created_at,
+        "updated_at": conv.updated_at,
+        "total_messages": len(messages),
+    }
+
+
+# Read endpoints are revalidated on every use and answered with 304 while unchanged
+CACHE_CONTROL = "private, no-cache"
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
 @app.get("/conversations", tags=["Conversations"])
-async def get_conversations(user_id: Optional[str] = None, db: Session = Depends(get_db)):
+async def get_conversations(
+    response: Response,
+    user_id: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
     """List conversations for a user."""
-    query = db.query(Conversation)
+    # New conversations, messages (which bump updated_at), deletions,
+    # generated titles (which keep updated_at) and messages imported into an
+    # existing conversation (counted, as in the listing) all change this fingerprint.
+    stamp = db.query(
+        func.count(Conversation.id),
+        func.max(Conversation.updated_at),
+        func.sum(case((Conversation.title_generated.is_(True), 1), else_=0)),
+        func.sum(func.coalesce(Conversation.archived_messages, _message_count())),
+    )
+    if user_id:
+        stamp = stamp.filter(Conversation.user_id == user_id)
+    etag = make_etag("conversations", user_id or "", *stamp.one())
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+    # Column projection with a per-row count: no ORM objects, no lazy loads of messages.
+    query = db.query(
+        Conversation.id,
+        Conversation.title,
+        Conversation.created_at,
+        Conversation.updated_at,
+        func.coalesce(Conversation.archived_messages, _message_count()).label("messages_count"),
+    )
     if user_id:
         query = query.filter(Conversation.user_id == user_id)
-    
-    conversations = query.order_by(Conversation.updated_at.desc()).all()
-    return {
-        "conversations": [
-            {
-                "id": c.id,
-                "title": c.title,
-                "created_at": c.created_at,
-                "updated_at": c.updated_at,
-                "messages_count": len(c.messages)
-            } for c in conversations
-        ]
-    }
+    rows = query.order_by(Conversation.updated_at.desc()).all()
+    return {"conversations": [row._asdict() for row in rows]}
+
+@app.get("/conversations/events", tags=["Conversations"])
+async def conversation_events(user_id: Optional[str] = None, state: StateBackend = Depends(get_state)):
+    """Server-Sent Events with generated titles as they become available."""
+    if lifecycle.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "1"})
+
+    async def event_generator():
+        # Ends when draining begins, so subscribers reconnect elsewhere instead of holding up shutdown.
+        async with lifecycle.track_stream():
+            async for message in lifecycle.until_drain(state.subscribe(TITLE_CHANNEL)):
+                update = json.loads(message)
+                if user_id and update["user_id"] != user_id:
+                    continue
+                yield f"data: {json.dumps({'type': 'title', **update})}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 @app.get("/conversation/{conversation_id}", response_model=ConversationHistory, tags=["Conversations"])
-async def get_conversation_history(conversation_id: str, db: Session = Depends(get_db)):
+async def get_conversation_history(
+    conversation_id: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
     """Retrieve full history of a conversation."""
-    conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-    if not conv:
+    # The message count covers rows imported into an existing conversation
+    # without touching it; archived stubs use the archived count so a restore
+    # keeps the ETag. Switching branches only moves the active pointer.
+    stamp = (
+        db.query(
+            Conversation.updated_at,
+            Conversation.active_message_id,
+            Conversation.archived_at,
+            Conversation.archived_messages,
+            _message_count(),
+        )
+        .filter(Conversation.id == conversation_id)
+        .first()
+    )
+    if not stamp:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    return ConversationHistory(
-        conversation_id=conv.id,
-        user_id=conv.user_id,
-        messages=[
-            MessageResponse(
-                id=m.id,
-                conversation_id=m.conversation_id,
-                user_message=m.user_message,
-                ai_response=m.ai_response,
-                timestamp=m.created_at,
-                tokens_used=m.tokens_used
-            ) for m in conv.messages
-        ],
-        created_at=conv.created_at,
-        updated_at=conv.updated_at,
-        total_messages=len(conv.messages)
+    updated_at, active_message_id, archived_at, archived_messages, live_messages = stamp
+    etag = make_etag(
+        "conversation", conversation_id, updated_at, active_message_id, archived_messages if archived_at else live_messages
+    )
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+
+    conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    archiver.ensure_restored(db, conv)
+    # Built as plain dicts and returned directly: FastAPI skips validating and
+    # re-serializing the response model, which dominated long histories.
+    return ORJSONResponse(
+        history_payload(db, conv),
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
     )
 
+# Branches: regenerated and edited turns are siblings; the conversation shows one path
+def _turn_response(turn: Message, siblings: int) -> MessageResponse:
+    return MessageResponse(
+        id=turn.id,
+        conversation_id=turn.conversation_id,
+        user_message=turn.user_message,
+        ai_response=turn.ai_response,
+        timestamp=turn.created_at,
+        tokens_used=turn.tokens_used or 0,
+        prompt_tokens=turn.prompt_tokens or 0,
+        completion_tokens=turn.completion_tokens or 0,
+        cached_tokens=turn.cached_tokens or 0,
+        parent_id=turn.parent_id,
+        siblings=siblings,
+    )
+
+
+def _get_turn(db: Session, conversation_id: str, message_id: str) -> Tuple[Conversation, Message]:
+    conv = db.get(Conversation, conversation_id)
+    if conv is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    archiver.ensure_restored(db, conv)
+    # Legacy turns are linked first, so a new sibling gets the right parent.
+    branches.active_leaf(db, conv)
+    message = db.get(Message, message_id)
+    if message is None or message.conversation_id != conversation_id:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return conv, message
+
+
+async def _branch_turn(
+    db: Session, conv: Conversation, message: Message, content: str, tenant_id: Optional[str]
+) -> MessageResponse:
+    """Answer ``content`` from the parent of ``message``; the new sibling becomes the active branch."""
+    if lifecycle.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "1"})
+    await _admit(tenant_id, conv.user_id)
+    try:
+        with tracer.start_as_current_span("chat.context"):
+            context = await _load_context(db, message.parent_id, conv.user_id, content)
+        usage = TokenUsage()
+        response_text, tokens = await get_ai_service().generate_response(content, context, usage=usage)
+    except ProviderError as e:
+        logger.error("Regenerate provider error (%s): %s", e.kind, e)
+        raise _provider_http_error(e)
+
+    with tracer.start_as_current_span("chat.persist"):
+        turn = Message(
+            id=str(uuid.uuid4()),
+            conversation_id=conv.id,
+            parent_id=message.parent_id,
+            user_message=content,
+            ai_response=response_text,
+            tokens_used=tokens,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            cached_tokens=usage.cached_tokens,
+        )
+        db.add(turn)
+        conv.active_message_id = turn.id
+        conv.updated_at = datetime.utcnow()
+        db.commit()
+        db.refresh(turn)
+    await meter.record(tenant_id, conv.user_id, conv.id, get_ai_service().provider_name, usage)
+    _remember(turn, conv.user_id)
+    return _turn_response(turn, len(branches.siblings(db, turn)))
+
+
+@app.post("/conversation/{conversation_id}/messages/{message_id}/regenerate", response_model=MessageResponse, tags=["Branches"])
+async def regenerate_turn(
+    conversation_id: str,
+    message_id: str,
+    db: Session = Depends(get_db),
+    x_tenant_id: Optional[str] = Header(None),
+):
+    """Answer a turn's user message again, on a new branch."""
+    conv, message = _get_turn(db, conversation_id, message_id)
+    return await _branch_turn(db, conv, message, message.user_message, x_tenant_id)
+
+
+@app.post("/conversation/{conversation_id}/messages/{message_id}/edit", response_model=MessageResponse, tags=["Branches"])
+async def edit_turn(
+    conversation_id: str,
+    message_id: str,
+    request: EditRequest,
+    db: Session = Depends(get_db),
+    x_tenant_id: Optional[str] = Header(None),
+):
+    """Replace a turn's user message and answer it, on a new branch."""
+    conv, message = _get_turn(db, conversation_id, message_id)
+    return await _branch_turn(db, conv, message, request.content, x_tenant_id)
+
+
+@app.get("/conversation/{conversation_id}/messages/{message_id}/siblings", tags=["Branches"])
+async def turn_siblings(conversation_id: str, message_id: str, db: Session = Depends(get_db)):
+    """Alternatives for a turn, oldest first (itself included)."""
+    _, message = _get_turn(db, conversation_id, message_id)
+    alternatives = branches.siblings(db, message)
+    return {"siblings": [_turn_response(m, len(alternatives)) for m in alternatives]}
+
+
+@app.put("/conversation/{conversation_id}/branch", tags=["Branches"])
+async def switch_branch(conversation_id: str, request: BranchRequest, db: Session = Depends(get_db)):
+    """Show the branch through a turn, continuing down its newest replies."""
+    conv, message = _get_turn(db, conversation_id, request.message_id)
+    leaf_id = branches.select_branch(db, conv, message.id)
+    return {"conversation_id": conversation_id, "active_message_id": leaf_id}
+
+
 @app.delete("/conversation/{conversation_id}", tags=["Conversations"])
 async def delete_conversation(conversation_id: str, db: Session = Depends(get_db)):
-    """Hard delete of a conversation."""
-    conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-    if not conv:
+    """Hard delete of a conversation (set-based; messages are not loaded)."""
+    if retention.delete_conversations(db, [conversation_id])["conversations"] == 0:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    db.delete(conv)
-    db.commit()
     return {"status": "success", "message": "Conversation deleted"}
 
+EXPORT_MEDIA_TYPES = {"ndjson": "application/zstd", "parquet": "application/vnd.apache.parquet"}
+EXPORT_SUFFIXES = {"ndjson": "ndjson.zst", "parquet": "parquet"}
+
+@app.get("/export", tags=["Data"], dependencies=[Depends(require_admin)])
+async def export_conversations(
+    format: str = Query("ndjson", pattern="^(ndjson|parquet)$"),
+    user_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Stream all messages (optionally one user's) as zstd NDJSON or Parquet."""
+    if format == "parquet" and not bulk.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    return StreamingResponse(
+        bulk.stream_export(db, format, user_id, archiver=archiver),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="conversations.{EXPORT_SUFFIXES[format]}"'},
+    )
+
+@app.post("/import", tags=["Data"], dependencies=[Depends(require_admin)])
+def import_conversations(
+    file: UploadFile = File(...),
+    format: str = Query("ndjson", pattern="^(ndjson|parquet)$"),
+):
+    """Bulk import an export file; rows whose ids already exist are skipped."""
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            rows = bulk.import_from_file(conn, file.file, format)
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    elapsed = time.perf_counter() - start
+    return {"rows": rows, "seconds": round(elapsed, 3), "rows_per_second": round(rows / max(elapsed, 1e-9))}
+
+@app.get("/search", response_model=SearchResponse, tags=["Conversations"])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    user_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """Full-text search over messages, ranked by relevance."""
+    start = time.perf_counter()
+    try:
+        hits = search_messages(db, q, user_id=user_id, limit=limit, offset=offset)
+    except SearchUnsupported as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return SearchResponse(
+        query=q,
+        results=[SearchHit(**hit) for hit in hits],
+        limit=limit,
+        offset=offset,
+        took_ms=round((time.perf_counter() - start) * 1000, 3),
+    )
+
+# Usage
+@app.delete(
+    "/users/{user_id}/data", response_model=DeletionSummary, tags=["Retention"], dependencies=[Depends(require_admin)]
+)
+def erase_user_data(user_id: str, db: Session = Depends(get_db)):
+    """Delete every conversation, message and embedding of a user, in small batches."""
+    counts = retention.erase_user(db, user_id)
+    if memory is not None:
+        memory.forget(user_id)
+    return DeletionSummary(**counts)
+
+@app.put("/users/{user_id}/retention", tags=["Retention"], dependencies=[Depends(require_admin)])
+async def set_retention_policy(user_id: str, policy: RetentionPolicyRequest, db: Session = Depends(get_db)):
+    """Keep this user's conversations for ``days`` days after their last update."""
+    db.merge(RetentionPolicy(user_id=user_id, days=policy.days))
+    db.commit()
+    return {"user_id": user_id, "days": policy.days}
+
+@app.delete("/users/{user_id}/retention", tags=["Retention"], dependencies=[Depends(require_admin)])
+async def delete_retention_policy(user_id: str, db: Session = Depends(get_db)):
+    """Fall back to the default retention period."""
+    db.query(RetentionPolicy).filter(RetentionPolicy.user_id == user_id).delete(synchronize_session=False)
+    db.commit()
+    return {"user_id": user_id, "days": retention.default_days or None}
+
+@app.get("/retention/stats", tags=["Retention"])
+async def retention_stats():
+    """Rows purged by retention runs and erasures, with throughput."""
+    return retention.stats()
+
+def _usage_summary(db: Session, subject: str, days: int, granularity: str, **ids) -> UsageSummary:
+    """Totals and breakdown of ``subject`` from the usage rollups (no scan of ``messages``)."""
+    buckets = meter.usage(db, subject, datetime.utcnow() - timedelta(days=days), granularity)
+    label = "%Y-%m-%d" if granularity == "day" else "%Y-%m-%dT%H:00"
+    totals = {name: sum(bucket[name] for bucket in buckets) for name in ("requests", "prompt_tokens", "completion_tokens", "cached_tokens", "total_tokens")}
+    return UsageSummary(
+        **ids,
+        messages=totals["requests"],
+        prompt_tokens=totals["prompt_tokens"],
+        completion_tokens=totals["completion_tokens"],
+        cached_tokens=totals["cached_tokens"],
+        total_tokens=totals["total_tokens"],
+        daily=[
+            DailyUsage(
+                date=bucket["bucket"].strftime(label),
+                messages=bucket["requests"],
+                prompt_tokens=bucket["prompt_tokens"],
+                completion_tokens=bucket["completion_tokens"],
+                cached_tokens=bucket["cached_tokens"],
+                total_tokens=bucket["total_tokens"],
+            ) for bucket in buckets
+        ],
+    )
+
+@app.get("/users/{user_id}/usage", response_model=UsageSummary, tags=["Usage"])
+async def get_user_usage(
+    user_id: str,
+    days: int = Query(30, ge=1, le=365),
+    granularity: str = Query("day", pattern="^(day|hour)$"),
+    db: Session = Depends(get_db),
+):
+    """Usage of a user over the last ``days`` days, from the hourly/daily rollups."""
+    since = datetime.utcnow() - timedelta(days=days)
+    conversations = (
+        db.query(func.count(Conversation.id))
+        .filter(Conversation.user_id == user_id, Conversation.updated_at >= since)
+        .scalar()
+    )
+    summary = _usage_summary(db, user_subject(user_id), days, granularity, user_id=user_id)
+    summary.conversations = conversations
+    return summary
+
+@app.get("/tenants/{tenant_id}/usage", response_model=UsageSummary, tags=["Usage"])
+async def get_tenant_usage(
+    tenant_id: str,
+    days: int = Query(30, ge=1, le=365),
+    granularity: str = Query("day", pattern="^(day|hour)$"),
+    db: Session = Depends(get_db),
+):
+    """Usage of a tenant over the last ``days`` days, from the hourly/daily rollups."""
+    return _usage_summary(db, tenant_subject(tenant_id), days, granularity, tenant_id=tenant_id)
+
+@app.get("/users/{user_id}/quota", response_model=QuotaStatus, tags=["Usage"])
+async def get_user_quota(user_id: str, x_tenant_id: Optional[str] = Header(None)):
+    """Current use of every quota that applies to the user and their tenant."""
+    return QuotaStatus(
+        user_id=user_id,
+        tenant_id=meter.tenant(x_tenant_id),
+        quotas=await meter.quota_status(x_tenant_id, user_id),
+    )
+
 # Static Files & Frontend
 @app.get("/", tags=["UI"])
 async def serve_index():
@@ -257,9 +1046,21 @@ app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(
-        "src.main:app",
+    reload = os.getenv("API_DEBUG", "True").lower() == "true"
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    if workers > 1 and not reload:
+        # Several workers need the shared-state check and draining worker of the gunicorn profile.
+        raise SystemExit(
+            f"WEB_CONCURRENCY={workers}: run several workers with `gunicorn -c gunicorn.conf.py src.main:app`"
+        )
+    options = dict(
         host=os.getenv("API_HOST", "0.0.0.0"),
         port=int(os.getenv("API_PORT", 8000)),
-        reload=os.getenv("API_DEBUG", "True").lower() == "true",
+        # Open streams get this long to finish after SIGTERM.
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", 60)),
     )
+    if reload:
+        # Reload mode only supports a single worker.
+        uvicorn.run("src.main:app", reload=True, **options)
+    else:
+        DrainingServer(uvicorn.Config(app, **options), lifecycle).run()
@@ -2,15 +2,43 @@
 from .schemas import (
     MessageRequest,
     MessageResponse,
+    EditRequest,
+    BranchRequest,
+    CompareRequest,
+    ComparisonResultResponse,
+    ComparisonResponse,
     ConversationHistory,
     ErrorResponse,
     HealthResponse,
+    DependencyHealth,
+    DailyUsage,
+    UsageSummary,
+    QuotaUsage,
+    QuotaStatus,
+    SearchHit,
+    SearchResponse,
+    RetentionPolicyRequest,
+    DeletionSummary,
 )
 
 __all__ = [
     "MessageRequest",
     "MessageResponse",
+    "EditRequest",
+    "BranchRequest",
+    "CompareRequest",
+    "ComparisonResultResponse",
+    "ComparisonResponse",
     "ConversationHistory",
     "ErrorResponse",
     "HealthResponse",
+    "DependencyHealth",
+    "DailyUsage",
+    "UsageSummary",
+    "QuotaUsage",
+    "QuotaStatus",
+    "SearchHit",
+    "SearchResponse",
+    "RetentionPolicyRequest",
+    "DeletionSummary",
 ]
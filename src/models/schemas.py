@@ -1,6 +1,6 @@
 """Pydantic schemas for request/response validation."""
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 
@@ -28,6 +28,11 @@ class MessageResponse(BaseModel):
     ai_response: str = Field(..., description="AI generated response")
     timestamp: datetime = Field(..., description="Message timestamp")
     tokens_used: int = Field(0, description="Tokens used in this interaction")
+    prompt_tokens: int = Field(0, description="Input tokens (system prompt, history and message)")
+    completion_tokens: int = Field(0, description="Output tokens generated by the model")
+    cached_tokens: int = Field(0, description="Prompt tokens served from the provider's prefix cache")
+    parent_id: Optional[str] = Field(None, description="Previous turn on this branch (null for the first turn)")
+    siblings: int = Field(1, description="Alternatives at this turn (regenerated or edited), itself included")
 
     class Config:
         json_schema_extra = {
@@ -37,11 +42,70 @@ class MessageResponse(BaseModel):
                 "user_message": "Hello, how can you help me?",
                 "ai_response": "I can assist you with various tasks. What would you like help with?",
                 "timestamp": "2024-01-15T10:30:00Z",
-                "tokens_used": 45
+                "tokens_used": 45,
+                "prompt_tokens": 30,
+                "completion_tokens": 15,
+                "cached_tokens": 0,
+                "parent_id": None,
+                "siblings": 1
             }
         }
 
 
+class EditRequest(BaseModel):
+    """Schema for editing a turn: its user message is replaced on a new branch."""
+    content: str = Field(..., min_length=1, max_length=2000, description="New user message content")
+
+
+class BranchRequest(BaseModel):
+    """Schema for switching the active branch of a conversation."""
+    message_id: str = Field(..., description="Turn to show; the branch continues down its newest replies")
+
+
+class CompareRequest(MessageRequest):
+    """Schema for sending one message to several providers/models side by side."""
+    targets: Optional[List[str]] = Field(
+        None, description="Targets as provider or provider:model; COMPARE_TARGETS when omitted"
+    )
+    deadline: Optional[float] = Field(
+        None, gt=0, description="Seconds to wait for all targets (capped by COMPARE_DEADLINE)"
+    )
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "content": "Explain eventual consistency in two sentences.",
+                "targets": ["openai:gpt-4o-mini", "anthropic"],
+                "deadline": 20
+            }
+        }
+
+
+class ComparisonResultResponse(BaseModel):
+    """Schema for one target's outcome in a comparison."""
+    provider: str = Field(..., description="Provider name")
+    model: Optional[str] = Field(None, description="Model that answered")
+    status: str = Field(..., description="ok, error or timeout (cut off at the deadline)")
+    output: str = Field("", description="Generated text (partial for timeouts)")
+    error: Optional[str] = Field(None, description="Failure reason")
+    ttft_ms: Optional[int] = Field(None, description="Time to first token")
+    latency_ms: int = Field(..., description="Time until the target finished or was cut off")
+    prompt_tokens: int = Field(0, description="Input tokens")
+    completion_tokens: int = Field(0, description="Output tokens")
+    total_tokens: int = Field(0, description="Input plus output tokens")
+
+
+class ComparisonResponse(BaseModel):
+    """Schema for a stored comparison."""
+    id: str = Field(..., description="Comparison ID")
+    user_id: Optional[str] = Field(None, description="User identifier")
+    conversation_id: Optional[str] = Field(None, description="Conversation whose context was used")
+    prompt: str = Field(..., description="Message sent to every target")
+    deadline_ms: int = Field(..., description="Deadline applied")
+    created_at: datetime = Field(..., description="Comparison timestamp")
+    results: List[ComparisonResultResponse] = Field(..., description="One result per target, in request order")
+
+
 class ConversationHistory(BaseModel):
     """Schema for conversation history."""
     conversation_id: str = Field(..., description="Conversation ID")
@@ -49,7 +113,7 @@ class ConversationHistory(BaseModel):
     messages: List[MessageResponse] = Field(..., description="List of messages in conversation")
     created_at: datetime = Field(..., description="Conversation creation timestamp")
     updated_at: datetime = Field(..., description="Last update timestamp")
-    total_messages: int = Field(..., description="Total message count")
+    total_messages: int = Field(..., description="Message count of the active branch")
 
     class Config:
         json_schema_extra = {
@@ -64,6 +128,102 @@ class ConversationHistory(BaseModel):
         }
 
 
+class DailyUsage(BaseModel):
+    """Schema for one day (or hour) of token usage."""
+    date: str = Field(..., description="Day (YYYY-MM-DD) or hour (YYYY-MM-DDTHH:00)")
+    messages: int = Field(..., description="Messages exchanged")
+    prompt_tokens: int = Field(..., description="Input tokens")
+    completion_tokens: int = Field(..., description="Output tokens")
+    cached_tokens: int = Field(0, description="Input tokens served from prefix cache")
+    total_tokens: int = Field(..., description="Input plus output tokens")
+
+
+class UsageSummary(BaseModel):
+    """Schema for aggregated usage of a user or a tenant."""
+    user_id: Optional[str] = Field(None, description="User identifier")
+    tenant_id: Optional[str] = Field(None, description="Tenant identifier")
+    conversations: Optional[int] = Field(None, description="Conversations with activity in the period (users only)")
+    messages: int = Field(..., description="Messages exchanged in the period")
+    prompt_tokens: int = Field(..., description="Input tokens in the period")
+    completion_tokens: int = Field(..., description="Output tokens in the period")
+    cached_tokens: int = Field(0, description="Input tokens served from prefix cache in the period")
+    total_tokens: int = Field(..., description="Input plus output tokens in the period")
+    daily: List[DailyUsage] = Field(default_factory=list, description="Per-day (or per-hour) breakdown")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "user_id": "user_456",
+                "conversations": 3,
+                "messages": 12,
+                "prompt_tokens": 5400,
+                "completion_tokens": 2100,
+                "cached_tokens": 3200,
+                "total_tokens": 7500,
+                "daily": [
+                    {"date": "2024-01-15", "messages": 12, "prompt_tokens": 5400,
+                     "completion_tokens": 2100, "cached_tokens": 3200, "total_tokens": 7500}
+                ]
+            }
+        }
+
+
+class QuotaUsage(BaseModel):
+    """Schema for usage against one quota."""
+    subject: str = Field(..., description="user:<id> or tenant:<id>")
+    metric: str = Field(..., description="requests or tokens")
+    window: str = Field(..., description="minute, hour or day")
+    limit: int = Field(..., description="Allowed per sliding window")
+    used: int = Field(..., description="Estimated use in the current sliding window")
+    remaining: int = Field(..., description="Limit minus use, never negative")
+
+
+class QuotaStatus(BaseModel):
+    """Schema for the quotas that apply to a user."""
+    user_id: str = Field(..., description="User identifier")
+    tenant_id: str = Field(..., description="Tenant identifier")
+    quotas: List[QuotaUsage] = Field(default_factory=list, description="One entry per configured quota")
+
+
+class SearchHit(BaseModel):
+    """Schema for a single search result."""
+    message_id: str = Field(..., description="Matching message ID")
+    conversation_id: str = Field(..., description="Conversation containing the message")
+    conversation_title: Optional[str] = Field(None, description="Conversation title")
+    snippet: str = Field(..., description="Excerpt with matches wrapped in <mark> tags")
+    score: float = Field(..., description="Relevance score (higher is better)")
+    timestamp: datetime = Field(..., description="Message timestamp")
+
+
+class SearchResponse(BaseModel):
+    """Schema for search results."""
+    query: str = Field(..., description="Search query")
+    results: List[SearchHit] = Field(..., description="Results ordered by relevance")
+    limit: int = Field(..., description="Page size")
+    offset: int = Field(..., description="Results skipped")
+    took_ms: float = Field(..., description="Query time in milliseconds")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "query": "docker compose",
+                "results": [
+                    {
+                        "message_id": "msg_789",
+                        "conversation_id": "conv_123",
+                        "conversation_title": "Deploy com Docker",
+                        "snippet": "use <mark>docker</mark> <mark>compose</mark> up -d…",
+                        "score": 7.41,
+                        "timestamp": "2024-01-15T10:30:00Z"
+                    }
+                ],
+                "limit": 20,
+                "offset": 0,
+                "took_ms": 1.8
+            }
+        }
+
+
 class ErrorResponse(BaseModel):
     """Schema for error responses."""
     error: str = Field(..., description="Error message")
@@ -80,13 +240,25 @@ class ErrorResponse(BaseModel):
         }
 
 
+class DependencyHealth(BaseModel):
+    """Schema for the latest probe of one dependency."""
+    status: str = Field(..., description="ok, down, or unknown before the first probe")
+    critical: bool = Field(..., description="Whether a failure takes the worker out of rotation")
+    latency_ms: Optional[float] = Field(None, description="Duration of the latest probe")
+    checked_at: Optional[datetime] = Field(None, description="When the latest probe finished")
+    error: Optional[str] = Field(None, description="Error of the latest failed probe")
+    detail: Optional[str] = Field(None, description="Extra diagnostics, e.g. pool status")
+    consecutive_failures: int = Field(0, description="Failed probes in a row")
+
+
 class HealthResponse(BaseModel):
     """Schema for health check response."""
-    status: str = Field(..., description="API status")
+    status: str = Field(..., description="API status: healthy, degraded or unhealthy")
     version: str = Field(..., description="API version")
     timestamp: datetime = Field(..., description="Current timestamp")
     database_connected: bool = Field(..., description="Database connection status")
     ai_model_ready: bool = Field(..., description="AI model availability status")
+    dependencies: Dict[str, DependencyHealth] = Field(default_factory=dict, description="Cached probe results")
 
     class Config:
         json_schema_extra = {
@@ -95,6 +267,36 @@ class HealthResponse(BaseModel):
                 "version": "1.0.0",
                 "timestamp": "2024-01-15T10:30:00Z",
                 "database_connected": True,
-                "ai_model_ready": True
+                "ai_model_ready": True,
+                "dependencies": {
+                    "database": {
+                        "status": "ok",
+                        "critical": True,
+                        "latency_ms": 0.4,
+                        "checked_at": "2024-01-15T10:29:55Z",
+                        "error": None,
+                        "detail": "Pool size: 10  Connections in pool: 3",
+                        "consecutive_failures": 0
+                    }
+                }
+            }
+        }
+
+
+class RetentionPolicyRequest(BaseModel):
+    """Schema for setting a user's retention period."""
+    days: int = Field(..., ge=1, le=36500, description="Conversations untouched for this many days are deleted")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "days": 30
             }
         }
+
+
+class DeletionSummary(BaseModel):
+    """Schema for the result of a bulk delete."""
+    conversations: int = Field(0, description="Conversations deleted")
+    messages: int = Field(0, description="Messages deleted")
+    embeddings: int = Field(0, description="Message embeddings deleted")
@@ -1,4 +1,9 @@
-"""Services package."""
+"""Services package.
+
+Kept minimal: submodules such as ``archive`` (zstandard), ``memory`` (the
+database engine) or ``rag`` (numpy) are imported where they are used, so
+importing one service does not load the rest.
+"""
 from .ai_service import AIService
 
 __all__ = ["AIService"]
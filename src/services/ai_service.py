@@ -1,220 +1,661 @@
 """AI service for handling chatbot interactions with multiple providers and streaming support."""
 import os
+import asyncio
 import logging
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from typing import List, Tuple, AsyncGenerator, Optional, Dict, Any
 import json
+import time
 
-import openai
-from openai import AsyncOpenAI
-import anthropic
-import google.generativeai as genai
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
+
+from .rag import Retriever
+from .resilience import call_with_retries, get_breaker, stream_with_retries
+from .router import ModelRouter
+from .tokenizer import count_tokens, count_prompt_tokens
+from .tracing import record_error, tracer
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class TokenUsage:
+    """Token accounting for a single provider call, filled in by the provider."""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Prompt tokens served from the provider's prefix cache / written to it.
+    cached_tokens: int = 0
+    cache_creation_tokens: int = 0
+    estimated: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def reported(self) -> bool:
+        return self.prompt_tokens > 0 or self.completion_tokens > 0
+
+
+def build_user_content(prompt: str, documents: Optional[List[str]] = None) -> str:
+    """Final user message, with retrieved context prepended when there is any.
+
+    Context goes into the last message rather than the system prompt so the
+    cacheable prefix (system prompt and history) stays identical across turns.
+    """
+    if not documents:
+        return prompt
+    context = "\n\n".join(f"[{i}] {doc}" for i, doc in enumerate(documents, 1))
+    return (
+        "Use the following context to answer if it is relevant; ignore it otherwise.\n\n"
+        f"{context}\n\nQuestion: {prompt}"
+    )
+
+
 class AIProvider(ABC):
     """Abstract base class for AI providers."""
 
+    # Prefix of the provider's environment variables (e.g. OPENAI_MODEL).
+    env_prefix: str = ""
+
+    @property
+    def default_model(self) -> str:
+        return self.model
+
     @abstractmethod
     async def generate_response(
-        self, prompt: str, conversation_history: List[Tuple[str, str]]
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
     ) -> Tuple[str, int]:
-        """Generate full response from AI model."""
+        """Generate full response from AI model (``model`` overrides the default)."""
         pass
 
     @abstractmethod
     async def stream_response(
-        self, prompt: str, conversation_history: List[Tuple[str, str]]
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
     ) -> AsyncGenerator[str, None]:
-        """Stream response from AI model."""
+        """Stream response from AI model (``model`` overrides the default)."""
+        pass
+
+    async def generate_batch(
+        self, requests: List[Tuple[str, List[Tuple[str, str]]]]
+    ) -> List[Tuple[str, int]]:
+        """Generate responses for several independent prompts concurrently.
+
+        Servers with continuous batching (vLLM, llama.cpp with parallel slots)
+        process these together, which is far cheaper than sequential calls.
+        """
+        return await asyncio.gather(
+            *(self.generate_response(prompt, history) for prompt, history in requests)
+        )
+
+    async def warmup(self):
+        """Open the provider connection (DNS, TCP, TLS) before the first real request."""
+        pass
+
+    async def ping(self):
+        """Cheap authenticated call for health probes; raises when the provider is unreachable."""
+        await self.warmup()
+
+    async def aclose(self):
+        """Release network resources held by the provider."""
         pass
 
 
 class OpenAIProvider(AIProvider):
     """OpenAI API provider."""
 
+    env_prefix = "OPENAI"
+
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.model = os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview")
         
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
-            
-        self.client = AsyncOpenAI(api_key=self.api_key)
-
-    def _build_messages(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> List[Dict[str, str]]:
-        messages = [
-            {
-                "role": "system",
-                "content": os.getenv("SYSTEM_PROMPT", "You are a helpful AI assistant. Provide clear, accurate, and concise responses.")
-            }
-        ]
+
+        from openai import AsyncOpenAI
+
+        # Retries happen in AIService, behind the circuit breaker and retry budget.
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            max_retries=0,
+            timeout=float(os.getenv("PROVIDER_TIMEOUT", 60)),
+        )
+        self.system_prompt = os.getenv("SYSTEM_PROMPT", "You are a helpful AI assistant. Provide clear, accurate, and concise responses.")
+
+    def _build_messages(
+        self, prompt: str, conversation_history: List[Tuple[str, str]], documents: Optional[List[str]] = None
+    ) -> List[Dict[str, str]]:
+        """Build messages from most to least stable content.
+
+        Automatic prefix caching (OpenAI, vLLM, llama.cpp) only reuses an exact
+        byte prefix, so the system prompt comes first and is resolved once at
+        startup, history follows in stored order, and anything that varies per
+        request is only ever appended to the final user message.
+        """
+        messages = [{"role": "system", "content": self.system_prompt}]
         
         for user_msg, ai_msg in conversation_history:
             messages.append({"role": "user", "content": user_msg})
             messages.append({"role": "assistant", "content": ai_msg})
             
-        messages.append({"role": "user", "content": prompt})
+        messages.append({"role": "user", "content": build_user_content(prompt, documents)})
         return messages
 
-    async def generate_response(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> Tuple[str, int]:
+    async def generate_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> Tuple[str, int]:
         try:
-            messages = self._build_messages(prompt, conversation_history)
+            messages = self._build_messages(prompt, conversation_history, documents)
             response = await self.client.chat.completions.create(
-                model=self.model,
+                model=model or self.model,
                 messages=messages,
                 temperature=float(os.getenv("TEMPERATURE", 0.7)),
                 max_tokens=int(os.getenv("MAX_TOKENS", 2000)),
             )
             
             ai_response = response.choices[0].message.content
-            tokens_used = response.usage.total_tokens
+            self._read_usage(response.usage, usage)
+            tokens_used = response.usage.total_tokens if response.usage else 0
             return ai_response, tokens_used
             
         except Exception as e:
-            logger.error(f"OpenAI error: {str(e)}")
+            logger.error("OpenAI error: %s", e)
             raise
 
-    async def stream_response(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> AsyncGenerator[str, None]:
+    async def stream_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> AsyncGenerator[str, None]:
         try:
-            messages = self._build_messages(prompt, conversation_history)
+            messages = self._build_messages(prompt, conversation_history, documents)
             stream = await self.client.chat.completions.create(
-                model=self.model,
+                model=model or self.model,
                 messages=messages,
                 temperature=float(os.getenv("TEMPERATURE", 0.7)),
                 max_tokens=int(os.getenv("MAX_TOKENS", 2000)),
                 stream=True,
+                # The final chunk carries usage for the whole stream (empty choices).
+                stream_options={"include_usage": True},
             )
             
             async for chunk in stream:
                 if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    self._read_usage(chunk.usage, usage)
                     
         except Exception as e:
-            logger.error(f"OpenAI stream error: {str(e)}")
-            yield f"Error: {str(e)}"
+            logger.error("OpenAI stream error: %s", e)
+            raise
+
+    async def warmup(self):
+        # Listing models is free and goes through the same pooled connection.
+        await self.client.models.list()
+
+    @staticmethod
+    def _read_usage(response_usage, usage: Optional[TokenUsage]):
+        if usage is None or not response_usage:
+            return
+        usage.prompt_tokens = response_usage.prompt_tokens or 0
+        usage.completion_tokens = response_usage.completion_tokens or 0
+        details = getattr(response_usage, "prompt_tokens_details", None)
+        usage.cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+
+class LocalProvider(OpenAIProvider):
+    """OpenAI-compatible local server provider (Ollama, vLLM, llama.cpp server)."""
+
+    env_prefix = "LOCAL"
+
+    def __init__(self):
+        self.base_url = os.getenv("LOCAL_BASE_URL", "http://localhost:11434/v1")
+        self.model = os.getenv("LOCAL_MODEL", "llama3")
+        # Local servers process a fixed number of requests in parallel ("slots");
+        # queueing beyond that only adds latency on the server side.
+        self.max_concurrency = int(os.getenv("LOCAL_MAX_CONCURRENCY", 4))
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+        import httpx
+        from openai import AsyncOpenAI
+
+        # A single pooled HTTP client keeps connections alive between requests.
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            timeout=httpx.Timeout(float(os.getenv("LOCAL_TIMEOUT", 120)), connect=5.0),
+        )
+        self.client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=os.getenv("LOCAL_API_KEY", "local"),
+            http_client=self.http_client,
+            max_retries=0,
+        )
+        self.system_prompt = os.getenv("SYSTEM_PROMPT", "You are a helpful AI assistant. Provide clear, accurate, and concise responses.")
+
+    async def generate_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> Tuple[str, int]:
+        async with self._slots:
+            return await super().generate_response(prompt, conversation_history, model, usage, documents)
+
+    async def stream_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> AsyncGenerator[str, None]:
+        async with self._slots:
+            async for chunk in super().stream_response(
+                prompt, conversation_history, model, usage, documents
+            ):
+                yield chunk
+
+    async def aclose(self):
+        await self.http_client.aclose()
 
 
 class AnthropicProvider(AIProvider):
     """Anthropic API provider."""
 
+    env_prefix = "ANTHROPIC"
+
     def __init__(self):
         self.api_key = os.getenv("ANTHROPIC_API_KEY")
         self.model = os.getenv("ANTHROPIC_MODEL", "claude-3-opus-20240229")
         
         if not self.api_key:
             raise ValueError("ANTHROPIC_API_KEY environment variable is required")
-            
-        self.client = anthropic.AsyncAnthropic(api_key=self.api_key)
 
-    def _build_messages(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> List[Dict[str, str]]:
-        messages = []
+        import anthropic
+
+        self.client = anthropic.AsyncAnthropic(
+            api_key=self.api_key,
+            max_retries=0,
+            timeout=float(os.getenv("PROVIDER_TIMEOUT", 60)),
+        )
+        self.system_prompt = os.getenv("SYSTEM_PROMPT", "You are a helpful AI assistant.")
+        self.prompt_caching = os.getenv("ANTHROPIC_PROMPT_CACHING", "True").lower() == "true"
+
+    async def warmup(self):
+        if hasattr(self.client, "models"):
+            await self.client.models.list(limit=1)
+
+    def _build_system(self) -> List[Dict[str, Any]]:
+        block: Dict[str, Any] = {"type": "text", "text": self.system_prompt}
+        if self.prompt_caching:
+            block["cache_control"] = {"type": "ephemeral"}
+        return [block]
+
+    def _build_messages(
+        self, prompt: str, conversation_history: List[Tuple[str, str]], documents: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Build messages with a cache breakpoint at the end of the stored history.
+
+        Together with the system prompt breakpoint this caches the prefix that
+        is resent unchanged on the next turn; on that turn the API finds the
+        previous breakpoint by looking back from the new one.
+        """
+        messages: List[Dict[str, Any]] = []
         for user_msg, ai_msg in conversation_history:
             messages.append({"role": "user", "content": user_msg})
             messages.append({"role": "assistant", "content": ai_msg})
-        messages.append({"role": "user", "content": prompt})
+        if self.prompt_caching and messages:
+            last = messages[-1]
+            last["content"] = [
+                {"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}
+            ]
+        messages.append({"role": "user", "content": build_user_content(prompt, documents)})
         return messages
 
-    async def generate_response(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> Tuple[str, int]:
+    @staticmethod
+    def _read_usage(response_usage, usage: Optional[TokenUsage]):
+        if usage is None:
+            return
+        # input_tokens only counts tokens after the last cache breakpoint.
+        usage.cached_tokens = getattr(response_usage, "cache_read_input_tokens", 0) or 0
+        usage.cache_creation_tokens = getattr(response_usage, "cache_creation_input_tokens", 0) or 0
+        usage.prompt_tokens = response_usage.input_tokens + usage.cached_tokens + usage.cache_creation_tokens
+        usage.completion_tokens = response_usage.output_tokens
+
+    async def generate_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> Tuple[str, int]:
         try:
-            messages = self._build_messages(prompt, conversation_history)
+            messages = self._build_messages(prompt, conversation_history, documents)
             response = await self.client.messages.create(
-                model=self.model,
-                system=os.getenv("SYSTEM_PROMPT", "You are a helpful AI assistant."),
+                model=model or self.model,
+                system=self._build_system(),
                 messages=messages,
                 max_tokens=int(os.getenv("MAX_TOKENS", 2000)),
                 temperature=float(os.getenv("TEMPERATURE", 0.7)),
             )
             
             ai_response = response.content[0].text
-            tokens_used = response.usage.input_tokens + response.usage.output_tokens
+            request_usage = usage if usage is not None else TokenUsage()
+            self._read_usage(response.usage, request_usage)
+            tokens_used = request_usage.total_tokens
             return ai_response, tokens_used
             
         except Exception as e:
-            logger.error(f"Anthropic error: {str(e)}")
+            logger.error("Anthropic error: %s", e)
             raise
 
-    async def stream_response(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> AsyncGenerator[str, None]:
+    async def stream_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> AsyncGenerator[str, None]:
         try:
-            messages = self._build_messages(prompt, conversation_history)
+            messages = self._build_messages(prompt, conversation_history, documents)
             async with self.client.messages.stream(
-                model=self.model,
-                system=os.getenv("SYSTEM_PROMPT", "You are a helpful AI assistant."),
+                model=model or self.model,
+                system=self._build_system(),
                 messages=messages,
                 max_tokens=int(os.getenv("MAX_TOKENS", 2000)),
                 temperature=float(os.getenv("TEMPERATURE", 0.7)),
             ) as stream:
                 async for text in stream.text_stream:
                     yield text
+                if usage is not None:
+                    final_message = await stream.get_final_message()
+                    self._read_usage(final_message.usage, usage)
         except Exception as e:
-            logger.error(f"Anthropic stream error: {str(e)}")
-            yield f"Error: {str(e)}"
+            logger.error("Anthropic stream error: %s", e)
+            raise
 
 
 class GoogleProvider(AIProvider):
     """Google Gemini API provider."""
 
+    env_prefix = "GOOGLE"
+
     def __init__(self):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.model_name = os.getenv("GOOGLE_MODEL", "gemini-1.5-pro")
         
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY environment variable is required")
-            
+
+        import google.generativeai as genai
+
+        self._genai = genai
         genai.configure(api_key=self.api_key)
         self.model = genai.GenerativeModel(self.model_name)
+        self._models: Dict[str, Any] = {self.model_name: self.model}
 
-    async def generate_response(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> Tuple[str, int]:
+    @property
+    def default_model(self) -> str:
+        return self.model_name
+
+    def _get_model(self, model: Optional[str]):
+        if not model:
+            return self.model
+        if model not in self._models:
+            self._models[model] = self._genai.GenerativeModel(model)
+        return self._models[model]
+
+    async def generate_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> Tuple[str, int]:
         try:
-            chat = self.model.start_chat(history=[]) # Could implement history mapping here
             # Simplest way: join history into prompt if gemini history format is complex
-            full_prompt = self._build_full_prompt(prompt, conversation_history)
-            response = await self.model.generate_content_async(full_prompt)
-            return response.text, 0 # Gemini token count is separate
+            full_prompt = self._build_full_prompt(prompt, conversation_history, documents)
+            response = await self._get_model(model).generate_content_async(full_prompt)
+            self._read_usage(response, usage)
+            tokens = getattr(response.usage_metadata, "total_token_count", 0) if response.usage_metadata else 0
+            return response.text, tokens
         except Exception as e:
-            logger.error(f"Google error: {str(e)}")
+            logger.error("Google error: %s", e)
             raise
 
-    async def stream_response(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> AsyncGenerator[str, None]:
+    async def stream_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> AsyncGenerator[str, None]:
         try:
-            full_prompt = self._build_full_prompt(prompt, conversation_history)
-            response = await self.model.generate_content_async(full_prompt, stream=True)
+            full_prompt = self._build_full_prompt(prompt, conversation_history, documents)
+            response = await self._get_model(model).generate_content_async(full_prompt, stream=True)
             async for chunk in response:
                 yield chunk.text
+            # Usage metadata arrives on the last chunk of the stream.
+            self._read_usage(response, usage)
         except Exception as e:
-            logger.error(f"Google stream error: {str(e)}")
-            yield f"Error: {str(e)}"
+            logger.error("Google stream error: %s", e)
+            raise
+
+    @staticmethod
+    def _read_usage(response, usage: Optional[TokenUsage]):
+        metadata = getattr(response, "usage_metadata", None)
+        if usage is None or not metadata:
+            return
+        usage.prompt_tokens = getattr(metadata, "prompt_token_count", 0) or 0
+        usage.completion_tokens = getattr(metadata, "candidates_token_count", 0) or 0
+        # Implicit context caching on newer Gemini models.
+        usage.cached_tokens = getattr(metadata, "cached_content_token_count", 0) or 0
 
-    def _build_full_prompt(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> str:
+    def _build_full_prompt(
+        self, prompt: str, conversation_history: List[Tuple[str, str]], documents: Optional[List[str]] = None
+    ) -> str:
         history_text = "\n".join([f"User: {u}\nAssistant: {a}" for u, a in conversation_history])
-        return f"{history_text}\nUser: {prompt}\nAssistant:"
+        return f"{history_text}\nUser: {build_user_content(prompt, documents)}\nAssistant:"
+
+
+# Providers by AI_PROVIDER name. Each imports its SDK in its constructor, so
+# only the configured provider's SDK is loaded (and needs to be installed).
+PROVIDERS: Dict[str, type] = {
+    "openai": OpenAIProvider,
+    "anthropic": AnthropicProvider,
+    "google": GoogleProvider,
+    "local": LocalProvider,
+    "ollama": LocalProvider,
+    "vllm": LocalProvider,
+    "llamacpp": LocalProvider,
+}
 
 
 class AIService:
     """Main AI service that manages different providers."""
 
-    def __init__(self):
-        provider_name = os.getenv("AI_PROVIDER", "openai").lower()
-        self.provider: AIProvider
-
-        if provider_name == "openai":
-            self.provider = OpenAIProvider()
-        elif provider_name == "anthropic":
-            self.provider = AnthropicProvider()
-        elif provider_name == "google":
-            self.provider = GoogleProvider()
-        else:
-            # Fallback for old providers from requests-based implementation
-            # For brevity, I'll only support the new high-quality ones
-            # but I could implementation Ollama/Local here too
-            self.provider = OpenAIProvider()
-
-        logger.info(f"AI Service initialized with provider: {provider_name}")
-
-    async def generate_response(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> Tuple[str, int]:
-        return await self.provider.generate_response(prompt, conversation_history)
-
-    async def stream_response(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> AsyncGenerator[str, None]:
-        async for chunk in self.provider.stream_response(prompt, conversation_history):
-            yield chunk
+    def __init__(self, provider_name: Optional[str] = None):
+        provider_name = (provider_name or os.getenv("AI_PROVIDER", "openai")).lower()
+        self.provider: AIProvider = PROVIDERS.get(provider_name, OpenAIProvider)()
+        self.provider_name = provider_name
+        self.breaker = get_breaker(provider_name)
+        self.max_retries = int(os.getenv("PROVIDER_MAX_RETRIES", 2))
+        self.retry_backoff = float(os.getenv("PROVIDER_RETRY_BACKOFF", 0.5))
+
+        self.router = ModelRouter.from_env(self.provider.env_prefix, self.provider.default_model)
+        self.retriever = Retriever.from_env()
+
+        logger.info("AI Service initialized with provider: %s", provider_name)
+
+    async def generate_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> Tuple[str, int]:
+        """Generate a response, routing to a model by prompt complexity unless ``model`` is given.
+
+        Unless ``documents`` is given, the top-k chunks from the RAG index (if
+        configured) are added as context. Provider failures raise
+        :class:`~src.services.resilience.ProviderError`.
+        """
+        usage = usage if usage is not None else TokenUsage()
+        documents = await self._retrieve(prompt, documents)
+        route = self.router.select(prompt, conversation_history, model)
+        start = time.perf_counter()
+        with tracer.start_as_current_span("llm.generate", kind=SpanKind.CLIENT,
+                                          attributes=self._span_attributes(route)) as span:
+            try:
+                response, _ = await call_with_retries(
+                    self.provider_name,
+                    lambda: self.provider.generate_response(prompt, conversation_history, route.model, usage, documents),
+                    self.max_retries,
+                    self.retry_backoff,
+                    self.breaker,
+                )
+            except Exception:
+                self.router.record(route, time.perf_counter() - start, error=True)
+                raise
+            self._estimate_usage(usage, build_user_content(prompt, documents), conversation_history, response, route.model)
+            self._set_usage_attributes(span, usage)
+        self.router.record(route, time.perf_counter() - start, usage.total_tokens)
+        return response, usage.total_tokens
+
+    async def stream_response(
+        self,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        model: Optional[str] = None,
+        usage: Optional[TokenUsage] = None,
+        documents: Optional[List[str]] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Stream a response; ``usage`` is filled in once the stream is exhausted."""
+        usage = usage if usage is not None else TokenUsage()
+        documents = await self._retrieve(prompt, documents)
+        route = self.router.select(prompt, conversation_history, model)
+        start = time.perf_counter()
+        parts = []
+        stream = stream_with_retries(
+            self.provider_name,
+            lambda: self.provider.stream_response(prompt, conversation_history, route.model, usage, documents),
+            self.max_retries,
+            self.retry_backoff,
+            self.breaker,
+        )
+        # Not made current across yields: the consumer's code runs between chunks.
+        span = tracer.start_span("llm.stream", kind=SpanKind.CLIENT, attributes=self._span_attributes(route))
+        try:
+            while True:
+                with trace.use_span(span, end_on_exit=False):
+                    try:
+                        chunk = await stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                if not parts:
+                    ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                    span.add_event("first_token", {"llm.ttft_ms": ttft_ms})
+                    span.set_attribute("llm.ttft_ms", ttft_ms)
+                parts.append(chunk)
+                yield chunk
+            self._estimate_usage(
+                usage, build_user_content(prompt, documents), conversation_history, "".join(parts), route.model
+            )
+            self._set_usage_attributes(span, usage)
+        except Exception as e:
+            self.router.record(route, time.perf_counter() - start, error=True)
+            record_error(span, e)
+            raise
+        finally:
+            await stream.aclose()
+            span.end()
+        self.router.record(route, time.perf_counter() - start, usage.total_tokens)
+
+    def _span_attributes(self, route) -> Dict[str, Any]:
+        return {"llm.provider": self.provider_name, "llm.model": route.model, "llm.route": route.name}
+
+    @staticmethod
+    def _set_usage_attributes(span, usage: TokenUsage):
+        span.set_attribute("llm.usage.prompt_tokens", usage.prompt_tokens)
+        span.set_attribute("llm.usage.completion_tokens", usage.completion_tokens)
+        span.set_attribute("llm.usage.cached_tokens", usage.cached_tokens)
+        span.set_attribute("llm.usage.estimated", usage.estimated)
+
+    async def retrieve(self, prompt: str) -> Optional[List[str]]:
+        """RAG context for ``prompt``, to share one retrieval across several calls."""
+        return await self._retrieve(prompt, None)
+
+    async def _retrieve(self, prompt: str, documents: Optional[List[str]]) -> Optional[List[str]]:
+        if documents is not None or self.retriever is None:
+            return documents
+        try:
+            return [chunk.text for chunk in await self.retriever.retrieve(prompt)]
+        except Exception as e:
+            # Answering without context beats failing the request.
+            logger.error("RAG retrieval error: %s", e)
+            return None
+
+    @staticmethod
+    def _estimate_usage(
+        usage: TokenUsage,
+        prompt: str,
+        conversation_history: List[Tuple[str, str]],
+        response: str,
+        model: Optional[str],
+    ):
+        """Fall back to local token counting when the provider reported nothing."""
+        if usage.reported:
+            return
+        usage.prompt_tokens = count_prompt_tokens(
+            prompt, conversation_history, os.getenv("SYSTEM_PROMPT", ""), model
+        )
+        usage.completion_tokens = count_tokens(response, model)
+        usage.estimated = True
+
+    async def generate_batch(
+        self, requests: List[Tuple[str, List[Tuple[str, str]]]]
+    ) -> List[Tuple[str, int]]:
+        return await self.provider.generate_batch(requests)
+
+    async def warmup(self, timeout: float = 5.0) -> bool:
+        """Pre-open provider connections; failures are logged, never fatal."""
+        try:
+            await asyncio.wait_for(self.provider.warmup(), timeout)
+            return True
+        except Exception as e:
+            logger.warning("Provider warmup failed: %r", e)
+            return False
+
+    async def aclose(self):
+        await self.provider.aclose()
@@ -0,0 +1,267 @@
+"""Tiered storage: cold conversations are moved out of the hot tables.
+
+Conversations untouched for ``ARCHIVE_AFTER_DAYS`` have their messages written
+to one zstd-compressed JSON blob per conversation and deleted from
+``messages``; the conversation row stays as a stub. Opening an archived
+conversation restores its messages transparently.
+
+Run the archival job periodically (e.g. from cron):
+
+    python -m src.services.archive run --days 90
+"""
+import os
+import json
+import argparse
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import zstandard
+from sqlalchemy import DateTime, insert, or_
+from sqlalchemy.orm import Session
+
+from src.database import SessionLocal, Conversation, Message, MessageEmbedding
+
+logger = logging.getLogger(__name__)
+
+BLOB_VERSION = 1
+_MESSAGE_COLUMNS = list(Message.__table__.columns)
+
+
+class ArchiveStore(ABC):
+    """Abstract key/blob store for archived conversations (object storage interface)."""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+
+class LocalArchiveStore(ArchiveStore):
+    """Blobs as files under a root directory; a stand-in for an object store bucket."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        return path.read_bytes() if path.exists() else None
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+
+def create_archive_store(url: Optional[str] = None) -> ArchiveStore:
+    """Create the store for ``ARCHIVE_URL`` (``file://`` paths or a plain directory)."""
+    url = url or os.getenv("ARCHIVE_URL", "file://data/archive")
+    if url.startswith("file://"):
+        return LocalArchiveStore(url[len("file://"):])
+    if "://" not in url:
+        return LocalArchiveStore(url)
+    raise ValueError(f"Unsupported ARCHIVE_URL: {url}")
+
+
+def archive_key(conversation_id: str) -> str:
+    # Two-character prefix directories keep any single directory small.
+    return f"conversations/{conversation_id[:2]}/{conversation_id}.json.zst"
+
+
+def _encode(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class Archiver:
+    """Moves conversations between the hot tables and the archive store."""
+
+    def __init__(
+        self,
+        store: ArchiveStore,
+        level: int = 10,
+        on_restore: Optional[Callable[[Optional[str], List[Dict[str, Any]]], None]] = None,
+    ):
+        self.store = store
+        self.level = level
+        # Called with (owner user id, restored message rows) after each restore.
+        self.on_restore = on_restore
+        self.archived = 0
+        self.restored = 0
+
+    @classmethod
+    def from_env(cls) -> "Archiver":
+        return cls(create_archive_store(), level=int(os.getenv("ARCHIVE_ZSTD_LEVEL", 10)))
+
+    def archive(self, db: Session, conversation: Conversation) -> int:
+        """Archive one conversation; returns the number of messages moved."""
+        rows = (
+            db.query(*_MESSAGE_COLUMNS)
+            .filter(Message.conversation_id == conversation.id)
+            .order_by(Message.created_at)
+            .all()
+        )
+        blob = {
+            "version": BLOB_VERSION,
+            "conversation_id": conversation.id,
+            "messages": [{c.name: _encode(v) for c, v in zip(_MESSAGE_COLUMNS, row)} for row in rows],
+        }
+        # Blob first, rows second: a crash in between leaves an orphan blob, never lost messages.
+        self.store.put(archive_key(conversation.id), zstandard.compress(json.dumps(blob).encode(), self.level))
+
+        message_ids = db.query(Message.id).filter(Message.conversation_id == conversation.id)
+        db.query(MessageEmbedding).filter(MessageEmbedding.message_id.in_(message_ids.scalar_subquery())).delete(
+            synchronize_session=False
+        )
+        db.query(Message).filter(Message.conversation_id == conversation.id).delete(synchronize_session=False)
+        db.query(Conversation).filter(Conversation.id == conversation.id).update(
+            {
+                Conversation.archived_at: datetime.utcnow(),
+                Conversation.archived_messages: len(rows),
+                Conversation.updated_at: Conversation.updated_at,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+        db.expire(conversation)
+        self.archived += 1
+        return len(rows)
+
+    def read(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Message rows of an archived conversation, oldest first, without restoring it."""
+        data = self.store.get(archive_key(conversation_id))
+        if data is None:
+            raise FileNotFoundError(f"Archive blob missing for conversation {conversation_id}")
+        blob = json.loads(zstandard.decompress(data))
+        datetime_columns = {c.name for c in _MESSAGE_COLUMNS if isinstance(c.type, DateTime)}
+        return [
+            {k: datetime.fromisoformat(v) if k in datetime_columns and v else v for k, v in message.items()}
+            for message in blob["messages"]
+        ]
+
+    def restore(self, db: Session, conversation: Conversation) -> int:
+        """Move an archived conversation's messages back into the hot table.
+
+        The stub is claimed first with a conditional update, so of two
+        requests opening the same conversation only one restores it; the
+        other waits for it (row or database lock) and returns 0.
+        """
+        user_id = conversation.user_id
+        claimed = db.query(Conversation).filter(
+            Conversation.id == conversation.id, Conversation.archived_at.isnot(None)
+        ).update(
+            {
+                Conversation.archived_at: None,
+                Conversation.archived_messages: None,
+                Conversation.restored_at: datetime.utcnow(),
+                Conversation.updated_at: Conversation.updated_at,
+            },
+            synchronize_session=False,
+        )
+        if not claimed:
+            db.rollback()
+            db.expire(conversation)
+            return 0
+        try:
+            rows = self.read(conversation.id)
+            if rows:
+                db.execute(insert(Message), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        db.expire(conversation)
+        self.store.delete(archive_key(conversation.id))
+        self.restored += 1
+        if self.on_restore is not None and rows:
+            # Embeddings were dropped on archive; re-index the turns for long-term memory.
+            self.on_restore(user_id, rows)
+        return len(rows)
+
+    def ensure_restored(self, db: Session, conversation: Optional[Conversation]):
+        if conversation is not None and conversation.archived_at is not None:
+            count = self.restore(db, conversation)
+            if count:
+                logger.info("Restored %s archived messages for conversation %s", count, conversation.id)
+
+    def archive_stale(self, db: Session, days: int, batch_size: int = 100, limit: Optional[int] = None) -> int:
+        """Archive conversations neither updated nor restored in the last ``days`` days."""
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        total = 0
+        while limit is None or total < limit:
+            batch = (
+                db.query(Conversation)
+                .filter(
+                    Conversation.archived_at.is_(None),
+                    Conversation.updated_at < cutoff,
+                    or_(Conversation.restored_at.is_(None), Conversation.restored_at < cutoff),
+                )
+                .order_by(Conversation.updated_at)
+                .limit(batch_size if limit is None else min(batch_size, limit - total))
+                .all()
+            )
+            if not batch:
+                break
+            for conversation in batch:
+                self.archive(db, conversation)
+            total += len(batch)
+            logger.info("Archived %s conversations", total)
+        return total
+
+    def discard(self, conversation_id: str):
+        """Drop the blob of an archived conversation that is being deleted."""
+        self.store.delete(archive_key(conversation_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"archived": self.archived, "restored": self.restored}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive cold conversations.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Archive conversations untouched for N days")
+    run_parser.add_argument("--days", type=int, default=int(os.getenv("ARCHIVE_AFTER_DAYS", 90)))
+    run_parser.add_argument("--batch-size", type=int, default=100)
+    run_parser.add_argument("--limit", type=int, default=None)
+    restore_parser = subparsers.add_parser("restore", help="Restore one conversation")
+    restore_parser.add_argument("conversation_id")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from src.database import init_db
+
+    init_db()
+    archiver = Archiver.from_env()
+    db = SessionLocal()
+    try:
+        if args.command == "run":
+            count = archiver.archive_stale(db, args.days, args.batch_size, args.limit)
+            print(f"Archived {count} conversations")
+        else:
+            conversation = db.get(Conversation, args.conversation_id)
+            if conversation is None or conversation.archived_at is None:
+                print("Conversation is not archived")
+            else:
+                print(f"Restored {archiver.restore(db, conversation)} messages")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Conversation branches: turns form a tree, and each conversation points at its active leaf.
+
+Every :class:`Message` is one turn with a ``parent_id`` (``NULL`` for a first
+turn). Regenerating a turn adds a sibling with the same user message and
+editing adds a sibling with a new one; either way the new turn becomes
+``Conversation.active_message_id`` and the previous branch stays in the tree.
+History and model context follow the active path from that leaf up to the
+root, loaded with one recursive CTE walking the ``parent_id`` index.
+
+Conversations written before branching existed have no pointer: their turns
+are linked into a single chain, by ``created_at``, the first time they are used.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import bindparam, func, literal, select, update
+from sqlalchemy.orm import Session, aliased
+
+from src.database import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+
+def _path_cte():
+    """Ids of the ``leaf_id`` turn and up to ``limit - 1`` ancestors, with their distance from the leaf."""
+    path = (
+        select(Message.id, Message.parent_id, literal(0).label("depth"))
+        .where(Message.id == bindparam("leaf_id"))
+        .cte("branch_path", recursive=True)
+    )
+    parent = aliased(Message)
+    return path.union_all(
+        select(parent.id, parent.parent_id, (path.c.depth + 1).label("depth"))
+        # Stops the walk after ``limit`` turns instead of materialising the whole path.
+        .where(parent.id == path.c.parent_id, path.c.depth < bindparam("limit") - 1)
+    )
+
+
+# Longest branch followed; far beyond any context window.
+MAX_DEPTH = 1_000_000
+
+# Built once: constructing the aliased recursive CTE costs more than running it.
+_PATH = _path_cte()
+
+
+def path_to(db: Session, leaf_id: Optional[str], columns: Sequence[Any] = (Message,), limit: Optional[int] = None) -> List[Any]:
+    """Turns from the root down to ``leaf_id`` (root first); only the last ``limit`` turns when given."""
+    if leaf_id is None or limit == 0:
+        return []
+    query = select(*columns).join(_PATH, Message.id == _PATH.c.id).order_by(_PATH.c.depth.desc())
+    return db.execute(query, {"leaf_id": leaf_id, "limit": MAX_DEPTH if limit is None else limit}).all()
+
+
+def _point(db: Session, conversation: Conversation, leaf_id: str):
+    """Move the active pointer without touching updated_at, so the conversation keeps its place in lists."""
+    db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation.id)
+        .values(active_message_id=leaf_id, updated_at=Conversation.updated_at)
+    )
+    db.commit()
+    db.refresh(conversation)
+
+
+def link_legacy(db: Session, conversation: Conversation) -> Optional[str]:
+    """Chain the turns of a conversation without a pointer by ``created_at``; returns the leaf."""
+    ids = db.execute(
+        select(Message.id).where(Message.conversation_id == conversation.id).order_by(Message.created_at, Message.id)
+    ).scalars().all()
+    if not ids:
+        return None
+    if len(ids) > 1:
+        db.execute(
+            update(Message),
+            [{"id": child, "parent_id": parent} for parent, child in zip(ids, ids[1:])],
+        )
+    _point(db, conversation, ids[-1])
+    logger.info("Linked %d legacy turns of conversation %s", len(ids), conversation.id)
+    return ids[-1]
+
+
+def active_leaf(db: Session, conversation: Optional[Conversation]) -> Optional[str]:
+    """The turn new messages are appended to (``None`` for an empty or missing conversation)."""
+    if conversation is None:
+        return None
+    if conversation.active_message_id is None:
+        return link_legacy(db, conversation)
+    return conversation.active_message_id
+
+
+def active_path(db: Session, conversation_id: str, columns: Sequence[Any] = (Message,), limit: Optional[int] = None) -> List[Any]:
+    """Turns of the active branch, root first."""
+    return path_to(db, active_leaf(db, db.get(Conversation, conversation_id)), columns, limit)
+
+
+def newest_leaf(db: Session, message_id: str) -> str:
+    """Follow the most recent child down from ``message_id`` to a leaf."""
+    current = message_id
+    while True:
+        child = db.execute(
+            select(Message.id).where(Message.parent_id == current).order_by(Message.created_at.desc()).limit(1)
+        ).scalar()
+        if child is None:
+            return current
+        current = child
+
+
+def siblings(db: Session, message: Message) -> List[Message]:
+    """Alternatives for a turn (itself included), oldest first."""
+    parent = Message.parent_id == message.parent_id if message.parent_id is not None else Message.parent_id.is_(None)
+    return (
+        db.query(Message)
+        .filter(Message.conversation_id == message.conversation_id, parent)
+        .order_by(Message.created_at)
+        .all()
+    )
+
+
+def sibling_counts(db: Session, conversation_id: str) -> Dict[Optional[str], int]:
+    """Number of turns under each parent of the conversation (``None`` for first turns); 1 unless branched."""
+    rows = db.execute(
+        select(Message.parent_id, func.count(Message.id))
+        .where(Message.conversation_id == conversation_id)
+        .group_by(Message.parent_id)
+        .having(func.count(Message.id) > 1)
+    ).all()
+    return defaultdict(lambda: 1, rows)
+
+
+def select_branch(db: Session, conversation: Conversation, message_id: str) -> str:
+    """Make the branch through ``message_id`` active, down its newest replies; returns the new leaf."""
+    leaf_id = newest_leaf(db, message_id)
+    if leaf_id != conversation.active_message_id:
+        _point(db, conversation, leaf_id)
+    return leaf_id
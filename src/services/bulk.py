@@ -0,0 +1,304 @@
+"""Bulk export and import of conversations.
+
+Data is exported as one row per message, denormalised with its conversation,
+in either of two formats:
+
+* ``ndjson`` - zstd-compressed newline-delimited JSON (``.ndjson.zst``).
+* ``parquet`` - columnar Parquet with one row group per batch (needs ``pyarrow``).
+
+Rows are read through a streaming server-side cursor and written batch by
+batch, so memory stays constant regardless of table size. Imports insert in
+batches with ``executemany`` and skip rows that already exist.
+
+    python -m src.services.bulk export chats.parquet --format parquet
+    python -m src.services.bulk import chats.parquet --format parquet
+"""
+import io
+import json
+import importlib.util
+import time
+import argparse
+import logging
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import zstandard
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from src.database import Conversation, Message
+from .archive import Archiver
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "parquet")
+CONVERSATION_FIELDS = {
+    "conversation_id": Conversation.id,
+    "user_id": Conversation.user_id,
+    "title": Conversation.title,
+    "conversation_created_at": Conversation.created_at,
+    "conversation_updated_at": Conversation.updated_at,
+    "active_message_id": Conversation.active_message_id,
+}
+MESSAGE_FIELDS = {
+    "message_id": Message.id,
+    "parent_id": Message.parent_id,
+    "user_message": Message.user_message,
+    "ai_response": Message.ai_response,
+    "tokens_used": Message.tokens_used,
+    "prompt_tokens": Message.prompt_tokens,
+    "completion_tokens": Message.completion_tokens,
+    "cached_tokens": Message.cached_tokens,
+    "created_at": Message.created_at,
+}
+FIELDS = {**CONVERSATION_FIELDS, **MESSAGE_FIELDS}
+_DATETIME_FIELDS = {"conversation_created_at", "conversation_updated_at", "created_at"}
+_INT_FIELDS = {"tokens_used", "prompt_tokens", "completion_tokens", "cached_tokens"}
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _arrow():
+    """Import pyarrow on first Parquet use; it is large and slows down startup."""
+    if not parquet_available():
+        raise RuntimeError("Parquet support requires pyarrow (pip install pyarrow)")
+    import pyarrow
+    import pyarrow.parquet
+
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema():
+    pa, _ = _arrow()
+    return pa.schema([
+        (name, pa.timestamp("us") if name in _DATETIME_FIELDS else pa.int64() if name in _INT_FIELDS else pa.string())
+        for name in FIELDS
+    ])
+
+
+def iter_batches(db: Session, user_id: Optional[str] = None, batch_size: int = 10_000,
+                 archiver: Optional[Archiver] = None) -> Iterator[List[Tuple]]:
+    """Yield lists of message rows (in ``FIELDS`` order): hot rows from a streaming cursor, then archived ones."""
+    query = (
+        select(*FIELDS.values())
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .order_by(Message.conversation_id, Message.created_at)
+    )
+    if user_id:
+        query = query.where(Conversation.user_id == user_id)
+    # stream_results + yield_per: a server-side cursor on PostgreSQL, incremental fetch on SQLite.
+    result = db.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+    for partition in result.partitions():
+        yield partition
+
+    # Archived conversations keep only a stub row; their messages are in the archive store.
+    stubs = (
+        select(*(column.label(name) for name, column in CONVERSATION_FIELDS.items()))
+        .where(Conversation.archived_at.isnot(None))
+        .order_by(Conversation.id)
+    )
+    if user_id:
+        stubs = stubs.where(Conversation.user_id == user_id)
+    archiver = archiver or Archiver.from_env()
+    batch: List[Tuple] = []
+    for stub in db.execute(stubs).all():
+        for message in archiver.read(stub.conversation_id):
+            batch.append((*stub, *(message[field.key] for field in MESSAGE_FIELDS.values())))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class _Sink(io.RawIOBase):
+    """Write-only buffer drained by the caller, so encoded output can be streamed."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _encode_json(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_export(db: Session, fmt: str = "ndjson", user_id: Optional[str] = None,
+                  batch_size: int = 10_000, stats: Optional[Dict[str, int]] = None,
+                  archiver: Optional[Archiver] = None) -> Iterator[bytes]:
+    """Yield the encoded export in chunks, one (or a few) per batch."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    names = list(FIELDS)
+    sink = _Sink()
+    rows = 0
+
+    if fmt == "parquet":
+        pa, pq = _arrow()
+        schema = arrow_schema()
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        for batch in iter_batches(db, user_id, batch_size, archiver):
+            columns = list(zip(*batch))
+            writer.write_batch(pa.record_batch([pa.array(col, type=schema.field(i).type)
+                                                for i, col in enumerate(columns)], schema=schema))
+            rows += len(batch)
+            yield sink.drain()
+        writer.close()
+    else:
+        compressor = zstandard.ZstdCompressor(level=3).stream_writer(sink, closefd=False)
+        for batch in iter_batches(db, user_id, batch_size, archiver):
+            lines = [json.dumps({k: _encode_json(v) for k, v in zip(names, row)}, ensure_ascii=False)
+                     for row in batch]
+            compressor.write(("\n".join(lines) + "\n").encode())
+            compressor.flush(zstandard.FLUSH_BLOCK)
+            rows += len(batch)
+            yield sink.drain()
+        compressor.close()
+
+    yield sink.drain()
+    if stats is not None:
+        stats["rows"] = rows
+
+
+def export_to_file(db: Session, path: str, fmt: str = "ndjson", user_id: Optional[str] = None,
+                   batch_size: int = 10_000) -> int:
+    stats: Dict[str, int] = {}
+    with open(path, "wb") as out:
+        for chunk in stream_export(db, fmt, user_id, batch_size, stats):
+            out.write(chunk)
+    return stats["rows"]
+
+
+def read_batches(source: BinaryIO, fmt: str = "ndjson", batch_size: int = 10_000) -> Iterator[List[Dict[str, Any]]]:
+    """Yield lists of row dicts from an export file object."""
+    if fmt == "parquet":
+        _, pq = _arrow()
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+        return
+    if fmt != "ndjson":
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    reader = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(source), encoding="utf-8")
+    batch = []
+    try:
+        for line in reader:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            for name in _DATETIME_FIELDS:
+                if row.get(name):
+                    row[name] = datetime.fromisoformat(row[name])
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Invalid zstd input: {e}") from e
+    if batch:
+        yield batch
+
+
+def _insert_ignoring_existing(conn: Connection, model, rows: List[Dict[str, Any]]):
+    """``executemany`` insert that leaves existing primary keys untouched."""
+    if not rows:
+        return
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        conn.execute(insert(model).on_conflict_do_nothing(), rows)
+    elif conn.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        conn.execute(insert(model).on_conflict_do_nothing(), rows)
+    else:
+        from sqlalchemy import insert
+        conn.execute(insert(model).prefix_with("IGNORE"), rows)
+
+
+def import_batches(conn: Connection, batches: Iterator[List[Dict[str, Any]]]) -> Tuple[int, int]:
+    """Insert exported rows; returns ``(rows read, batches)``. Commits per batch."""
+    rows_read = batches_done = 0
+    for batch in batches:
+        conversations = {}
+        for row in batch:
+            conversations.setdefault(row["conversation_id"], {
+                "id": row["conversation_id"],
+                "user_id": row.get("user_id"),
+                "title": row.get("title"),
+                "created_at": row.get("conversation_created_at"),
+                "updated_at": row.get("conversation_updated_at"),
+                "active_message_id": row.get("active_message_id"),
+            })
+        messages = [
+            {
+                "id": row["message_id"],
+                "conversation_id": row["conversation_id"],
+                **{name: row.get(name) for name in MESSAGE_FIELDS if name != "message_id"},
+            }
+            for row in batch
+        ]
+        with conn.begin():
+            _insert_ignoring_existing(conn, Conversation, list(conversations.values()))
+            _insert_ignoring_existing(conn, Message, messages)
+        rows_read += len(batch)
+        batches_done += 1
+    return rows_read, batches_done
+
+
+def import_from_file(conn: Connection, source: BinaryIO, fmt: str = "ndjson", batch_size: int = 10_000) -> int:
+    rows, _ = import_batches(conn, read_batches(source, fmt, batch_size))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export and import of conversations.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export messages to a file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    export_parser.add_argument("--user-id", default=None)
+    export_parser.add_argument("--batch-size", type=int, default=10_000)
+    import_parser = subparsers.add_parser("import", help="Import messages from a file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    import_parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from src.database import SessionLocal, engine, init_db
+
+    init_db()
+    start = time.perf_counter()
+    if args.command == "export":
+        db = SessionLocal()
+        try:
+            rows = export_to_file(db, args.path, args.format, args.user_id, args.batch_size)
+        finally:
+            db.close()
+    else:
+        with engine.connect() as conn, open(args.path, "rb") as source:
+            rows = import_from_file(conn, source, args.format, args.batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"{args.command.capitalize()}ed {rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
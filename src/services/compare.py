@@ -0,0 +1,267 @@
+"""Side-by-side comparison of providers and models (``POST /chat/compare``).
+
+One prompt, with the same conversation context and retrieved documents, is
+sent to every target concurrently. Chunks are merged into one stream as they
+arrive, tagged with the target's label, and each target's output, latency and
+token usage end up in a :class:`ComparisonResult` row. At the deadline,
+targets still running are cancelled and kept as ``timeout`` with whatever
+they had produced by then.
+
+Targets are ``provider`` or ``provider:model`` (``openai:gpt-4o-mini``);
+without a model the provider's router picks one, as for ``/chat``.
+``COMPARE_TARGETS`` is the default list.
+"""
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Optional, Tuple, Union
+
+from sqlalchemy.orm import Session
+
+from src.database import Comparison, ComparisonResult
+from .ai_service import PROVIDERS, AIService, TokenUsage, build_user_content
+from .resilience import ProviderError
+
+logger = logging.getLogger(__name__)
+
+OK, ERROR, TIMEOUT = "ok", "error", "timeout"
+
+
+@dataclass(frozen=True)
+class Target:
+    provider: str
+    model: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.provider}:{self.model}" if self.model else self.provider
+
+
+def parse_targets(spec: Union[str, Iterable[str]]) -> List[Target]:
+    """Parse ``"openai:gpt-4o-mini, anthropic"`` (or a list of such items); duplicates are dropped."""
+    items = spec.split(",") if isinstance(spec, str) else spec
+    targets: List[Target] = []
+    for item in items:
+        item = item.strip()
+        if not item:
+            continue
+        provider, _, model = item.partition(":")
+        provider = provider.strip().lower()
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider {provider!r} in target {item!r}")
+        target = Target(provider, model.strip() or None)
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+
+@dataclass
+class TargetRun:
+    """Progress and outcome of one target in a comparison."""
+    target: Target
+    model: Optional[str] = None
+    parts: List[str] = field(default_factory=list)
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    status: Optional[str] = None
+    error: Optional[str] = None
+    ttft_ms: Optional[float] = None
+    latency_ms: float = 0.0
+
+    @property
+    def label(self) -> str:
+        return self.target.label
+
+    @property
+    def output(self) -> str:
+        return "".join(self.parts)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "model": self.label,
+            "provider": self.target.provider,
+            "resolved_model": self.model,
+            "status": self.status,
+            "error": self.error,
+            "ttft_ms": self.ttft_ms,
+            "latency_ms": self.latency_ms,
+            "prompt_tokens": self.usage.prompt_tokens,
+            "completion_tokens": self.usage.completion_tokens,
+            "total_tokens": self.usage.total_tokens,
+        }
+
+
+class ModelComparer:
+    """Runs comparisons; one :class:`AIService` per compared provider, created on first use."""
+
+    def __init__(self, targets: Optional[List[Target]] = None, deadline: float = 60.0, max_targets: int = 4):
+        self.targets = targets or []
+        self.deadline = deadline
+        self.max_targets = max_targets
+        self._services: Dict[str, AIService] = {}
+        self.comparisons = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls) -> "ModelComparer":
+        return cls(
+            parse_targets(os.getenv("COMPARE_TARGETS", "")),
+            deadline=float(os.getenv("COMPARE_DEADLINE", 60)),
+            max_targets=int(os.getenv("COMPARE_MAX_TARGETS", 4)),
+        )
+
+    def resolve(self, names: Optional[List[str]]) -> List[Target]:
+        """Requested targets, or the configured ones; ``ValueError`` when unusable."""
+        targets = parse_targets(names) if names else self.targets
+        if not targets:
+            raise ValueError("No targets given and COMPARE_TARGETS is not configured")
+        if len(targets) > self.max_targets:
+            raise ValueError(f"At most {self.max_targets} targets can be compared at once")
+        return targets
+
+    def service(self, provider: str) -> AIService:
+        if provider not in self._services:
+            self._services[provider] = AIService(provider)
+        return self._services[provider]
+
+    async def _run(
+        self,
+        run: TargetRun,
+        prompt: str,
+        context: List[Tuple[str, str]],
+        documents: Optional[List[str]],
+        queue: asyncio.Queue,
+        start: float,
+    ):
+        try:
+            service = self.service(run.target.provider)
+            # Pinned up front so the stored model is the one that answered.
+            run.model = service.router.select(prompt, context, run.target.model).model
+            stream = service.stream_response(prompt, context, model=run.model, usage=run.usage, documents=documents)
+            try:
+                async for chunk in stream:
+                    if run.ttft_ms is None:
+                        run.ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                    run.parts.append(chunk)
+                    queue.put_nowait((run, chunk))
+            finally:
+                await stream.aclose()
+            run.status = OK
+        except asyncio.CancelledError:
+            raise
+        except ProviderError as e:
+            run.status, run.error = ERROR, f"{e.kind}: {e}"
+        except Exception as e:
+            # A provider that cannot even be created (missing SDK or key) fails alone.
+            logger.error("Comparison target %s failed: %r", run.label, e)
+            run.status, run.error = ERROR, str(e) or type(e).__name__
+        finally:
+            run.latency_ms = round((time.perf_counter() - start) * 1000, 1)
+            if run.status is not None:
+                queue.put_nowait((run, None))
+
+    async def compare(
+        self,
+        prompt: str,
+        context: List[Tuple[str, str]],
+        runs: List[TargetRun],
+        deadline: float,
+        documents: Optional[List[str]] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Merged events of all ``runs``: chunks tagged by model, then a result per target as it ends.
+
+        ``runs`` are filled in place; after the generator finishes every run
+        has a status, including the ones cut off at ``deadline`` seconds.
+        """
+        self.comparisons += 1
+        queue: asyncio.Queue = asyncio.Queue()
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        tasks = [asyncio.create_task(self._run(run, prompt, context, documents, queue, start)) for run in runs]
+        pending = len(tasks)
+        try:
+            while pending:
+                try:
+                    run, chunk = await asyncio.wait_for(queue.get(), max(0.0, end - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                pending -= chunk is None
+                yield self._event(run, chunk)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Sent in the same tick as the deadline: queued, but not yielded yet.
+        while not queue.empty():
+            yield self._event(*queue.get_nowait())
+        elapsed = round((time.perf_counter() - start) * 1000, 1)
+        for run in runs:
+            if run.status is None:
+                self.timeouts += 1
+                run.status, run.latency_ms = TIMEOUT, elapsed
+                # Providers report usage at the end of a stream; what was generated is still billed.
+                AIService._estimate_usage(run.usage, build_user_content(prompt, documents), context, run.output, run.model)
+                yield {"type": "result", **run.summary()}
+
+    def _event(self, run: TargetRun, chunk: Optional[str]) -> Dict[str, Any]:
+        if chunk is not None:
+            return {"type": "content", "model": run.label, "content": chunk}
+        if run.status == ERROR:
+            self.errors += 1
+        return {"type": "result", **run.summary()}
+
+    async def aclose(self):
+        for service in self._services.values():
+            await service.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "targets": [t.label for t in self.targets],
+            "deadline": self.deadline,
+            "max_targets": self.max_targets,
+            "comparisons": self.comparisons,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+        }
+
+
+def save_comparison(
+    db: Session,
+    comparison_id: str,
+    prompt: str,
+    runs: List[TargetRun],
+    deadline: float,
+    user_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+) -> Comparison:
+    """Store a finished comparison with one result row per target, in request order."""
+    comparison = Comparison(
+        id=comparison_id,
+        user_id=user_id,
+        conversation_id=conversation_id,
+        prompt=prompt,
+        deadline_ms=int(deadline * 1000),
+        results=[
+            ComparisonResult(
+                position=position,
+                provider=run.target.provider,
+                model=run.model or run.target.model,
+                status=run.status,
+                output=run.output,
+                error=run.error,
+                ttft_ms=None if run.ttft_ms is None else int(run.ttft_ms),
+                latency_ms=int(run.latency_ms),
+                prompt_tokens=run.usage.prompt_tokens,
+                completion_tokens=run.usage.completion_tokens,
+                total_tokens=run.usage.total_tokens,
+            )
+            for position, run in enumerate(runs)
+        ],
+    )
+    db.add(comparison)
+    db.commit()
+    return comparison
@@ -0,0 +1,160 @@
+"""Response compression and conditional-request helpers.
+
+:class:`CompressionMiddleware` encodes text-like responses with brotli (when
+the optional ``brotli`` package is installed and the client accepts ``br``)
+or gzip. Server-Sent Events are never compressed: buffering inside the
+compressor would hold back events. Streamed bodies (e.g. ``/export``) are
+compressed chunk by chunk with a sync flush so they stay incremental.
+
+ETags are weak (``W/"..."``): the same representation is served with
+different content encodings. Strong ETags set upstream (e.g. by
+``FileResponse``) are weakened on compressed responses for the same reason.
+"""
+import zlib
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+_COMPRESSIBLE = (b"application/json", b"application/x-ndjson", b"application/javascript", b"image/svg+xml", b"text/")
+_NEVER = (b"text/event-stream",)
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag from the values that determine a representation."""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """``If-None-Match`` check with weak comparison (RFC 9110, 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def _accepted(accept_encoding: str) -> List[str]:
+    """Codings with a non-zero q-value."""
+    codings = []
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            codings.append(name.strip().lower())
+    return codings
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    codings = _accepted(accept_encoding)
+    if brotli is not None and "br" in codings:
+        return "br"
+    if "gzip" in codings or "*" in codings:
+        return "gzip"
+    return None
+
+
+class _Encoder:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _header(headers: Iterable[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _weaken(etag: bytes) -> bytes:
+    """A strong validator must not be shared by two encodings of a body."""
+    return etag if etag.startswith(b"W/") else b"W/" + etag
+
+
+class CompressionMiddleware:
+    """ASGI middleware: brotli/gzip for text and JSON responses of at least ``minimum_size`` bytes."""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = _header(scope.get("headers", []), b"accept-encoding")
+        encoding = choose_encoding(accept.decode("latin-1")) if accept else None
+
+        start_message = None
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                content_type = _header(headers, b"content-type") or b""
+                compressible = content_type.startswith(_COMPRESSIBLE) and not content_type.startswith(_NEVER)
+                if compressible:
+                    # Caches must keep encodings apart even when this response is not compressed.
+                    headers.append((b"vary", b"Accept-Encoding"))
+                    message["headers"] = headers
+                if not compressible or encoding is None or _header(headers, b"content-encoding") is not None:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = _Encoder(encoding, self.gzip_level, self.brotli_quality)
+                headers = [
+                    (k, _weaken(v) if k.lower() == b"etag" else v)
+                    for k, v in start_message["headers"]
+                    if k.lower() != b"content-length"
+                ]
+                headers.append((b"content-encoding", encoding.encode()))
+                if not more_body:
+                    compressed = encoder.compress(body, final=True)
+                    headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start_message, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": encoder.compress(body, final=not more_body), "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
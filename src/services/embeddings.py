@@ -0,0 +1,103 @@
+"""Text embedders used for retrieval and semantic memory."""
+import os
+import re
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class Embedder(ABC):
+    """Abstract base class for embedders. Vectors are float32 and L2-normalised."""
+
+    dimension: int
+    name: str
+    # True when embedding runs locally on the CPU and exposes ``embed_sync``.
+    cpu_bound: bool = False
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts into a ``(len(texts), dimension)`` array."""
+        pass
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        return (await self.embed([text]))[0]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder(Embedder):
+    """Deterministic local embedder based on feature hashing of words and bigrams.
+
+    Needs no model or network, so it is the default for tests and offline
+    setups. It captures lexical overlap only, not meaning.
+    """
+
+    name = "hashing"
+    cpu_bound = True
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _bucket(self, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = [t.lower() for t in _TOKEN_PATTERN.findall(text)]
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                h = self._bucket(feature)
+                # The top bit picks the sign so collisions cancel out on average.
+                matrix[row, h % self.dimension] += 1.0 if h >> 63 else -1.0
+        return _normalize(matrix)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embed_sync(texts)
+
+
+class OpenAIEmbedder(Embedder):
+    """Embeddings from the OpenAI API or any OpenAI-compatible server (e.g. Ollama)."""
+
+    def __init__(self, model: str, dimension: int, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        from openai import AsyncOpenAI
+
+        self.name = model
+        self.model = model
+        self.dimension = dimension
+        self.client = AsyncOpenAI(base_url=base_url, api_key=api_key or os.getenv("OPENAI_API_KEY"))
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        response = await self.client.embeddings.create(model=self.model, input=texts)
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        return _normalize(vectors)
+
+
+def create_embedder() -> Embedder:
+    """Create the embedder configured by ``EMBEDDING_PROVIDER`` (hashing, openai or local)."""
+    provider = os.getenv("EMBEDDING_PROVIDER", "hashing").lower()
+    if provider == "openai":
+        return OpenAIEmbedder(
+            os.getenv("EMBEDDING_MODEL", "text-embedding-3-small"),
+            int(os.getenv("EMBEDDING_DIMENSION", 1536)),
+        )
+    if provider == "local":
+        return OpenAIEmbedder(
+            os.getenv("EMBEDDING_MODEL", "nomic-embed-text"),
+            int(os.getenv("EMBEDDING_DIMENSION", 768)),
+            base_url=os.getenv("LOCAL_BASE_URL", "http://localhost:11434/v1"),
+            api_key=os.getenv("LOCAL_API_KEY", "local"),
+        )
+    return HashingEmbedder(int(os.getenv("EMBEDDING_DIMENSION", 384)))
@@ -0,0 +1,132 @@
+"""Background dependency probes with cached results.
+
+Each registered dependency (database, AI provider, shared state backend) is
+checked every ``HEALTH_INTERVAL`` seconds by a background task. The health
+and readiness endpoints only read the cached results, so they answer without
+touching any dependency and a slow database cannot make the probes time out.
+
+Dependencies listed in ``HEALTH_CRITICAL`` gate readiness; the others are
+reported (``degraded``) but keep the worker in rotation, since taking every
+worker out because the provider is down would only turn errors into outages.
+"""
+import os
+import time
+import asyncio
+import inspect
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Check = Callable[[], Union[Any, Awaitable[Any]]]
+
+OK = "ok"
+DOWN = "down"
+UNKNOWN = "unknown"
+
+
+@dataclass
+class DependencyStatus:
+    """Result of the latest probe of one dependency."""
+
+    name: str
+    critical: bool
+    status: str = UNKNOWN
+    latency_ms: Optional[float] = None
+    checked_at: Optional[datetime] = None
+    error: Optional[str] = None
+    detail: Optional[str] = None
+    consecutive_failures: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "critical": self.critical,
+            "latency_ms": self.latency_ms,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "error": self.error,
+            "detail": self.detail,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class HealthMonitor:
+    """Probes dependencies on an interval and serves the cached results."""
+
+    def __init__(self, interval: float = 15.0, timeout: float = 3.0, critical: Optional[List[str]] = None):
+        self.interval = interval
+        self.timeout = timeout
+        self.critical = set(critical if critical is not None else ["database"])
+        self._checks: Dict[str, Check] = {}
+        self._status: Dict[str, DependencyStatus] = {}
+
+    @classmethod
+    def from_env(cls) -> "HealthMonitor":
+        critical = [name.strip() for name in os.getenv("HEALTH_CRITICAL", "database").split(",") if name.strip()]
+        return cls(
+            interval=float(os.getenv("HEALTH_INTERVAL", 15)),
+            timeout=float(os.getenv("HEALTH_TIMEOUT", 3)),
+            critical=critical,
+        )
+
+    def register(self, name: str, check: Check):
+        """Add a dependency. Sync checks run in a thread; a returned string is kept as detail."""
+        self._checks[name] = check
+        if name not in self._status:
+            self._status[name] = DependencyStatus(name=name, critical=name in self.critical)
+
+    async def _run_check(self, check: Check) -> Any:
+        if inspect.iscoroutinefunction(check):
+            return await check()
+        result = await asyncio.to_thread(check)
+        return await result if inspect.isawaitable(result) else result
+
+    async def probe(self, name: str) -> DependencyStatus:
+        status = self._status[name]
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self._run_check(self._checks[name]), self.timeout)
+            status.status = OK
+            status.error = None
+            status.consecutive_failures = 0
+            if isinstance(result, str):
+                status.detail = result
+        except Exception as e:
+            if status.status != DOWN:
+                logger.warning("Health check '%s' failed: %r", name, e)
+            status.status = DOWN
+            status.error = str(e) or type(e).__name__
+            status.consecutive_failures += 1
+        status.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        status.checked_at = datetime.utcnow()
+        return status
+
+    async def probe_all(self):
+        """Probe every dependency concurrently."""
+        await asyncio.gather(*(self.probe(name) for name in self._checks))
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.probe_all()
+
+    @property
+    def ready(self) -> bool:
+        """True unless a critical dependency failed its latest probe."""
+        return all(s.status != DOWN for s in self._status.values() if s.critical)
+
+    @property
+    def status(self) -> str:
+        if not self.ready:
+            return "unhealthy"
+        if any(s.status == DOWN for s in self._status.values()):
+            return "degraded"
+        return "healthy"
+
+    def get(self, name: str) -> Optional[DependencyStatus]:
+        return self._status.get(name)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: status.as_dict() for name, status in self._status.items()}
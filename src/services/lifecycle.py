@@ -0,0 +1,133 @@
+"""Process lifecycle: readiness, in-flight stream tracking and graceful drain.
+
+On SIGTERM the server stops accepting connections and waits for open
+requests; this module lets the application take part in that: readiness
+turns false so the load balancer stops routing here, new streams are
+refused with 503, endless event subscriptions end, and streams still
+running at the drain deadline end cleanly (their partial answer is saved)
+instead of being cut off.
+
+Uvicorn only runs the lifespan shutdown after open connections have closed,
+so draining has to start from the signal itself: :class:`DrainingServer`
+does that for ``python -m src.main`` and ``src.workers.DrainingWorker`` for
+gunicorn. Under any other server the lifespan shutdown still drains, late.
+"""
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from types import FrameType
+from typing import Any, AsyncIterator, Dict, Optional, Set, TypeVar
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Lifecycle:
+    """Readiness and drain state of one worker process."""
+
+    def __init__(self, drain_timeout: float = 25.0):
+        self.drain_timeout = drain_timeout
+        self.ready = False
+        self.draining = False
+        self.drain_deadline: Optional[float] = None
+        self.active_streams = 0
+        self._idle: Optional[asyncio.Event] = None
+        # One future per open subscription, on that subscription's loop.
+        self._drain_waiters: Set[asyncio.Future] = set()
+
+    def _idle_event(self) -> asyncio.Event:
+        if self._idle is None:
+            self._idle = asyncio.Event()
+            if self.active_streams == 0:
+                self._idle.set()
+        return self._idle
+
+    def begin_drain(self):
+        """Stop taking new streams; running ones have ``drain_timeout`` seconds left."""
+        if self.draining:
+            return
+        self.draining = True
+        self.ready = False
+        self.drain_deadline = time.monotonic() + self.drain_timeout
+        logger.info("Draining: %s streams in flight, deadline %.0fs", self.active_streams, self.drain_timeout)
+        for waiter in self._drain_waiters:
+            waiter.get_loop().call_soon_threadsafe(_release, waiter)
+
+    @property
+    def deadline_passed(self) -> bool:
+        return self.drain_deadline is not None and time.monotonic() >= self.drain_deadline
+
+    @asynccontextmanager
+    async def track_stream(self) -> AsyncIterator[None]:
+        self.active_streams += 1
+        self._idle_event().clear()
+        try:
+            yield
+        finally:
+            self.active_streams -= 1
+            if self.active_streams == 0:
+                self._idle_event().set()
+
+    async def wait_for_streams(self) -> bool:
+        """Wait until no stream is running or the drain deadline passes."""
+        remaining = (self.drain_deadline - time.monotonic()) if self.drain_deadline else self.drain_timeout
+        try:
+            await asyncio.wait_for(self._idle_event().wait(), max(0.0, remaining))
+            return True
+        except asyncio.TimeoutError:
+            logger.warning("Drain deadline passed with %s streams still running", self.active_streams)
+            return False
+
+    async def until_drain(self, source: AsyncIterator[T]) -> AsyncIterator[T]:
+        """Items of ``source`` until draining begins; for endless streams such as event subscriptions."""
+        if self.draining:
+            return
+        stop = asyncio.get_running_loop().create_future()
+        self._drain_waiters.add(stop)
+        item: Optional[asyncio.Future] = None
+        try:
+            while True:
+                item = asyncio.ensure_future(source.__anext__())
+                await asyncio.wait({item, stop}, return_when=asyncio.FIRST_COMPLETED)
+                if not item.done():
+                    break
+                try:
+                    value = item.result()
+                except StopAsyncIteration:
+                    break
+                item = None
+                yield value
+        finally:
+            self._drain_waiters.discard(stop)
+            if item is not None and not item.done():
+                item.cancel()
+                await asyncio.gather(item, return_exceptions=True)
+            await source.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "draining": self.draining,
+            "active_streams": self.active_streams,
+        }
+
+
+def _release(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class DrainingServer(uvicorn.Server):
+    """Uvicorn server that starts draining as soon as the exit signal arrives."""
+
+    def __init__(self, config: uvicorn.Config, lifecycle: Lifecycle):
+        super().__init__(config)
+        self.lifecycle = lifecycle
+
+    def handle_exit(self, sig: int, frame: Optional[FrameType]) -> None:
+        self.lifecycle.begin_drain()
+        super().handle_exit(sig, frame)
@@ -0,0 +1,183 @@
+"""Structured, non-blocking logging.
+
+Records are put on an in-memory queue by a :class:`ContextQueueHandler` and
+written by a :class:`logging.handlers.QueueListener` thread, so the event loop
+never waits on stdout or a file. Messages use ``%``-style arguments: the
+string is only built if the record is kept, and for plain arguments only on
+the listener thread.
+
+Each line is a JSON object (``LOG_FORMAT=json``, the default) or the classic
+text format (``LOG_FORMAT=text``). Records carry the request's correlation id
+(``X-Request-ID``, generated when the client sends none) and its trace id.
+DEBUG records can be sampled (``LOG_DEBUG_SAMPLE_RATE``) so that debug logging
+stays affordable under load.
+"""
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+REQUEST_ID_HEADER = "x-request-id"
+TEXT_FORMAT = "%(asctime)s | %(levelname)-8s | %(name)s:%(funcName)s:%(lineno)d | req=%(request_id)s trace=%(trace_id)s - %(message)s"
+
+# Attributes every LogRecord has; anything else was passed through ``extra``.
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "trace_id", "sample_rate"}
+# Arguments of these types are safe to format later on another thread.
+_IMMUTABLE = (str, int, float, bool, type(None), bytes)
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with ``extra`` fields kept as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "trace_id": getattr(record, "trace_id", None),
+        }
+        if getattr(record, "sample_rate", None) is not None:
+            entry["sample_rate"] = record.sample_rate
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep every record at INFO and above, and a ``rate`` fraction of DEBUG records."""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        if random.random() < self.rate:
+            # Lets readers scale counts of sampled events back up.
+            record.sample_rate = self.rate
+            return True
+        self.dropped += 1
+        return False
+
+
+class ContextQueueHandler(QueueHandler):
+    """Queue handler that captures request context and defers formatting."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Captured in the caller's context: the listener thread runs outside the request.
+        record.request_id = request_id_var.get() or "-"
+        if not hasattr(record, "trace_id"):
+            record.trace_id = "-"
+        args = record.args
+        if args and (isinstance(args, dict) or not all(isinstance(arg, _IMMUTABLE) for arg in args)):
+            # Objects may change (or lazy-load from the DB) before the listener gets to them.
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # Tracebacks reference live frames; render them now.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    debug_sample_rate: Optional[float] = None,
+    stream=None,
+) -> QueueListener:
+    """Route the root logger (and uvicorn's) through a queue to one stream handler."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    rate = debug_sample_rate if debug_sample_rate is not None else float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))
+
+    # Neither format prints thread or process details; skip collecting them for every record.
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = ContextQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SamplingFilter(rate))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    # Uvicorn installs its own handlers; send its records through the queue too.
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records; called at exit."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class RequestIdMiddleware:
+    """ASGI middleware: reuse or assign ``X-Request-ID`` and echo it in the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope.get("headers", []):
+            if key == REQUEST_ID_HEADER.encode():
+                # Bounded so a client cannot inflate every log line.
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER.encode(), request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
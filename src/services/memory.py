@@ -0,0 +1,257 @@
+"""Long-term conversational memory through embeddings of past turns.
+
+Instead of resending a conversation's whole history, each turn is assembled
+from the last few turns of the current branch plus the most relevant
+earlier turns of the same user, across all of their conversations.
+
+New turns are embedded by the background task queue (see ``tasks.py``).
+Embeddings live in the ``message_embeddings`` table, which is the source of
+truth for every worker; each process keeps a small LRU of per-user in-memory
+indexes refreshed after ``MEMORY_CACHE_TTL`` seconds.
+
+Embed existing messages with:
+
+    python -m src.services.memory backfill
+"""
+import os
+import time
+import asyncio
+import argparse
+import logging
+from collections import OrderedDict
+from typing import List, Tuple, Optional, Dict, Any, Callable
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from src.database import SessionLocal, Conversation, Message, MessageEmbedding
+from . import branches
+from .embeddings import Embedder, create_embedder
+from .vector_index import FlatIndex
+
+logger = logging.getLogger(__name__)
+
+# Longest text embedded per turn; the start of a turn carries most of its topic.
+MAX_EMBED_CHARS = 2000
+
+
+def turn_text(user_message: str, ai_response: str) -> str:
+    return f"{user_message}\n{ai_response}"[:MAX_EMBED_CHARS]
+
+
+class ConversationMemory:
+    """Per-user semantic index over past turns plus context assembly."""
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        recent_turns: int = 6,
+        recall_k: int = 4,
+        min_score: float = 0.3,
+        cache_ttl: float = 60.0,
+        cache_users: int = 1024,
+    ):
+        self.embedder = embedder
+        self.recent_turns = recent_turns
+        self.recall_k = recall_k
+        self.min_score = min_score
+        self.cache_ttl = cache_ttl
+        self.cache_users = cache_users
+        self._indexes: "OrderedDict[str, Tuple[FlatIndex, float]]" = OrderedDict()
+        self.embedded = 0
+        self.recalls = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ConversationMemory"]:
+        """Memory from the environment; off by default unless a real embedder is configured.
+
+        Hashing vectors only match shared words, so recall from them would put
+        unrelated turns in place of the conversation's own history.
+        """
+        semantic = os.getenv("EMBEDDING_PROVIDER", "hashing").lower() in ("openai", "local")
+        if os.getenv("MEMORY_ENABLED", str(semantic)).lower() != "true":
+            return None
+        return cls(
+            create_embedder(),
+            recent_turns=int(os.getenv("MEMORY_RECENT_TURNS", 6)),
+            recall_k=int(os.getenv("MEMORY_RECALL_K", 4)),
+            min_score=float(os.getenv("MEMORY_MIN_SCORE", 0.3)),
+            cache_ttl=float(os.getenv("MEMORY_CACHE_TTL", 60)),
+        )
+
+    # -- Index maintenance -------------------------------------------------
+
+    def _user_index(self, db: Session, user_id: str) -> FlatIndex:
+        cached = self._indexes.get(user_id)
+        if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+            self._indexes.move_to_end(user_id)
+            return cached[0]
+
+        rows = (
+            db.query(MessageEmbedding.message_id, MessageEmbedding.vector)
+            .filter(MessageEmbedding.user_id == user_id, MessageEmbedding.model == self.embedder.name)
+            .all()
+        )
+        index = FlatIndex.empty(self.embedder.dimension)
+        if rows:
+            vectors = np.frombuffer(b"".join(r.vector for r in rows), dtype=np.float32)
+            index.add([r.message_id for r in rows], vectors.reshape(len(rows), -1))
+
+        self._indexes[user_id] = (index, time.monotonic())
+        self._indexes.move_to_end(user_id)
+        while len(self._indexes) > self.cache_users:
+            self._indexes.popitem(last=False)
+        return index
+
+    def store_embeddings(self, db: Session, rows: List[Tuple[str, str]], vectors: np.ndarray):
+        """Persist ``(message_id, user_id)`` embeddings and update cached indexes."""
+        db.add_all([
+            MessageEmbedding(
+                message_id=message_id,
+                user_id=user_id,
+                model=self.embedder.name,
+                vector=vector.astype(np.float32).tobytes(),
+            )
+            for (message_id, user_id), vector in zip(rows, vectors)
+        ])
+        db.commit()
+        for (message_id, user_id), vector in zip(rows, vectors):
+            cached = self._indexes.get(user_id)
+            if cached is not None:
+                cached[0].add([message_id], vector[None, :])
+        self.embedded += len(rows)
+
+    def forget(self, user_id: str):
+        """Drop the cached index of a user whose data was erased."""
+        self._indexes.pop(user_id, None)
+
+    async def index_messages(self, items: List[Tuple[str, str, str, str]], run_cpu: Optional[Callable] = None):
+        """Embed stored ``(message_id, user_id, user_message, ai_response)`` turns in one call.
+
+        Called by the background task queue after the responses are persisted.
+        ``run_cpu`` offloads local, CPU-bound embedders from the event loop.
+        """
+        items = [item for item in items if item[1]]
+        if not items:
+            return
+        texts = [turn_text(user_message, ai_response) for _, _, user_message, ai_response in items]
+        if run_cpu is not None and self.embedder.cpu_bound:
+            vectors = await run_cpu(self.embedder.embed_sync, texts)
+        else:
+            vectors = await self.embedder.embed(texts)
+        db = SessionLocal()
+        try:
+            self.store_embeddings(db, [(message_id, user_id) for message_id, user_id, _, _ in items], vectors)
+        finally:
+            db.close()
+
+    # -- Context assembly ------------------------------------------------
+
+    async def recall(self, db: Session, user_id: str, query: str, exclude: List[str]) -> List[str]:
+        """IDs of the user's past turns most similar to ``query``."""
+        index = self._user_index(db, user_id)
+        if len(index) == 0:
+            return []
+        vector = await self.embedder.embed_one(query)
+        excluded = set(exclude)
+        hits = index.search(vector, self.recall_k + len(excluded))
+        self.recalls += 1
+        return [
+            message_id for message_id, score in hits
+            if score >= self.min_score and message_id not in excluded
+        ][:self.recall_k]
+
+    async def assemble_context(
+        self, db: Session, conversation_id: str, user_id: Optional[str], prompt: str
+    ) -> List[Tuple[str, str]]:
+        """Recalled turns (oldest first) followed by the last few turns of this conversation's active branch."""
+        return await self.branch_context(db, branches.active_leaf(db, db.get(Conversation, conversation_id)), user_id, prompt)
+
+    async def branch_context(
+        self, db: Session, leaf_id: Optional[str], user_id: Optional[str], prompt: str
+    ) -> List[Tuple[str, str]]:
+        """Like :meth:`assemble_context`, for the branch ending at ``leaf_id`` (``None`` before a first turn)."""
+        recent = branches.path_to(
+            db, leaf_id, (Message.id, Message.user_message, Message.ai_response), limit=self.recent_turns
+        )
+        if not user_id:
+            return [(m.user_message, m.ai_response) for m in recent]
+
+        recalled_ids = await self.recall(db, user_id, prompt, [m.id for m in recent])
+        recalled = []
+        if recalled_ids:
+            recalled = (
+                db.query(Message.user_message, Message.ai_response)
+                .filter(Message.id.in_(recalled_ids))
+                .order_by(Message.created_at)
+                .all()
+            )
+        return [(m.user_message, m.ai_response) for m in recalled] + [
+            (m.user_message, m.ai_response) for m in recent
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embedder": self.embedder.name,
+            "recent_turns": self.recent_turns,
+            "recall_k": self.recall_k,
+            "cached_users": len(self._indexes),
+            "embedded": self.embedded,
+            "recalls": self.recalls,
+        }
+
+
+async def backfill(memory: ConversationMemory, batch_size: int = 256) -> int:
+    """Embed every stored turn of identified users that has no embedding yet.
+
+    Keyset pagination over message ids keeps memory constant regardless of
+    table size; each batch is embedded with a single embedder call.
+    """
+    total = 0
+    last_id = ""
+    db = SessionLocal()
+    try:
+        while True:
+            rows = (
+                db.query(Message.id, Conversation.user_id, Message.user_message, Message.ai_response)
+                .join(Conversation, Conversation.id == Message.conversation_id)
+                .outerjoin(MessageEmbedding, MessageEmbedding.message_id == Message.id)
+                .filter(
+                    Conversation.user_id.isnot(None),
+                    MessageEmbedding.message_id.is_(None),
+                    Message.id > last_id,
+                )
+                .order_by(Message.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            vectors = await memory.embedder.embed([turn_text(r.user_message, r.ai_response) for r in rows])
+            memory.store_embeddings(db, [(r.id, r.user_id) for r in rows], vectors)
+            total += len(rows)
+            last_id = rows[-1].id
+            logger.info("Backfilled %s message embeddings", total)
+    finally:
+        db.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage long-term conversation memory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Embed stored messages without embeddings")
+    backfill_parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from src.database import init_db
+
+    init_db()
+    memory = ConversationMemory(create_embedder())
+    count = asyncio.run(backfill(memory, args.batch_size))
+    print(f"Embedded {count} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+"""Usage metering, rollups and quotas per user and tenant.
+
+Every completed provider call is metered for its user and its tenant
+(``X-Tenant-ID``, ``DEFAULT_TENANT`` when absent):
+
+* Ledger - one :class:`UsageEvent` row per call, buffered in memory and
+  inserted in batches every ``METERING_FLUSH_INTERVAL`` seconds (or once
+  ``METERING_BATCH_SIZE`` events are waiting). Rows are never updated.
+* Rollups - hourly and daily :class:`UsageRollup` totals per subject,
+  accumulated in memory and added to the table by the same flush. Usage
+  endpoints read rollups (plus what is not flushed yet) instead of
+  scanning ``messages``.
+* Quotas - per-minute/hour/day limits on requests or tokens, checked
+  before the provider is called. Counters live in the shared state backend
+  (in-process, or Redis with several workers) as fixed windows combined
+  into a sliding estimate: ``current + previous * (1 - elapsed fraction)``.
+
+Quotas are configured as ``metric/window=limit`` lists, e.g.
+``QUOTA_USER="requests/minute=20,tokens/day=200000"`` and
+``QUOTA_TENANT="tokens/hour=2000000"``.
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from src.database import SessionLocal, Conversation, Message, UsageEvent, UsageRollup
+from .state import StateBackend
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "cached_tokens", "total_tokens")
+WINDOWS = {"minute": 60, "hour": 3600, "day": 86400}
+GRANULARITIES = ("hour", "day")
+QUOTA_METRICS = {"requests": "requests", "tokens": "total_tokens"}
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def user_subject(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def tenant_subject(tenant_id: str) -> str:
+    return f"tenant:{tenant_id}"
+
+
+@dataclass(frozen=True)
+class QuotaRule:
+    """A limit on ``metric`` (requests or tokens) per ``window`` for every user or every tenant."""
+
+    scope: str
+    metric: str
+    window: str
+    limit: int
+
+    @property
+    def seconds(self) -> int:
+        return WINDOWS[self.window]
+
+
+def parse_quotas(spec: str, scope: str) -> List[QuotaRule]:
+    """``"requests/minute=20,tokens/day=200000"`` -> rules; unknown metrics or windows raise ``ValueError``."""
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            name, limit = item.split("=")
+            metric, window = name.strip().split("/")
+            rule = QuotaRule(scope=scope, metric=metric, window=window, limit=int(limit))
+        except ValueError:
+            raise ValueError(f"Invalid quota {item!r}; expected metric/window=limit") from None
+        if metric not in QUOTA_METRICS or window not in WINDOWS:
+            raise ValueError(f"Invalid quota {item!r}; metrics: {', '.join(QUOTA_METRICS)}, windows: {', '.join(WINDOWS)}")
+        rules.append(rule)
+    return rules
+
+
+class QuotaExceeded(Exception):
+    """Raised before the provider call when a subject is over one of its quotas."""
+
+    def __init__(self, subject: str, rule: QuotaRule, used: float, retry_after: int):
+        super().__init__(f"Quota exceeded for {subject}: {rule.metric}/{rule.window} limit {rule.limit}")
+        self.subject = subject
+        self.rule = rule
+        self.used = used
+        self.retry_after = retry_after
+
+    def to_detail(self) -> Dict[str, Any]:
+        return {
+            "error": "quota_exceeded",
+            "subject": self.subject,
+            "metric": self.rule.metric,
+            "window": self.rule.window,
+            "limit": self.rule.limit,
+            "used": int(self.used),
+        }
+
+
+class UsageMeter:
+    """Batched ledger, in-memory rollups and quota checks."""
+
+    def __init__(
+        self,
+        state: StateBackend,
+        quotas: Optional[List[QuotaRule]] = None,
+        flush_interval: float = 5.0,
+        batch_size: int = 500,
+        max_pending: int = 50_000,
+        default_tenant: str = "default",
+    ):
+        self.state = state
+        self.quotas = quotas or []
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.default_tenant = default_tenant
+        self._events: List[Dict[str, Any]] = []
+        # (subject, granularity, bucket) -> counters not flushed yet
+        self._rollups: Dict[Tuple[str, str, datetime], List[int]] = defaultdict(lambda: [0] * len(COUNTERS))
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flush_failures = 0
+
+    @classmethod
+    def from_env(cls, state: StateBackend) -> "UsageMeter":
+        quotas = parse_quotas(os.getenv("QUOTA_USER", ""), "user") + parse_quotas(os.getenv("QUOTA_TENANT", ""), "tenant")
+        return cls(
+            state,
+            quotas=quotas,
+            flush_interval=float(os.getenv("METERING_FLUSH_INTERVAL", 5)),
+            batch_size=int(os.getenv("METERING_BATCH_SIZE", 500)),
+            max_pending=int(os.getenv("METERING_MAX_PENDING", 50_000)),
+            default_tenant=os.getenv("DEFAULT_TENANT", "default"),
+        )
+
+    def tenant(self, tenant_id: Optional[str]) -> str:
+        return tenant_id or self.default_tenant
+
+    def _subjects(self, tenant_id: str, user_id: Optional[str]) -> Dict[str, str]:
+        subjects = {"tenant": tenant_subject(tenant_id)}
+        if user_id:
+            subjects["user"] = user_subject(user_id)
+        return subjects
+
+    # -- Quotas -----------------------------------------------------------
+
+    def _keys(self, subject: str, rule: QuotaRule, now: float) -> Tuple[str, str, float]:
+        """Counter keys of the current and previous window, and the elapsed fraction of the current one."""
+        index, elapsed = divmod(now, rule.seconds)
+        base = f"quota:{subject}:{QUOTA_METRICS[rule.metric]}:{rule.window}"
+        return f"{base}:{int(index)}", f"{base}:{int(index) - 1}", elapsed / rule.seconds
+
+    async def _estimate(self, current_key: str, previous_key: str, fraction: float, current: Optional[int] = None) -> float:
+        if current is None:
+            current = int(await self.state.get(current_key) or 0)
+        previous = int(await self.state.get(previous_key) or 0)
+        return current + previous * (1 - fraction)
+
+    async def admit(self, tenant_id: Optional[str], user_id: Optional[str], requests: int = 1):
+        """Check every quota of the request's user and tenant; raises :class:`QuotaExceeded`.
+
+        Request quotas reserve ``requests`` slots (one per provider call the
+        request makes; released again on rejection), so a burst of concurrent
+        requests cannot all pass the same check.
+        """
+        subjects = self._subjects(self.tenant(tenant_id), user_id)
+        now = time.time()
+        reserved: List[str] = []
+        try:
+            for rule in self.quotas:
+                subject = subjects.get(rule.scope)
+                if subject is None:
+                    continue
+                current_key, previous_key, fraction = self._keys(subject, rule, now)
+                if rule.metric == "requests":
+                    current = await self.state.incr(current_key, requests, ttl=rule.seconds * 2)
+                    reserved.append(current_key)
+                    used = await self._estimate(current_key, previous_key, fraction, current)
+                    over = used > rule.limit
+                else:
+                    used = await self._estimate(current_key, previous_key, fraction)
+                    over = used >= rule.limit
+                if over:
+                    self.rejected += 1
+                    retry_after = max(1, int(rule.seconds * (1 - fraction)) + 1)
+                    raise QuotaExceeded(subject, rule, used, retry_after)
+        except QuotaExceeded:
+            for key in reserved:
+                await self.state.incr(key, -requests)
+            raise
+
+    async def quota_status(self, tenant_id: Optional[str], user_id: Optional[str]) -> List[Dict[str, Any]]:
+        """Current sliding-window usage against every applicable quota."""
+        subjects = self._subjects(self.tenant(tenant_id), user_id)
+        now = time.time()
+        status = []
+        for rule in self.quotas:
+            subject = subjects.get(rule.scope)
+            if subject is None:
+                continue
+            current_key, previous_key, fraction = self._keys(subject, rule, now)
+            used = await self._estimate(current_key, previous_key, fraction)
+            status.append({
+                "subject": subject,
+                "metric": rule.metric,
+                "window": rule.window,
+                "limit": rule.limit,
+                "used": int(used),
+                "remaining": max(0, rule.limit - int(used)),
+            })
+        return status
+
+    # -- Recording --------------------------------------------------------
+
+    async def record(
+        self,
+        tenant_id: Optional[str],
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        provider: Optional[str],
+        usage,
+    ):
+        """Meter one completed provider call (``usage`` is a ``TokenUsage``)."""
+        tenant_id = self.tenant(tenant_id)
+        now = datetime.utcnow()
+        values = (1, usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens, usage.total_tokens)
+        subjects = self._subjects(tenant_id, user_id)
+        with self._lock:
+            if len(self._events) >= self.max_pending:
+                # The database has been unreachable for a while; keep the newest events.
+                self._events.pop(0)
+                self.dropped += 1
+            self._events.append({
+                "tenant_id": tenant_id,
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "provider": provider,
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "cached_tokens": usage.cached_tokens,
+                "total_tokens": usage.total_tokens,
+                "created_at": now,
+            })
+            for subject in subjects.values():
+                for granularity in GRANULARITIES:
+                    counters = self._rollups[(subject, granularity, bucket_start(now, granularity))]
+                    for i, value in enumerate(values):
+                        counters[i] += value
+            pending = len(self._events)
+        self.recorded += 1
+
+        now_ts = time.time()
+        for rule in self.quotas:
+            subject = subjects.get(rule.scope)
+            if subject is not None and rule.metric == "tokens" and usage.total_tokens:
+                current_key, _, _ = self._keys(subject, rule, now_ts)
+                await self.state.incr(current_key, usage.total_tokens, ttl=rule.seconds * 2)
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write buffered events and rollup increments in one transaction; returns the events written."""
+        with self._lock:
+            events, self._events = self._events, []
+            rollups, self._rollups = self._rollups, defaultdict(lambda: [0] * len(COUNTERS))
+        if not events and not rollups:
+            return 0
+        db = SessionLocal()
+        try:
+            if events:
+                db.execute(insert(UsageEvent), events)
+            _add_rollups(db, rollups)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.flush_failures += 1
+            # Put everything back in front of what arrived meanwhile; retried on the next flush.
+            with self._lock:
+                self._events[:0] = events
+                for key, counters in rollups.items():
+                    merged = self._rollups[key]
+                    for i, value in enumerate(counters):
+                        merged[i] += value
+            raise
+        finally:
+            db.close()
+        self.flushed += len(events)
+        return len(events)
+
+    async def run_forever(self):
+        """Flush every ``flush_interval`` seconds, or early once a batch is full."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error("Usage flush failed (%d events pending): %s", len(self._events), e)
+
+    # -- Reading ----------------------------------------------------------
+
+    def usage(self, db: Session, subject: str, since: datetime, granularity: str = "day") -> List[Dict[str, Any]]:
+        """Per-bucket totals of ``subject`` from ``since``: flushed rollups plus pending increments."""
+        start = bucket_start(since, granularity)
+        columns = [getattr(UsageRollup, name) for name in COUNTERS]
+        totals: Dict[datetime, List[int]] = defaultdict(lambda: [0] * len(COUNTERS))
+        rows = db.execute(
+            select(UsageRollup.bucket, *columns).where(
+                UsageRollup.subject == subject,
+                UsageRollup.granularity == granularity,
+                UsageRollup.bucket >= start,
+            )
+        ).all()
+        for bucket, *values in rows:
+            totals[bucket] = list(values)
+        with self._lock:
+            pending = [(key[2], counters[:]) for key, counters in self._rollups.items() if key[0] == subject and key[1] == granularity]
+        for bucket, counters in pending:
+            if bucket >= start:
+                merged = totals[bucket]
+                for i, value in enumerate(counters):
+                    merged[i] += value
+        return [{"bucket": bucket, **dict(zip(COUNTERS, values))} for bucket, values in sorted(totals.items())]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "pending": len(self._events),
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "flush_failures": self.flush_failures,
+            "quotas": [f"{rule.scope}:{rule.metric}/{rule.window}={rule.limit}" for rule in self.quotas],
+        }
+
+
+def _add_rollups(db: Session, rollups: Dict[Tuple[str, str, datetime], List[int]]):
+    """Upsert that adds to existing buckets (several workers flush into the same rows)."""
+    if not rollups:
+        return
+    rows = [
+        {"subject": subject, "granularity": granularity, "bucket": bucket, **dict(zip(COUNTERS, counters))}
+        for (subject, granularity, bucket), counters in rollups.items()
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(UsageRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["subject", "granularity", "bucket"],
+            set_={name: getattr(UsageRollup, name) + getattr(stmt.excluded, name) for name in COUNTERS},
+        )
+    else:
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(UsageRollup)
+        stmt = stmt.on_duplicate_key_update({name: getattr(UsageRollup, name) + getattr(stmt.inserted, name) for name in COUNTERS})
+    db.execute(stmt, rows)
+
+
+def backfill(db: Session, tenant_id: str = "default") -> int:
+    """Add rollups for messages older than the first ledger event (run once after upgrading).
+
+    Returns the number of messages counted. Messages have no tenant, so
+    they are attributed to ``tenant_id``.
+    """
+    first_event = db.execute(select(func.min(UsageEvent.created_at))).scalar()
+    query = select(
+        Conversation.user_id,
+        Message.created_at,
+        func.coalesce(Message.prompt_tokens, 0),
+        func.coalesce(Message.completion_tokens, 0),
+        func.coalesce(Message.cached_tokens, 0),
+        func.coalesce(Message.tokens_used, 0),
+    ).join(Conversation, Conversation.id == Message.conversation_id)
+    if first_event is not None:
+        query = query.where(Message.created_at < first_event)
+    rows = db.execute(query)
+    rollups: Dict[Tuple[str, str, datetime], List[int]] = defaultdict(lambda: [0] * len(COUNTERS))
+    count = 0
+    for user_id, created_at, *tokens in rows:
+        subjects = [tenant_subject(tenant_id)] + ([user_subject(user_id)] if user_id else [])
+        for subject in subjects:
+            for granularity in GRANULARITIES:
+                counters = rollups[(subject, granularity, bucket_start(created_at, granularity))]
+                counters[0] += 1
+                for i, value in enumerate(tokens, start=1):
+                    counters[i] += value
+        count += 1
+    _add_rollups(db, rollups)
+    db.commit()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Usage metering maintenance.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Build rollups from messages recorded before metering (run once)")
+    backfill_parser.add_argument("--tenant-id", default=os.getenv("DEFAULT_TENANT", "default"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from src.database import init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        count = backfill(db, args.tenant_id)
+        logger.info("Backfilled usage of %d messages in %.1fs", count, time.perf_counter() - started)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
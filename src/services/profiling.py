@@ -0,0 +1,326 @@
+"""Sampling profiler and slow-request capture.
+
+A background thread samples the Python stack of every thread in the worker
+(``sys._current_frames``) every ``PROFILE_INTERVAL_MS``, but only while
+something needs the samples: an on-demand profile or an in-flight request.
+Threads waiting on I/O, locks or queues are skipped as idle. Samples are
+aggregated into collapsed stacks (``frame;frame;frame count``, the input of
+``flamegraph.pl`` and speedscope) or a d3-flame-graph JSON tree.
+
+Requests slower than ``SLOW_REQUEST_MS`` are kept in a ring buffer of
+``SLOW_REQUEST_BUFFER`` entries with the stacks sampled from their threads
+while they ran and the SQL statements they executed. Streaming responses are
+not captured: their duration is the model's, which ``llm.stream`` spans
+already measure. Samples come from threads, not tasks, so requests running
+concurrently on the same event loop show up in each other's profiles.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from src.services.logs import request_id_var
+from src.services.tracing import current_trace_id
+
+logger = logging.getLogger(__name__)
+
+Stack = Tuple[Any, ...]  # code objects, outermost first
+
+# Leaf frames of threads that are waiting rather than running.
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("handlers.py", "dequeue"),
+}
+MAX_STATEMENT_CHARS = 1000
+
+
+@lru_cache(maxsize=8192)
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(leaf) -> bool:
+    return (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES
+
+
+def fold(stacks: List[Stack]) -> Dict[str, int]:
+    """Count identical stacks as ``root;...;leaf`` lines."""
+    return dict(Counter(";".join(frame_label(code) for code in stack) for stack in stacks))
+
+
+def to_collapsed(folded: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(folded.items()))
+
+
+def to_tree(folded: Dict[str, int]) -> Dict[str, Any]:
+    """d3-flame-graph format: ``{"name", "value", "children"}`` with inclusive sample counts."""
+    root: Dict[str, Any] = {"name": "root", "value": 0, "children": {}}
+    for stack, count in folded.items():
+        node = root
+        node["value"] += count
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"name": label, "value": 0, "children": {}})
+            node["value"] += count
+
+    def finish(node):
+        node["children"] = sorted((finish(child) for child in node["children"].values()), key=lambda n: -n["value"])
+        return node
+
+    return finish(root)
+
+
+class StackSampler:
+    """Samples thread stacks from a daemon thread while at least one user holds it."""
+
+    def __init__(self, interval: float = 0.01, history: float = 30.0):
+        self.interval = interval
+        # One entry per tick: (time, [(thread id, stack), ...]).
+        self._ticks: Deque[Tuple[float, List[Tuple[int, Stack]]]] = deque(maxlen=max(1, int(history / interval)))
+        # On-demand profiles in progress: (samples, include idle threads).
+        self._recorders: List[Tuple[List[Stack], bool]] = []
+        self._users = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                self._wake.clear()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self.sample_once()
+            time.sleep(self.interval)
+
+    def sample_once(self):
+        """Record the current stack of every other thread."""
+        own = threading.get_ident()
+        tick: List[Tuple[int, Stack]] = []
+        idle: List[Tuple[int, Stack]] = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if not codes:
+                continue
+            entry = (ident, tuple(reversed(codes)))
+            (idle if _is_idle(codes[0]) else tick).append(entry)
+        self._ticks.append((time.perf_counter(), tick))
+        for samples, include_idle in list(self._recorders):
+            samples.extend(stack for _, stack in tick)
+            if include_idle:
+                samples.extend(stack for _, stack in idle)
+        self.samples += 1
+
+    def window(self, start: float, end: float, threads: Set[int]) -> Tuple[List[Stack], bool]:
+        """Stacks of ``threads`` sampled between ``start`` and ``end``, and whether older ones were evicted."""
+        ticks = list(self._ticks)
+        truncated = bool(ticks) and len(ticks) == self._ticks.maxlen and ticks[0][0] > start
+        stacks = [stack for ts, tick in ticks if start <= ts <= end for ident, stack in tick if ident in threads]
+        return stacks, truncated
+
+    async def profile(self, seconds: float, include_idle: bool = False) -> List[Stack]:
+        """Sample every thread for ``seconds``."""
+        recorder: Tuple[List[Stack], bool] = ([], include_idle)
+        self._recorders.append(recorder)
+        self.acquire()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.release()
+            self._recorders.remove(recorder)
+        return recorder[0]
+
+
+@dataclass
+class RequestCapture:
+    """Per-request state collected while the request runs."""
+
+    threads: Set[int] = field(default_factory=set)
+    queries: List[Dict[str, Any]] = field(default_factory=list)
+    dropped_queries: int = 0
+    max_queries: int = 200
+    streaming: bool = False
+    status: Optional[int] = None
+
+
+_capture_var: contextvars.ContextVar[Optional[RequestCapture]] = contextvars.ContextVar("request_capture", default=None)
+
+
+class Profiler:
+    """On-demand profiles and a bounded log of slow requests."""
+
+    def __init__(
+        self,
+        interval: float = 0.01,
+        slow_threshold_ms: float = 2000,
+        capacity: int = 50,
+        max_queries: int = 200,
+        history: float = 30.0,
+    ):
+        self.sampler = StackSampler(interval=interval, history=history)
+        self.slow_threshold_ms = slow_threshold_ms
+        self.max_queries = max_queries
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.captured = 0
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        return cls(
+            interval=float(os.getenv("PROFILE_INTERVAL_MS", 10)) / 1000,
+            slow_threshold_ms=float(os.getenv("SLOW_REQUEST_MS", 2000)),
+            capacity=int(os.getenv("SLOW_REQUEST_BUFFER", 50)),
+            max_queries=int(os.getenv("SLOW_REQUEST_MAX_QUERIES", 200)),
+            history=float(os.getenv("PROFILE_HISTORY_SECONDS", 30)),
+        )
+
+    @property
+    def capture_enabled(self) -> bool:
+        return self.slow_threshold_ms > 0
+
+    def record_slow(self, scope, capture: RequestCapture, start: float, end: float):
+        stacks, truncated = self.sampler.window(start, end, capture.threads)
+        route = scope.get("route")
+        duration_ms = (end - start) * 1000
+        entry = {
+            "id": uuid.uuid4().hex[:16],
+            "started_at": datetime.fromtimestamp(time.time() - (time.perf_counter() - start), timezone.utc).isoformat(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(route, "path", None),
+            "status": capture.status,
+            "duration_ms": round(duration_ms, 2),
+            "request_id": request_id_var.get(),
+            "trace_id": current_trace_id(),
+            "query_count": len(capture.queries) + capture.dropped_queries,
+            "query_time_ms": round(sum(q["duration_ms"] for q in capture.queries), 2),
+            "queries": capture.queries,
+            "dropped_queries": capture.dropped_queries,
+            "samples": len(stacks),
+            "profile_truncated": truncated,
+            "stacks": fold(stacks),
+        }
+        self._slow.append(entry)
+        self.captured += 1
+        logger.warning(
+            "Slow request %s %s took %.0f ms (%d queries)", entry["method"], entry["path"], duration_ms, entry["query_count"],
+            extra={"slow_request_id": entry["id"]},
+        )
+
+    def slow_requests(self) -> List[Dict[str, Any]]:
+        """Summaries of captured requests, newest first."""
+        detail_only = {"queries", "stacks"}
+        return [{k: v for k, v in entry.items() if k not in detail_only} for entry in reversed(self._slow)]
+
+    def slow_request(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        for entry in self._slow:
+            if entry["id"] == capture_id:
+                return entry
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": self.sampler.interval * 1000,
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "samples": self.sampler.samples,
+            "captured": self.captured,
+            "buffered": len(self._slow),
+            "capacity": self._slow.maxlen,
+        }
+
+
+def instrument_queries(engine):
+    """Log statements (not parameters) and their duration into the current request's capture."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if _capture_var.get() is not None and context is not None:
+            context._capture_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        capture = _capture_var.get()
+        started = getattr(context, "_capture_start", None)
+        if capture is None or started is None:
+            return
+        # Sync routes and DB calls run in worker threads; sample those too.
+        capture.threads.add(threading.get_ident())
+        if len(capture.queries) >= capture.max_queries:
+            capture.dropped_queries += 1
+            return
+        capture.queries.append({
+            "statement": statement[:MAX_STATEMENT_CHARS],
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "rowcount": cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None,
+        })
+
+
+class SlowRequestMiddleware:
+    """ASGI middleware: keep requests slower than the threshold with their profile and query log."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.capture_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        capture = RequestCapture(threads={threading.get_ident()}, max_queries=self.profiler.max_queries)
+        token = _capture_var.set(capture)
+        sampler = self.profiler.sampler
+        sampling = True
+
+        async def send_with_capture(message):
+            nonlocal sampling
+            if message["type"] == "http.response.start":
+                capture.status = message["status"]
+                for key, value in message.get("headers", []):
+                    if key.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        capture.streaming = True
+                if capture.streaming and sampling:
+                    # Streams are never captured; an open one must not keep the sampler running.
+                    sampling = False
+                    sampler.release()
+            await send(message)
+
+        sampler.acquire()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_capture)
+        finally:
+            end = time.perf_counter()
+            if sampling:
+                sampler.release()
+            _capture_var.reset(token)
+            if not capture.streaming and (end - start) * 1000 >= self.profiler.slow_threshold_ms:
+                self.profiler.record_slow(scope, capture, start, end)
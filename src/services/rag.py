@@ -0,0 +1,247 @@
+"""Retrieval-augmented generation: document ingestion, chunking and top-k retrieval.
+
+Ingest documents into an index directory:
+
+    python -m src.services.rag ingest docs/ handbook.md --index-dir data/rag
+
+Set ``RAG_INDEX_DIR`` to that directory to inject the most relevant chunks
+into every prompt.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Iterable, Iterator, Optional, Dict, Any, Tuple
+
+import numpy as np
+
+from .embeddings import Embedder, create_embedder
+from .vector_index import VectorIndex, build_index, load_index
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_SUFFIXES = {".txt", ".md", ".rst"}
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class RetrievedChunk:
+    """A chunk returned by the retriever."""
+    id: str
+    source: str
+    text: str
+    score: float
+
+
+def chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
+    """Split text into chunks of about ``chunk_size`` characters.
+
+    Paragraph and sentence boundaries are preferred; consecutive chunks share
+    ``overlap`` trailing characters so facts on a boundary stay retrievable.
+    """
+    pieces: List[str] = []
+    for paragraph in _PARAGRAPH_SPLIT.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= chunk_size:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_SPLIT.split(paragraph):
+            # Hard-wrap sentences that alone exceed the chunk size.
+            pieces.extend(sentence[i:i + chunk_size] for i in range(0, len(sentence), chunk_size))
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > chunk_size:
+            chunks.append(current)
+            current = current[-overlap:] + " " + piece if overlap else piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """Yield ``(source, text)`` for every supported file under ``paths``."""
+    for path in map(Path, paths):
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            if file.suffix.lower() in DOCUMENT_SUFFIXES:
+                yield str(file), file.read_text(encoding="utf-8", errors="replace")
+
+
+async def ingest(
+    paths: Iterable[str],
+    index_dir: str,
+    embedder: Embedder,
+    chunk_size: int = 800,
+    overlap: int = 100,
+    batch_size: int = 64,
+) -> int:
+    """Chunk, embed and index documents into ``index_dir``; returns the chunk count.
+
+    Chunk texts go to ``chunks.jsonl`` with a memory-mapped offset table, so
+    retrieval reads only the ``k`` lines it returns.
+    """
+    directory = Path(index_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    offsets: List[int] = []
+    vectors: List[np.ndarray] = []
+    batch: List[str] = []
+
+    with open(directory / "chunks.jsonl", "wb") as out:
+        for source, text in iter_documents(paths):
+            for chunk in chunk_text(text, chunk_size, overlap):
+                offsets.append(out.tell())
+                out.write(json.dumps({"source": source, "text": chunk}, ensure_ascii=False).encode() + b"\n")
+                batch.append(chunk)
+                if len(batch) == batch_size:
+                    vectors.append(await embedder.embed(batch))
+                    batch = []
+    if batch:
+        vectors.append(await embedder.embed(batch))
+
+    matrix = np.vstack(vectors) if vectors else np.empty((0, embedder.dimension), dtype=np.float32)
+    np.save(directory / "chunk_offsets.npy", np.asarray(offsets, dtype=np.int64))
+    index = build_index([str(i) for i in range(len(offsets))], matrix,
+                        ivf_threshold=int(os.getenv("RAG_IVF_THRESHOLD", 20_000)))
+    index.save(directory)
+    (directory / "manifest.json").write_text(json.dumps({
+        "embedder": embedder.name,
+        "dimension": embedder.dimension,
+        "chunks": len(offsets),
+        "index": index.kind,
+    }))
+    logger.info("Ingested %s chunks into %s (%s index)", len(offsets), directory, index.kind)
+    return len(offsets)
+
+
+class Retriever:
+    """Top-k retrieval over an ingested index, loaded lazily on first use."""
+
+    def __init__(self, index_dir: str, embedder: Embedder, top_k: int = 4, min_score: float = 0.2):
+        self.index_dir = Path(index_dir)
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self._index: Optional[VectorIndex] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._latencies_ms: deque = deque(maxlen=1000)
+        self._queries = 0
+        self._embed_ms = 0.0
+        self._search_ms = 0.0
+
+    @classmethod
+    def from_env(cls, embedder: Optional[Embedder] = None) -> Optional["Retriever"]:
+        index_dir = os.getenv("RAG_INDEX_DIR")
+        if not index_dir:
+            return None
+        return cls(
+            index_dir,
+            embedder or create_embedder(),
+            top_k=int(os.getenv("RAG_TOP_K", 4)),
+            min_score=float(os.getenv("RAG_MIN_SCORE", 0.2)),
+        )
+
+    def _ensure_loaded(self) -> Optional[VectorIndex]:
+        if self._loaded:
+            return self._index
+        with self._lock:
+            if not self._loaded:
+                index = load_index(self.index_dir)
+                if index is not None and index.dimension != self.embedder.dimension:
+                    logger.error(
+                        "RAG index dimension %d does not match embedder dimension %d; retrieval disabled",
+                        index.dimension,
+                        self.embedder.dimension,
+                    )
+                    index = None
+                if index is not None:
+                    self._offsets = np.load(self.index_dir / "chunk_offsets.npy", mmap_mode="r")
+                    logger.info("Loaded RAG index with %s chunks from %s", len(index), self.index_dir)
+                self._index = index
+                self._loaded = True
+        return self._index
+
+    def _read_chunks(self, hits: List[Tuple[str, float]]) -> List[RetrievedChunk]:
+        chunks = []
+        with open(self.index_dir / "chunks.jsonl", "rb") as f:
+            for chunk_id, score in hits:
+                f.seek(int(self._offsets[int(chunk_id)]))
+                record = json.loads(f.readline())
+                chunks.append(RetrievedChunk(chunk_id, record["source"], record["text"], score))
+        return chunks
+
+    def _search(self, index: VectorIndex, vector: np.ndarray, k: int) -> List[RetrievedChunk]:
+        hits = [hit for hit in index.search(vector, k) if hit[1] >= self.min_score]
+        return self._read_chunks(hits)
+
+    async def retrieve(self, query: str, k: Optional[int] = None) -> List[RetrievedChunk]:
+        # Loading, local embedding, search and chunk reads all block; keep them off the event loop.
+        index = self._index if self._loaded else await asyncio.to_thread(self._ensure_loaded)
+        if index is None or len(index) == 0:
+            return []
+        start = time.perf_counter()
+        if self.embedder.cpu_bound:
+            vector = (await asyncio.to_thread(self.embedder.embed_sync, [query]))[0]
+        else:
+            vector = await self.embedder.embed_one(query)
+        embedded = time.perf_counter()
+        chunks = await asyncio.to_thread(self._search, index, vector, k or self.top_k)
+        end = time.perf_counter()
+
+        self._queries += 1
+        self._embed_ms += (embedded - start) * 1000
+        self._search_ms += (end - embedded) * 1000
+        self._latencies_ms.append((end - start) * 1000)
+        return chunks
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3) if latencies else 0.0
+
+        return {
+            "index_dir": str(self.index_dir),
+            "loaded": self._loaded,
+            "chunks": len(self._index) if self._index is not None else 0,
+            "index": self._index.kind if self._index is not None else None,
+            "queries": self._queries,
+            "avg_embed_ms": round(self._embed_ms / self._queries, 3) if self._queries else 0.0,
+            "avg_search_ms": round(self._search_ms / self._queries, 3) if self._queries else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the RAG document index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Chunk, embed and index documents")
+    ingest_parser.add_argument("paths", nargs="+", help="Files or directories (.txt, .md, .rst)")
+    ingest_parser.add_argument("--index-dir", default=os.getenv("RAG_INDEX_DIR", "data/rag"))
+    ingest_parser.add_argument("--chunk-size", type=int, default=800)
+    ingest_parser.add_argument("--overlap", type=int, default=100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    count = asyncio.run(ingest(args.paths, args.index_dir, create_embedder(), args.chunk_size, args.overlap))
+    print(f"Indexed {count} chunks into {args.index_dir}")
+
+
+if __name__ == "__main__":
+    main()
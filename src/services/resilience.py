@@ -0,0 +1,317 @@
+"""Circuit breakers, retry budgets and typed provider errors.
+
+Every provider call goes through a :class:`CircuitBreaker` for that provider:
+after ``BREAKER_FAILURE_THRESHOLD`` consecutive infrastructure failures
+(timeouts, connection errors, 429 and 5xx responses) the breaker opens and
+calls fail immediately with :class:`CircuitOpenError` for
+``BREAKER_RECOVERY_TIME`` seconds. Then a single trial call is let through
+(half-open): success closes the breaker, failure opens it again.
+
+Failed calls are retried with jittered exponential backoff, at most
+``PROVIDER_MAX_RETRIES`` times, and only while the process-wide
+:class:`RetryBudget` allows it: retries may add at most ``RETRY_BUDGET_RATIO``
+extra load on top of first attempts, so a vendor outage does not multiply the
+traffic sent to it.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Longer waits (e.g. a rate limit's Retry-After) fail the request instead.
+MAX_RETRY_DELAY = 10.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderError(Exception):
+    """A provider call failed; ``kind`` says how, ``retryable`` whether trying again may help."""
+
+    def __init__(self, provider: str, kind: str, message: str, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.provider = provider
+        self.kind = kind
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self) -> int:
+        """HTTP status to report to our own clients."""
+        return {"circuit_open": 503, "unavailable": 503, "timeout": 504, "rate_limited": 429}.get(self.kind, 502)
+
+    def to_event(self) -> Dict[str, Any]:
+        return {
+            "type": "error",
+            "error": self.kind,
+            "provider": self.provider,
+            "content": str(self),
+            "retryable": self.retryable,
+            "retry_after": self.retry_after,
+        }
+
+
+class CircuitOpenError(ProviderError):
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(provider, "circuit_open", f"{provider} is unavailable; failing fast",
+                         retryable=True, retry_after=round(retry_after, 1))
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(provider: str, exc: BaseException) -> ProviderError:
+    """Map an SDK or network exception to a :class:`ProviderError`.
+
+    Works on names and status codes rather than SDK classes, so no provider
+    SDK has to be imported here.
+    """
+    if isinstance(exc, ProviderError):
+        return exc
+    name = type(exc).__name__
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    message = str(exc) or name
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in name or "DeadlineExceeded" in name:
+        return ProviderError(provider, "timeout", message, retryable=True)
+    if isinstance(exc, ConnectionError) or "Connection" in name or "ServiceUnavailable" in name:
+        return ProviderError(provider, "unavailable", message, retryable=True)
+    if isinstance(status, int):
+        if status == 429 or "RateLimit" in name or "ResourceExhausted" in name:
+            return ProviderError(provider, "rate_limited", message, retryable=True, retry_after=_retry_after(exc))
+        if status >= 500:
+            return ProviderError(provider, "unavailable", message, retryable=True)
+        return ProviderError(provider, "bad_request", message)
+    if "RateLimit" in name or "ResourceExhausted" in name:
+        return ProviderError(provider, "rate_limited", message, retryable=True)
+    return ProviderError(provider, "error", message)
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker counting consecutive infrastructure failures."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_time: float = 30.0, half_open_max: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.half_open_max = half_open_max
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trials = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        return cls(
+            name,
+            failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5)),
+            recovery_time=float(os.getenv("BREAKER_RECOVERY_TIME", 30)),
+        )
+
+    def allow(self):
+        """Raise :class:`CircuitOpenError` unless a call may go through now."""
+        if self.state == OPEN:
+            remaining = self.opened_at + self.recovery_time - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, remaining)
+            self.state = HALF_OPEN
+            self.trials = 0
+            logger.info("Circuit for %s half-open; sending a trial request", self.name)
+        if self.state == HALF_OPEN:
+            # A trial that never reported back (e.g. cancelled) frees its slot after recovery_time.
+            if self.trials >= self.half_open_max and time.monotonic() - self.opened_at < 2 * self.recovery_time:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_time)
+            self.trials += 1
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info("Circuit for %s closed", self.name)
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+                logger.warning("Circuit for %s opened after %s failures", self.name, self.failures)
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class RetryBudget:
+    """Caps retries at ``ratio`` of first attempts over a sliding window (plus a small floor)."""
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self.exhausted = 0
+
+    @classmethod
+    def from_env(cls) -> "RetryBudget":
+        return cls(
+            ratio=float(os.getenv("RETRY_BUDGET_RATIO", 0.2)),
+            min_per_second=float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", 1)),
+        )
+
+    def _trim(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self):
+        self._requests.append(time.monotonic())
+
+    def try_retry(self) -> bool:
+        """Withdraw one retry from the budget; False when it is spent."""
+        now = time.monotonic()
+        self._trim(now)
+        allowed = self.min_per_second * self.window + self.ratio * len(self._requests)
+        if len(self._retries) >= allowed:
+            self.exhausted += 1
+            return False
+        self._retries.append(now)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        return {
+            "window_seconds": self.window,
+            "requests": len(self._requests),
+            "retries": len(self._retries),
+            "exhausted": self.exhausted,
+        }
+
+
+# One breaker per provider and one budget for the process, shared by every caller.
+_breakers: Dict[str, CircuitBreaker] = {}
+retry_budget = RetryBudget.from_env()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    if provider not in _breakers:
+        _breakers[provider] = CircuitBreaker.from_env(provider)
+    return _breakers[provider]
+
+
+def backoff_delay(attempt: int, base: float, cap: float = MAX_RETRY_DELAY) -> float:
+    """Full-jitter exponential backoff for retry ``attempt`` (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+async def _should_retry(provider: str, exc: Exception, attempt: int, max_retries: int, backoff: float,
+                        breaker: CircuitBreaker, budget: RetryBudget) -> ProviderError:
+    """Record a failed attempt; sleeps and returns the error if it should be retried, else raises it."""
+    error = classify(provider, exc)
+    if not error.retryable:
+        # The provider answered (e.g. 400 or content filter): it is up, the request is the problem.
+        breaker.record_success()
+        raise error from exc
+    breaker.record_failure()
+    if (attempt > max_retries or breaker.state == OPEN or (error.retry_after or 0) > MAX_RETRY_DELAY
+            or not budget.try_retry()):
+        raise error from exc
+    delay = max(backoff_delay(attempt, backoff), error.retry_after or 0)
+    trace.get_current_span().add_event(
+        "retry", {"retry.attempt": attempt, "retry.delay_s": round(delay, 3), "error.type": error.kind}
+    )
+    logger.warning("%s call failed (%s); retry %s/%s in %.2fs", provider, error.kind, attempt, max_retries, delay)
+    await asyncio.sleep(delay)
+    return error
+
+
+async def call_with_retries(
+    provider: str,
+    call: Callable[[], Awaitable[T]],
+    max_retries: int = 2,
+    backoff: float = 0.5,
+    breaker: Optional[CircuitBreaker] = None,
+    budget: Optional[RetryBudget] = None,
+) -> T:
+    """Run ``call`` through the provider's breaker, retrying retryable failures."""
+    breaker = breaker or get_breaker(provider)
+    budget = budget or retry_budget
+    budget.record_request()
+    attempt = 0
+    while True:
+        breaker.allow()
+        try:
+            result = await call()
+        except Exception as e:
+            attempt += 1
+            await _should_retry(provider, e, attempt, max_retries, backoff, breaker, budget)
+            continue
+        breaker.record_success()
+        return result
+
+
+async def stream_with_retries(
+    provider: str,
+    open_stream: Callable[[], AsyncIterator[T]],
+    max_retries: int = 2,
+    backoff: float = 0.5,
+    breaker: Optional[CircuitBreaker] = None,
+    budget: Optional[RetryBudget] = None,
+) -> AsyncIterator[T]:
+    """Like :func:`call_with_retries` for streams; only retried until the first chunk arrives."""
+    breaker = breaker or get_breaker(provider)
+    budget = budget or retry_budget
+    budget.record_request()
+    attempt = 0
+    while True:
+        breaker.allow()
+        started = False
+        stream = open_stream()
+        try:
+            async for chunk in stream:
+                started = True
+                yield chunk
+        except Exception as e:
+            if started:
+                # Part of the answer is already out; a retry would repeat it.
+                breaker.record_failure()
+                raise classify(provider, e) from e
+            attempt += 1
+            await _should_retry(provider, e, attempt, max_retries, backoff, breaker, budget)
+            continue
+        finally:
+            await stream.aclose()
+        breaker.record_success()
+        return
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "breakers": {name: breaker.stats() for name, breaker in _breakers.items()},
+        "retry_budget": retry_budget.stats(),
+    }
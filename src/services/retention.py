@@ -0,0 +1,200 @@
+"""Retention policies, per-user erasure and set-based bulk deletes.
+
+Deletes never load ORM objects: each chunk of at most ``batch_size``
+conversations is removed with three ``DELETE ... WHERE ... IN`` statements
+(embeddings, messages, conversations) in its own short transaction, with a
+pause between chunks so other writers are not locked out for long.
+
+Conversations older than their owner's retention period (``RETENTION_DAYS``
+by default, or a per-user :class:`RetentionPolicy`) are purged by a scheduler
+that runs every ``RETENTION_INTERVAL`` seconds on one worker at a time.
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.orm import Session
+
+from src.database import (
+    SessionLocal, Comparison, ComparisonResult, Conversation, Message, MessageEmbedding, RetentionPolicy, UsageEvent, UsageRollup,
+)
+from .archive import Archiver
+from .state import StateBackend
+
+logger = logging.getLogger(__name__)
+
+LEADER_KEY = "retention:leader"
+
+
+def _empty_counts() -> Dict[str, int]:
+    return {"conversations": 0, "messages": 0, "embeddings": 0}
+
+
+class RetentionEngine:
+    """Chunked bulk deletes with throughput metrics."""
+
+    def __init__(
+        self,
+        default_days: int = 0,
+        batch_size: int = 500,
+        pause: float = 0.05,
+        interval: float = 3600,
+        archiver: Optional[Archiver] = None,
+    ):
+        self.default_days = default_days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.archiver = archiver
+        self.totals = _empty_counts()
+        self.seconds = 0.0
+        self.runs = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_env(cls, archiver: Optional[Archiver] = None) -> "RetentionEngine":
+        return cls(
+            default_days=int(os.getenv("RETENTION_DAYS", 0)),
+            batch_size=int(os.getenv("RETENTION_BATCH_SIZE", 500)),
+            pause=float(os.getenv("RETENTION_PAUSE", 0.05)),
+            interval=float(os.getenv("RETENTION_INTERVAL", 3600)),
+            archiver=archiver,
+        )
+
+    # -- Set-based deletes ---------------------------------------------
+
+    def delete_conversations(self, db: Session, conversation_ids: List[str]) -> Dict[str, int]:
+        """Delete conversations with their messages and embeddings in one transaction."""
+        counts = _empty_counts()
+        if not conversation_ids:
+            return counts
+        started = time.perf_counter()
+        archived = db.execute(
+            select(Conversation.id).where(Conversation.id.in_(conversation_ids), Conversation.archived_at.isnot(None))
+        ).scalars().all()
+        message_ids = select(Message.id).where(Message.conversation_id.in_(conversation_ids))
+
+        # Children are deleted explicitly: databases created before ON DELETE CASCADE
+        # was declared (SQLite cannot add it in place) still have plain foreign keys.
+        counts["embeddings"] = db.execute(
+            delete(MessageEmbedding).where(MessageEmbedding.message_id.in_(message_ids))
+        ).rowcount
+        counts["messages"] = db.execute(
+            delete(Message).where(Message.conversation_id.in_(conversation_ids))
+        ).rowcount
+        counts["conversations"] = db.execute(
+            delete(Conversation).where(Conversation.id.in_(conversation_ids))
+        ).rowcount
+        db.commit()
+
+        if self.archiver is not None:
+            for conversation_id in archived:
+                self.archiver.discard(conversation_id)
+        for key, value in counts.items():
+            self.totals[key] += value
+        self.seconds += time.perf_counter() - started
+        return counts
+
+    def _purge(self, db: Session, condition) -> Dict[str, int]:
+        """Delete every conversation matching ``condition``, one chunk per transaction."""
+        counts = _empty_counts()
+        started = time.perf_counter()
+        while True:
+            ids = db.execute(
+                select(Conversation.id).where(condition).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            for key, value in self.delete_conversations(db, ids).items():
+                counts[key] += value
+            if len(ids) < self.batch_size:
+                break
+            time.sleep(self.pause)
+        self._record(counts, time.perf_counter() - started)
+        return counts
+
+    def _record(self, counts: Dict[str, int], seconds: float):
+        rows = sum(counts.values())
+        self.last_run = {
+            **counts,
+            "finished_at": datetime.utcnow().isoformat(),
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(rows / seconds) if seconds > 0 else 0,
+        }
+
+    def erase_user(self, db: Session, user_id: str) -> Dict[str, int]:
+        """Remove everything stored for ``user_id`` (right to erasure)."""
+        counts = self._purge(db, Conversation.user_id == user_id)
+        # Embeddings are keyed by user too; catch any left behind by earlier partial deletes.
+        leftover = db.execute(delete(MessageEmbedding).where(MessageEmbedding.user_id == user_id)).rowcount
+        counts["embeddings"] += leftover
+        self.totals["embeddings"] += leftover
+        db.execute(delete(RetentionPolicy).where(RetentionPolicy.user_id == user_id))
+        # Metered usage names the user; tenant rollups keep only aggregate counts.
+        db.execute(delete(UsageEvent).where(UsageEvent.user_id == user_id))
+        db.execute(delete(UsageRollup).where(UsageRollup.subject == f"user:{user_id}"))
+        comparisons = select(Comparison.id).where(Comparison.user_id == user_id)
+        db.execute(delete(ComparisonResult).where(ComparisonResult.comparison_id.in_(comparisons)))
+        db.execute(delete(Comparison).where(Comparison.user_id == user_id))
+        db.commit()
+        logger.info("Erased data of user %s: %s", user_id, counts)
+        return counts
+
+    def apply_policies(self, db: Session) -> Dict[str, int]:
+        """Purge conversations older than their owner's retention period."""
+        counts = _empty_counts()
+        now = datetime.utcnow()
+        policies = db.execute(select(RetentionPolicy.user_id, RetentionPolicy.days)).all()
+        for user_id, days in policies:
+            purged = self._purge(db, (Conversation.user_id == user_id) & (Conversation.updated_at < now - timedelta(days=days)))
+            for key, value in purged.items():
+                counts[key] += value
+        if self.default_days > 0:
+            without_policy = or_(
+                Conversation.user_id.is_(None),
+                Conversation.user_id.notin_(select(RetentionPolicy.user_id)),
+            )
+            purged = self._purge(db, without_policy & (Conversation.updated_at < now - timedelta(days=self.default_days)))
+            for key, value in purged.items():
+                counts[key] += value
+        self.runs += 1
+        if any(counts.values()):
+            logger.info("Retention purged %s", counts)
+        return counts
+
+    # -- Scheduler -----------------------------------------------------
+
+    def _apply_in_session(self) -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            return self.apply_policies(db)
+        finally:
+            db.close()
+
+    async def run_forever(self, state: StateBackend):
+        """Apply policies every ``interval`` seconds; one worker per interval does the work."""
+        while True:
+            try:
+                # The first worker to bump the counter in this interval is the leader.
+                if await state.incr(LEADER_KEY, ttl=self.interval * 0.9) == 1:
+                    await asyncio.to_thread(self._apply_in_session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Retention run failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        rows = sum(self.totals.values())
+        return {
+            "default_days": self.default_days,
+            "batch_size": self.batch_size,
+            "runs": self.runs,
+            "deleted": dict(self.totals),
+            "rows_per_second": round(rows / self.seconds) if self.seconds > 0 else 0,
+            "last_run": self.last_run,
+        }
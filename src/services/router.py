@@ -0,0 +1,143 @@
+"""Cost- and complexity-based model routing."""
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import List, Tuple, Optional, Dict, Any
+
+LIGHT = "light"
+HEAVY = "heavy"
+PINNED = "pinned"
+
+# Phrases that usually ask for reasoning, long-form output or code.
+_HEAVY_PATTERN = re.compile(
+    r"\b(analy[sz]e|analise|explain why|explique|step by step|passo a passo|compare|"
+    r"prove|proof|derive|debug|refactor|implement|architecture|arquitetura|optimi[sz]e|"
+    r"otimiz|write (a |the )?(code|function|program|essay|report)|escreva)",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Route:
+    """Routing decision for a single request."""
+    name: str
+    model: str
+
+
+class RouteStats:
+    """Running latency and token counters for a route."""
+
+    __slots__ = ("requests", "errors", "total_latency", "max_latency", "total_tokens")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_tokens = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        completed = self.requests - self.errors
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_latency_ms": round(self.total_latency / self.requests * 1000, 2) if self.requests else 0.0,
+            "max_latency_ms": round(self.max_latency * 1000, 2),
+            "total_tokens": self.total_tokens,
+            "avg_tokens": round(self.total_tokens / completed, 1) if completed else 0.0,
+        }
+
+
+class ModelRouter:
+    """Send easy prompts to a cheap model and hard ones to the default (big) model.
+
+    Classification is a weighted score over prompt length, history size and
+    keyword/code heuristics, so it costs microseconds per request. Routing is
+    disabled (everything goes to ``heavy_model``) when no light model is set.
+    """
+
+    def __init__(
+        self,
+        heavy_model: str,
+        light_model: Optional[str] = None,
+        max_light_chars: int = 400,
+        max_light_history: int = 6,
+        threshold: int = 2,
+    ):
+        self.heavy_model = heavy_model
+        self.light_model = light_model
+        self.max_light_chars = max_light_chars
+        self.max_light_history = max_light_history
+        self.threshold = threshold
+        self._stats: Dict[str, Dict[str, RouteStats]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, env_prefix: str, default_model: str) -> "ModelRouter":
+        return cls(
+            heavy_model=default_model,
+            light_model=os.getenv(f"{env_prefix}_LIGHT_MODEL") or None,
+            max_light_chars=int(os.getenv("ROUTER_MAX_LIGHT_CHARS", 400)),
+            max_light_history=int(os.getenv("ROUTER_MAX_LIGHT_HISTORY", 6)),
+            threshold=int(os.getenv("ROUTER_THRESHOLD", 2)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.light_model) and self.light_model != self.heavy_model
+
+    def score(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> int:
+        """Complexity score; higher means the prompt needs a stronger model."""
+        score = 0
+        if len(prompt) > self.max_light_chars:
+            score += 2
+        elif len(prompt) > self.max_light_chars // 2:
+            score += 1
+        if len(conversation_history) > self.max_light_history:
+            score += 1
+        if "```" in prompt or "\n    " in prompt:
+            score += 2
+        if _HEAVY_PATTERN.search(prompt):
+            score += 2
+        if prompt.count("?") > 1:
+            score += 1
+        return score
+
+    def classify(self, prompt: str, conversation_history: List[Tuple[str, str]]) -> str:
+        if not self.enabled:
+            return HEAVY
+        return HEAVY if self.score(prompt, conversation_history) >= self.threshold else LIGHT
+
+    def select(
+        self, prompt: str, conversation_history: List[Tuple[str, str]], model: Optional[str] = None
+    ) -> Route:
+        if model:
+            return Route(PINNED, model)
+        name = self.classify(prompt, conversation_history)
+        return Route(name, self.light_model if name == LIGHT else self.heavy_model)
+
+    def record(self, route: Route, latency: float, tokens: int = 0, error: bool = False):
+        with self._lock:
+            stats = self._stats.setdefault(route.name, {}).get(route.model)
+            if stats is None:
+                stats = self._stats[route.name][route.model] = RouteStats()
+            stats.requests += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            stats.total_tokens += tokens
+            if error:
+                stats.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {
+                name: {model: s.to_dict() for model, s in models.items()}
+                for name, models in self._stats.items()
+            }
+        return {
+            "enabled": self.enabled,
+            "light_model": self.light_model,
+            "heavy_model": self.heavy_model,
+            "routes": routes,
+        }
@@ -0,0 +1,106 @@
+"""Ranked full-text search over stored messages."""
+import re
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.database.fts import SEARCH_LANGUAGE, postgres_document
+
+_TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+
+
+class SearchUnsupported(ValueError):
+    """The database dialect has no full-text search implementation here."""
+
+
+def build_fts5_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 expression.
+
+    Every term is quoted so user input can never be parsed as FTS5 syntax;
+    terms are ANDed and the last one is a prefix match (search-as-you-type).
+    """
+    terms = _TERM_PATTERN.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_messages(
+    db: Session,
+    query: str,
+    user_id: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """Return messages matching ``query``, best match first, with highlighted snippets."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return _search_sqlite(db, query, user_id, limit, offset)
+    if dialect == "postgresql":
+        return _search_postgres(db, query, user_id, limit, offset)
+    raise SearchUnsupported(f"Full-text search is not supported on {dialect}")
+
+
+def _search_sqlite(db: Session, query: str, user_id: Optional[str], limit: int, offset: int):
+    match = build_fts5_query(query)
+    if match is None:
+        return []
+    user_filter = "AND c.user_id = :user_id" if user_id else ""
+    # `rank` is bm25 by default and lets FTS5 sort inside the index.
+    sql = text(f"""
+        SELECT m.id, m.conversation_id, c.title, m.created_at,
+               snippet(messages_fts, -1, :open, :close, '…', 16) AS snippet,
+               messages_fts.rank AS rank
+        FROM messages_fts
+        JOIN messages m ON m.rowid = messages_fts.rowid
+        JOIN conversations c ON c.id = m.conversation_id
+        WHERE messages_fts MATCH :match {user_filter}
+        ORDER BY messages_fts.rank
+        LIMIT :limit OFFSET :offset
+    """)
+    rows = db.execute(sql, {
+        "match": match, "user_id": user_id, "limit": limit, "offset": offset,
+        "open": SNIPPET_OPEN, "close": SNIPPET_CLOSE,
+    })
+    # bm25 is "lower is better"; expose a positive score instead.
+    return [_hit(row, -row.rank) for row in rows]
+
+
+def _search_postgres(db: Session, query: str, user_id: Optional[str], limit: int, offset: int):
+    if not _TERM_PATTERN.search(query):
+        return []
+    user_filter = "AND c.user_id = :user_id" if user_id else ""
+    document = postgres_document()
+    sql = text(f"""
+        SELECT m.id, m.conversation_id, c.title, m.created_at,
+               ts_headline('{SEARCH_LANGUAGE}', m.user_message || ' ' || m.ai_response, q,
+                           'StartSel=' || :open || ', StopSel=' || :close || ', MaxFragments=1') AS snippet,
+               ts_rank_cd({document}, q) AS rank
+        FROM messages m
+        JOIN conversations c ON c.id = m.conversation_id,
+             websearch_to_tsquery('{SEARCH_LANGUAGE}', :query) AS q
+        WHERE {document} @@ q {user_filter}
+        ORDER BY rank DESC
+        LIMIT :limit OFFSET :offset
+    """)
+    rows = db.execute(sql, {
+        "query": query, "user_id": user_id, "limit": limit, "offset": offset,
+        "open": SNIPPET_OPEN, "close": SNIPPET_CLOSE,
+    })
+    return [_hit(row, row.rank) for row in rows]
+
+
+def _hit(row, score: float) -> Dict[str, Any]:
+    return {
+        "message_id": row.id,
+        "conversation_id": row.conversation_id,
+        "conversation_title": row.title,
+        "snippet": row.snippet,
+        "score": round(float(score), 4),
+        "timestamp": row.created_at,
+    }
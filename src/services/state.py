@@ -0,0 +1,164 @@
+"""Shared runtime state backends (counters, TTL entries and pub/sub).
+
+Module globals only exist inside one worker process. Anything that has to be
+consistent across ``--workers N`` or several containers goes through a
+:class:`StateBackend` instead: in-process by default, Redis when
+``STATE_BACKEND_URL`` points to a Redis-compatible server.
+"""
+import os
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend(ABC):
+    """Abstract base class for shared state backends. Values are strings."""
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add ``amount`` to a counter; ``ttl`` applies when the key is created."""
+        pass
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str):
+        pass
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> AsyncIterator[str]:
+        """Yield messages published on ``channel`` until the consumer stops iterating."""
+        pass
+
+    async def ping(self):
+        """Raise if the backend is unreachable."""
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class InMemoryStateBackend(StateBackend):
+    """Single-process backend; the default for development and tests."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        current = self._live(key)
+        if current is None:
+            expires_at = time.monotonic() + ttl if ttl else None
+            value = amount
+        else:
+            expires_at = self._data[key][1]
+            value = int(current) + amount
+        self._data[key] = (str(value), expires_at)
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def publish(self, channel: str, message: str):
+        for queue in self._subscribers.get(channel, ()):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].discard(queue)
+
+
+class RedisStateBackend(StateBackend):
+    """Redis (or Redis-compatible: Valkey, KeyDB, Dragonfly) backend."""
+
+    def __init__(self, url: str, client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url, decode_responses=True)
+        self.client = client
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if not ttl:
+            return await self.client.incrby(key, amount)
+        # One MULTI/EXEC, so the key is never left without its TTL; NX keeps the
+        # expiry of an existing window (PEXPIRE NX needs Redis 7+).
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incrby(key, amount)
+            pipe.pexpire(key, int(ttl * 1000), nx=True)
+            value, _ = await pipe.execute()
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        await self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+    async def publish(self, channel: str, message: str):
+        await self.client.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"]
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+    async def ping(self):
+        await self.client.ping()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def create_state_backend(url: Optional[str] = None) -> StateBackend:
+    """Create the backend configured by ``STATE_BACKEND_URL`` (``memory://`` by default)."""
+    url = url or os.getenv("STATE_BACKEND_URL", "memory://")
+    if url.startswith("memory://"):
+        return InMemoryStateBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        logger.info("Using Redis state backend")
+        return RedisStateBackend(url)
+    raise ValueError(f"Unsupported STATE_BACKEND_URL: {url}")
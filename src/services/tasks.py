@@ -0,0 +1,208 @@
+"""Background task subsystem for post-processing off the request path.
+
+Each named queue is bounded and drained by its own consumers, which hand
+items to the registered handler in micro-batches: a consumer waits for one
+item, then keeps collecting until ``batch_size`` items or ``max_wait``
+seconds, so a burst of messages becomes a single embedding or provider call.
+Failed batches are retried with exponential backoff and jitter.
+
+CPU-bound work (e.g. local embeddings) goes through :meth:`TaskQueue.run_cpu`,
+backed by a thread pool or, with ``TASK_CPU_EXECUTOR=process``, a process pool.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BatchHandler = Callable[[List[Any]], Awaitable[None]]
+# Window over which throughput is reported.
+_RATE_WINDOW = 60.0
+
+
+@dataclass
+class _Channel:
+    handler: BatchHandler
+    queue: asyncio.Queue
+    batch_size: int
+    max_wait: float
+    retries: int
+    backoff: float
+    concurrency: int
+    consumers: List[asyncio.Task] = field(default_factory=list)
+    submitted: int = 0
+    processed: int = 0
+    failed: int = 0
+    dropped: int = 0
+    retried: int = 0
+    batches: int = 0
+    completions: deque = field(default_factory=lambda: deque(maxlen=10_000))
+
+
+class TaskQueue:
+    """Bounded, micro-batching background queues with retries and graceful drain."""
+
+    def __init__(self, cpu_workers: Optional[int] = None, cpu_executor: str = "thread"):
+        self.cpu_workers = cpu_workers or min(4, os.cpu_count() or 1)
+        self.cpu_executor = cpu_executor
+        self._executor: Optional[Executor] = None
+        self._channels: Dict[str, _Channel] = {}
+        self._accepting = False
+
+    @classmethod
+    def from_env(cls) -> "TaskQueue":
+        workers = os.getenv("TASK_CPU_WORKERS")
+        return cls(
+            cpu_workers=int(workers) if workers else None,
+            cpu_executor=os.getenv("TASK_CPU_EXECUTOR", "thread").lower(),
+        )
+
+    def register(
+        self,
+        name: str,
+        handler: BatchHandler,
+        batch_size: int = 32,
+        max_wait: float = 0.05,
+        max_queue: int = 10_000,
+        retries: int = 3,
+        backoff: float = 0.5,
+        concurrency: int = 1,
+    ):
+        """Register ``handler`` to receive lists of items submitted under ``name``."""
+        self._channels[name] = _Channel(
+            handler=handler,
+            queue=asyncio.Queue(maxsize=max_queue),
+            batch_size=batch_size,
+            max_wait=max_wait,
+            retries=retries,
+            backoff=backoff,
+            concurrency=concurrency,
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    async def start(self):
+        """Start the consumers; must be called from the serving event loop."""
+        if self._accepting:
+            return
+        for name, channel in self._channels.items():
+            channel.consumers = [
+                asyncio.create_task(self._consume(name, channel)) for _ in range(channel.concurrency)
+            ]
+        self._accepting = True
+
+    def submit(self, name: str, item: Any) -> bool:
+        """Enqueue without blocking; returns False when not running or the queue is full."""
+        channel = self._channels[name]
+        if not self._accepting:
+            channel.dropped += 1
+            return False
+        try:
+            channel.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            channel.dropped += 1
+            logger.warning("Task queue '%s' is full; dropping item", name)
+            return False
+        channel.submitted += 1
+        return True
+
+    async def run_cpu(self, fn: Callable, *args) -> Any:
+        """Run a CPU-bound callable in the worker pool without blocking the event loop."""
+        if self._executor is None:
+            if self.cpu_executor == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.cpu_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="task-cpu")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _next_batch(self, channel: _Channel) -> List[Any]:
+        batch = [await channel.queue.get()]
+        deadline = time.monotonic() + channel.max_wait
+        while len(batch) < channel.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(channel.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _consume(self, name: str, channel: _Channel):
+        while True:
+            batch = await self._next_batch(channel)
+            try:
+                await self._process(name, channel, batch)
+            finally:
+                for _ in batch:
+                    channel.queue.task_done()
+
+    async def _process(self, name: str, channel: _Channel, batch: List[Any]):
+        for attempt in range(channel.retries + 1):
+            try:
+                await channel.handler(batch)
+                channel.processed += len(batch)
+                channel.batches += 1
+                channel.completions.append((time.monotonic(), len(batch)))
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == channel.retries:
+                    channel.failed += len(batch)
+                    logger.error("Task '%s' failed for %s items after %s attempts: %s", name, len(batch), attempt + 1, e)
+                    return
+                channel.retried += 1
+                delay = channel.backoff * 2 ** attempt
+                logger.warning("Task '%s' failed (%s); retrying in %.2fs", name, e, delay)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def drain(self, timeout: float = 10.0):
+        """Stop accepting work, finish queued items within ``timeout``, then stop consumers."""
+        self._accepting = False
+        pending = [channel.queue.join() for channel in self._channels.values()]
+        try:
+            await asyncio.wait_for(asyncio.gather(*pending), timeout)
+        except asyncio.TimeoutError:
+            left = {name: c.queue.qsize() for name, c in self._channels.items() if c.queue.qsize()}
+            logger.warning("Task drain timed out; abandoning queued items: %s", left)
+        for channel in self._channels.values():
+            for consumer in channel.consumers:
+                consumer.cancel()
+            await asyncio.gather(*channel.consumers, return_exceptions=True)
+            channel.consumers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        queues = {}
+        for name, channel in self._channels.items():
+            recent = sum(n for t, n in channel.completions if now - t <= _RATE_WINDOW)
+            queues[name] = {
+                "depth": channel.queue.qsize(),
+                "capacity": channel.queue.maxsize,
+                "submitted": channel.submitted,
+                "processed": channel.processed,
+                "failed": channel.failed,
+                "dropped": channel.dropped,
+                "retries": channel.retried,
+                "batches": channel.batches,
+                "avg_batch_size": round(channel.processed / channel.batches, 2) if channel.batches else 0.0,
+                "throughput_per_s": round(recent / _RATE_WINDOW, 3),
+            }
+        return {
+            "running": self._accepting,
+            "cpu_executor": self.cpu_executor,
+            "cpu_workers": self.cpu_workers,
+            "queues": queues,
+        }
@@ -0,0 +1,121 @@
+"""Conversation titles generated by a cheap model off the request path.
+
+New conversations start with their first message, truncated, as title. After
+the first exchange the conversation is queued; the background task queue
+collects several of them and a single model call titles the whole batch.
+"""
+import os
+import re
+import json
+import logging
+from typing import List, Tuple, Optional, Dict
+
+from src.database import SessionLocal, Conversation
+from .ai_service import AIService, TokenUsage
+
+logger = logging.getLogger(__name__)
+
+MAX_TITLE_CHARS = 60
+# Characters of each exchange shown to the model; the opening says what it is about.
+EXCERPT_CHARS = 500
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+TITLE_INSTRUCTIONS = (
+    "Write a short title (at most 6 words) for each conversation below, in the "
+    "language of the conversation. No quotes or trailing punctuation. Reply with "
+    "only a JSON object mapping each conversation number to its title, "
+    'e.g. {"1": "Docker volume setup", "2": "Receita de bolo"}.'
+)
+
+
+def clean_title(title: str) -> Optional[str]:
+    title = " ".join(str(title).split()).strip("\"'`.:;- ")
+    return title[:MAX_TITLE_CHARS] or None
+
+
+class TitleGenerator:
+    """Titles batches of conversations with one model call.
+
+    Calls go through :class:`AIService`, so they share the provider's circuit
+    breaker, retries and tracing; their usage is metered when a meter is given.
+    """
+
+    def __init__(self, service: AIService, model: Optional[str] = None, meter=None):
+        self.service = service
+        self.model = model
+        self.meter = meter
+
+    @classmethod
+    def from_env(cls, service: AIService, meter=None) -> Optional["TitleGenerator"]:
+        if os.getenv("TITLES_ENABLED", "True").lower() != "true":
+            return None
+        # The router's light model is the natural cheap choice when configured.
+        model = os.getenv("TITLE_MODEL") or os.getenv(f"{service.provider.env_prefix}_LIGHT_MODEL") or None
+        return cls(service, model, meter)
+
+    def build_prompt(self, exchanges: List[Tuple[str, str]]) -> str:
+        parts = [TITLE_INSTRUCTIONS]
+        for number, (user_message, ai_response) in enumerate(exchanges, 1):
+            parts.append(
+                f"Conversation {number}:\nUser: {user_message[:EXCERPT_CHARS]}\n"
+                f"Assistant: {ai_response[:EXCERPT_CHARS]}"
+            )
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def parse(response: str, count: int) -> List[Optional[str]]:
+        """Titles in input order; ``None`` where the model gave no usable title."""
+        match = _JSON_OBJECT.search(response or "")
+        try:
+            data = json.loads(match.group(0)) if match else {}
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        return [clean_title(data[str(i)]) if data.get(str(i)) else None for i in range(1, count + 1)]
+
+    async def generate(self, exchanges: List[Tuple[str, str]]) -> List[Optional[str]]:
+        usage = TokenUsage()
+        # documents=[]: titles need no retrieved context.
+        response, _ = await self.service.generate_response(
+            self.build_prompt(exchanges), [], model=self.model, usage=usage, documents=[]
+        )
+        if self.meter is not None:
+            # A batch spans several users; it is metered once, to the default tenant.
+            await self.meter.record(None, None, None, self.service.provider_name, usage)
+        return self.parse(response, len(exchanges))
+
+    async def title_conversations(self, items: List[Tuple[str, str, str]]) -> List[Dict[str, Optional[str]]]:
+        """Title ``(conversation_id, user_message, ai_response)`` items and store the results.
+
+        Returns ``{"conversation_id", "user_id", "title"}`` for every updated conversation.
+        """
+        # A conversation queued twice is titled once.
+        unique = list({item[0]: item for item in items}.values())
+        titles = await self.generate([(user_message, ai_response) for _, user_message, ai_response in unique])
+
+        titled = {item[0]: title for item, title in zip(unique, titles) if title}
+        updated = []
+        db = SessionLocal()
+        try:
+            pending = (
+                db.query(Conversation.id, Conversation.user_id)
+                .filter(Conversation.id.in_(titled), Conversation.title_generated.isnot(True))
+                .all()
+            )
+            for conversation_id, user_id in pending:
+                # Keeping updated_at as is: a new title must not reorder the sidebar.
+                db.query(Conversation).filter(Conversation.id == conversation_id).update(
+                    {
+                        Conversation.title: titled[conversation_id],
+                        Conversation.title_generated: True,
+                        Conversation.updated_at: Conversation.updated_at,
+                    },
+                    synchronize_session=False,
+                )
+                updated.append({"conversation_id": conversation_id, "user_id": user_id, "title": titled[conversation_id]})
+            db.commit()
+        finally:
+            db.close()
+        logger.info("Generated %s conversation titles in one call", len(updated))
+        return updated
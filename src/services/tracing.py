@@ -0,0 +1,196 @@
+"""OpenTelemetry tracing: request, database, context, provider and persistence spans.
+
+Every request gets a server span (continuing an incoming ``traceparent``);
+database statements, context assembly, the provider call and persistence are
+recorded as child spans. The trace id is returned in the ``X-Trace-Id``
+response header and added to every log record as ``trace_id``.
+
+``TRACING_EXPORTER`` selects where finished spans go:
+
+* ``none`` (default) - spans are created for ids and log correlation only.
+* ``otlp`` - OTLP over HTTP; endpoint and headers come from the standard
+  ``OTEL_EXPORTER_OTLP_*`` variables.
+* ``console`` - printed to stdout, for local debugging.
+
+Only the small ``opentelemetry-api`` package is imported with the app; the SDK
+and exporters are loaded when tracing is set up on startup.
+"""
+import os
+import logging
+from typing import Any, Dict, Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("chatbot-ia-api")
+
+TRACE_HEADER = "x-trace-id"
+# Statements are truncated in span attributes; bound parameters are never recorded.
+MAX_STATEMENT_CHARS = 2000
+
+
+def setup_tracing(exporter=None, sample_ratio: Optional[float] = None):
+    """Install the SDK tracer provider with ``exporter`` (or the one from ``TRACING_EXPORTER``).
+
+    Calling it again adds the exporter to the existing provider, since the
+    global provider can only be set once per process.
+    """
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    provider = trace.get_tracer_provider()
+    if not isinstance(provider, TracerProvider):
+        ratio = sample_ratio if sample_ratio is not None else float(os.getenv("TRACING_SAMPLE_RATIO", 1.0))
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "chatbot-ia-api")}),
+            sampler=ParentBased(TraceIdRatioBased(ratio)),
+        )
+        trace.set_tracer_provider(provider)
+
+    if exporter is not None:
+        # Given exporters are for tests and tools: export synchronously.
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        return provider
+
+    name = os.getenv("TRACING_EXPORTER", "none").lower()
+    if name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    elif name == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    elif name != "none":
+        raise ValueError(f"Unsupported TRACING_EXPORTER: {name}")
+    logger.info("Tracing enabled (exporter: %s)", name)
+    return provider
+
+
+def shutdown_tracing():
+    """Flush pending spans."""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def current_trace_id() -> Optional[str]:
+    span_context = trace.get_current_span().get_span_context()
+    return format(span_context.trace_id, "032x") if span_context.is_valid else None
+
+
+def record_error(span, exc: BaseException):
+    span.record_exception(exc)
+    span.set_status(Status(StatusCode.ERROR, str(exc)))
+
+
+# -- Log correlation ------------------------------------------------------
+
+def install_log_correlation():
+    """Give every log record a ``trace_id`` attribute (``-`` outside a trace)."""
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "_adds_trace_id", False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.trace_id = current_trace_id() or "-"
+        return record
+
+    record_factory._adds_trace_id = True
+    logging.setLogRecordFactory(record_factory)
+
+
+# -- Database -------------------------------------------------------------
+
+def instrument_engine(engine):
+    """One client span per statement executed on ``engine`` within a traced request."""
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        # Only statements inside a trace: background jobs and health probes stay quiet.
+        if not trace.get_current_span().get_span_context().is_valid:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "QUERY"
+        span = tracer.start_span(
+            f"db.{operation.lower()}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": system,
+                "db.operation": operation,
+                "db.statement": statement[:MAX_STATEMENT_CHARS],
+                "db.executemany": executemany,
+            },
+        )
+        if context is not None:
+            context._otel_span = span
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_otel_span", None)
+        if span is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+            context._otel_span = None
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_otel_span", None)
+        if span is not None:
+            record_error(span, exception_context.original_exception)
+            span.end()
+            context._otel_span = None
+
+
+# -- HTTP -----------------------------------------------------------------
+
+class TracingMiddleware:
+    """ASGI middleware: one server span per HTTP request, covering the whole streamed body."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        parent = propagate.extract(headers)
+        method = scope["method"]
+        attributes: Dict[str, Any] = {
+            "http.request.method": method,
+            "url.path": scope["path"],
+        }
+        with tracer.start_as_current_span(
+            f"{method} {scope['path']}", context=parent, kind=SpanKind.SERVER, attributes=attributes,
+            record_exception=False, set_status_on_exception=False,
+        ) as span:
+            trace_id = current_trace_id()
+
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                    if trace_id:
+                        message["headers"] = list(message.get("headers", [])) + [(TRACE_HEADER.encode(), trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            except Exception as e:
+                record_error(span, e)
+                raise
+            finally:
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute("http.route", route.path)
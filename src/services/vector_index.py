@@ -0,0 +1,174 @@
+"""Vector indexes for cosine-similarity search, persisted as memory-mapped files.
+
+An index directory holds ``meta.json`` plus ``.npy`` arrays that are opened
+with ``mmap_mode="r"``, so loading is instant and pages are read on demand.
+
+* :class:`FlatIndex` - exact brute-force search, best below ~20k vectors.
+* :class:`IVFIndex` - inverted-file index: vectors are clustered with
+  spherical k-means and a query only scans the ``nprobe`` closest clusters.
+"""
+import json
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Tuple, Optional, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+# Rows scored per matrix product, bounding temporary memory during training.
+_BLOCK = 65536
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest scores, best first, without a full sort."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class VectorIndex(ABC):
+    """Abstract base class for vector indexes. Vectors must be L2-normalised."""
+
+    kind: str
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray):
+        self.ids = ids
+        self.vectors = vectors
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    @abstractmethod
+    def search(self, query: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to ``k`` ``(id, cosine similarity)`` pairs, best first."""
+        pass
+
+    def _meta(self) -> dict:
+        return {"kind": self.kind, "dimension": self.dimension, "count": len(self)}
+
+    def save(self, directory: PathLike):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "ids.npy", np.asarray(self.ids, dtype=str))
+        np.save(directory / "vectors.npy", np.asarray(self.vectors, dtype=np.float32))
+        # Written last so a partially written index is never picked up.
+        tmp = directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(self._meta()))
+        os.replace(tmp, directory / "meta.json")
+
+
+class FlatIndex(VectorIndex):
+    """Exact search by brute-force dot product."""
+
+    kind = "flat"
+
+    @classmethod
+    def empty(cls, dimension: int) -> "FlatIndex":
+        return cls(np.empty(0, dtype=str), np.empty((0, dimension), dtype=np.float32))
+
+    def add(self, ids: List[str], vectors: np.ndarray):
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=str)])
+        self.vectors = np.vstack([self.vectors, np.asarray(vectors, dtype=np.float32)])
+
+    def search(self, query: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
+        if len(self) == 0:
+            return []
+        scores = self.vectors @ query
+        return [(str(self.ids[i]), float(scores[i])) for i in _top_k(scores, k)]
+
+
+class IVFIndex(VectorIndex):
+    """Approximate search over k-means clusters ("inverted lists")."""
+
+    kind = "ivf"
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray, centroids: np.ndarray,
+                 offsets: np.ndarray, nprobe: int = 8):
+        super().__init__(ids, vectors)
+        self.centroids = centroids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, ids: List[str], vectors: np.ndarray, nlist: Optional[int] = None,
+              iterations: int = 10, nprobe: int = 8, seed: int = 0) -> "IVFIndex":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample; ~64 points per cluster is plenty for k-means.
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = sample[assignment == cluster]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1.0)
+                else:
+                    centroids[cluster] = sample[rng.integers(len(sample))]
+
+        assignment = np.concatenate([
+            np.argmax(vectors[start:start + _BLOCK] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), _BLOCK)
+        ])
+        # Store vectors grouped by cluster so each inverted list is one contiguous slice.
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=offsets[1:])
+        return cls(np.asarray(ids, dtype=str)[order], vectors[order], centroids, offsets, nprobe)
+
+    def search(self, query: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
+        if len(self) == 0:
+            return []
+        lists = _top_k(self.centroids @ query, self.nprobe)
+        positions = np.concatenate([
+            np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists
+        ])
+        if len(positions) == 0:
+            return []
+        scores = self.vectors[positions] @ query
+        return [(str(self.ids[positions[i]]), float(scores[i])) for i in _top_k(scores, k)]
+
+    def _meta(self) -> dict:
+        return {**super()._meta(), "nprobe": self.nprobe}
+
+    def save(self, directory: PathLike):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "centroids.npy", self.centroids)
+        np.save(directory / "offsets.npy", self.offsets)
+        super().save(directory)
+
+
+def build_index(ids: List[str], vectors: np.ndarray, ivf_threshold: int = 20_000) -> VectorIndex:
+    """Exact search for small corpora, IVF once brute force would cost too much per query."""
+    if len(ids) >= ivf_threshold:
+        return IVFIndex.build(ids, vectors)
+    return FlatIndex(np.asarray(ids, dtype=str), np.asarray(vectors, dtype=np.float32))
+
+
+def load_index(directory: PathLike) -> Optional[VectorIndex]:
+    """Open a saved index with memory-mapped arrays; ``None`` if it does not exist."""
+    directory = Path(directory)
+    meta_path = directory / "meta.json"
+    if not meta_path.exists():
+        return None
+    meta = json.loads(meta_path.read_text())
+    ids = np.load(directory / "ids.npy", mmap_mode="r")
+    vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+    if meta["kind"] == IVFIndex.kind:
+        return IVFIndex(
+            ids, vectors,
+            np.load(directory / "centroids.npy"),
+            np.load(directory / "offsets.npy"),
+            nprobe=int(os.getenv("RAG_NPROBE", meta.get("nprobe", 8))),
+        )
+    return FlatIndex(ids, vectors)
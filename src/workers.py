@@ -0,0 +1,29 @@
+"""Gunicorn worker class for the API (``worker_class`` in gunicorn.conf.py)."""
+import sys
+import signal
+import asyncio
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.workers import UvicornWorker
+
+from src.services.lifecycle import DrainingServer
+
+
+class DrainingWorker(UvicornWorker):
+    """Uvicorn worker whose server starts the app's drain on SIGTERM/SIGINT."""
+
+    def run(self) -> None:
+        self.config.app = self.wsgi
+        # Loaded by gunicorn as src.main:app, so this is the app's own lifecycle.
+        from src.main import lifecycle
+
+        server = DrainingServer(self.config, lifecycle)
+
+        async def serve():
+            # As in UvicornWorker: SIGQUIT exits at once.
+            asyncio.get_running_loop().add_signal_handler(signal.SIGQUIT, self.handle_exit, signal.SIGQUIT, None)
+            await server.serve(sockets=self.sockets)
+
+        asyncio.run(serve())
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
@@ -1,6 +1,10 @@
 """Configuration for pytest."""
 import os
 import sys
+import asyncio
+from typing import List, Optional, Sequence, Tuple
+
+import pytest
 
 # Add src to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -8,3 +12,83 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 # Set test environment
 os.environ["DATABASE_URL"] = "sqlite:///:memory:"
 os.environ["API_PROVIDER"] = "test"
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+# Imported after the environment above is set.
+from src.services.ai_service import PROVIDERS, AIProvider, AIService
+
+
+class StubProvider(AIProvider):
+    """Configurable fake provider.
+
+    Streams ``chunks`` (``delay`` seconds apart) or returns them joined;
+    ``echo`` answers ``re: <prompt>`` instead. ``usage`` is reported as
+    ``(prompt_tokens, completion_tokens)`` and ``error`` is raised on every
+    call. Calls are recorded as ``(prompt, model, history)``.
+    """
+
+    env_prefix = "TEST"
+
+    def __init__(
+        self,
+        chunks: Sequence[str] = ("answer",),
+        model: str = "stub-model",
+        usage: Optional[Tuple[int, int]] = None,
+        error: Optional[Exception] = None,
+        delay: float = 0.0,
+        echo: bool = False,
+    ):
+        self.chunks = list(chunks)
+        self.model = model
+        self.usage = usage
+        self.error = error
+        self.delay = delay
+        self.echo = echo
+        self.calls: List[Tuple[str, Optional[str], List[Tuple[str, str]]]] = []
+        self.warmed = False
+
+    async def warmup(self):
+        self.warmed = True
+
+    def _start(self, prompt, conversation_history, model) -> List[str]:
+        self.calls.append((prompt, model, list(conversation_history)))
+        if self.error is not None:
+            raise self.error
+        return [f"re: {prompt}"] if self.echo else self.chunks
+
+    def _report(self, usage) -> int:
+        if self.usage is None:
+            return 0
+        if usage is not None:
+            usage.prompt_tokens, usage.completion_tokens = self.usage
+        return sum(self.usage)
+
+    async def generate_response(self, prompt, conversation_history, model=None, usage=None, documents=None):
+        reply = "".join(self._start(prompt, conversation_history, model))
+        return reply, self._report(usage)
+
+    async def stream_response(self, prompt, conversation_history, model=None, usage=None, documents=None):
+        for i, chunk in enumerate(self._start(prompt, conversation_history, model)):
+            if i and self.delay:
+                await asyncio.sleep(self.delay)
+            yield chunk
+        self._report(usage)
+
+
+@pytest.fixture
+def stub_provider(monkeypatch):
+    """Install a :class:`StubProvider` as the app's provider; returns the ``AIService`` using it.
+
+    Call it as ``stub_provider(name="stub", **options)`` with StubProvider options.
+    """
+    import src.main as main
+
+    def install(name: str = "stub", **options) -> AIService:
+        provider = StubProvider(**options)
+        monkeypatch.setitem(PROVIDERS, name, lambda: provider)
+        monkeypatch.setenv("AI_PROVIDER", name)
+        service = AIService(name)
+        monkeypatch.setattr(main, "ai_service", service)
+        return service
+
+    return install
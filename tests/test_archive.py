@@ -0,0 +1,120 @@
+"""Tests for conversation archival."""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.main as main
+from src.database import SessionLocal, init_db, Conversation, Message
+from src.services.archive import Archiver, LocalArchiveStore, archive_key, create_archive_store
+
+client = TestClient(main.app)
+OLD = datetime.utcnow() - timedelta(days=120)
+
+
+class TestArchiver:
+    """Archive, restore and API integration tests."""
+
+    def setup_method(self):
+        init_db()
+        db = SessionLocal()
+        db.add(Conversation(id="arch-old", user_id="arch-user", title="Old", updated_at=OLD))
+        db.add(Conversation(id="arch-new", user_id="arch-user", title="New"))
+        db.add_all([
+            Message(id=f"arch-m{i}", conversation_id="arch-old", user_message=f"question {i}",
+                    ai_response=f"answer {i}", tokens_used=10, created_at=OLD + timedelta(minutes=i))
+            for i in range(3)
+        ])
+        db.add(Message(id="arch-m9", conversation_id="arch-new", user_message="hi", ai_response="hello"))
+        db.commit()
+        db.close()
+
+    def teardown_method(self):
+        db = SessionLocal()
+        db.query(Message).filter(Message.id.like("arch-%")).delete(synchronize_session=False)
+        db.query(Conversation).filter(Conversation.id.like("arch-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    def test_archive_stale_moves_messages_to_blob(self, tmp_path):
+        archiver = Archiver(LocalArchiveStore(str(tmp_path)))
+        db = SessionLocal()
+        assert archiver.archive_stale(db, days=90) == 1
+
+        assert db.query(Message).filter(Message.conversation_id == "arch-old").count() == 0
+        assert db.query(Message).filter(Message.conversation_id == "arch-new").count() == 1
+        stub = db.get(Conversation, "arch-old")
+        assert stub.archived_at is not None
+        assert stub.archived_messages == 3
+        assert stub.updated_at == OLD
+        assert (tmp_path / archive_key("arch-old")).exists()
+        db.close()
+
+    def test_restore_round_trip(self, tmp_path):
+        archiver = Archiver(LocalArchiveStore(str(tmp_path)))
+        db = SessionLocal()
+        archiver.archive_stale(db, days=90)
+        assert archiver.restore(db, db.get(Conversation, "arch-old")) == 3
+
+        messages = db.query(Message).filter(Message.conversation_id == "arch-old").order_by(Message.created_at).all()
+        assert [m.user_message for m in messages] == ["question 0", "question 1", "question 2"]
+        assert messages[0].created_at == OLD
+        assert messages[0].tokens_used == 10
+        assert not (tmp_path / archive_key("arch-old")).exists()
+        # A restored conversation is not archived again right away.
+        assert archiver.archive_stale(db, days=90) == 0
+        db.close()
+
+    def test_concurrent_restore_claims_once(self, tmp_path):
+        restored = []
+        archiver = Archiver(LocalArchiveStore(str(tmp_path)), on_restore=lambda user_id, rows: restored.append(
+            (user_id, [row["id"] for row in rows])
+        ))
+        db = SessionLocal()
+        archiver.archive_stale(db, days=90)
+        db.close()
+
+        # Both requests loaded the stub while it was still archived.
+        first, second = SessionLocal(), SessionLocal()
+        stale = second.get(Conversation, "arch-old")
+        assert stale.archived_at is not None
+        assert archiver.restore(first, first.get(Conversation, "arch-old")) == 3
+        assert archiver.restore(second, stale) == 0
+        archiver.ensure_restored(second, stale)
+        assert second.query(Message).filter(Message.conversation_id == "arch-old").count() == 3
+        assert archiver.restored == 1
+        # Restored turns go back to the memory index, whose embeddings were dropped on archive.
+        assert restored == [("arch-user", ["arch-m0", "arch-m1", "arch-m2"])]
+        first.close()
+        second.close()
+
+    def test_history_endpoint_restores_transparently(self, tmp_path, monkeypatch):
+        archiver = Archiver(LocalArchiveStore(str(tmp_path)))
+        monkeypatch.setattr(main, "archiver", archiver)
+        db = SessionLocal()
+        archiver.archive_stale(db, days=90)
+        db.close()
+
+        listed = client.get("/conversations", params={"user_id": "arch-user"}).json()["conversations"]
+        assert {c["id"]: c["messages_count"] for c in listed}["arch-old"] == 3
+
+        response = client.get("/conversation/arch-old")
+        assert response.status_code == 200
+        assert response.json()["total_messages"] == 3
+        assert archiver.restored == 1
+
+    def test_delete_archived_conversation_removes_blob(self, tmp_path, monkeypatch):
+        archiver = Archiver(LocalArchiveStore(str(tmp_path)))
+        monkeypatch.setattr(main.retention, "archiver", archiver)
+        db = SessionLocal()
+        archiver.archive_stale(db, days=90)
+        db.close()
+
+        assert client.delete("/conversation/arch-old").status_code == 200
+        assert not (tmp_path / archive_key("arch-old")).exists()
+
+
+def test_create_archive_store():
+    assert isinstance(create_archive_store("file:///tmp/archive"), LocalArchiveStore)
+    with pytest.raises(ValueError):
+        create_archive_store("ftp://example.com/archive")
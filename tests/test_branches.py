@@ -0,0 +1,130 @@
+"""Tests for regenerating, editing and switching conversation branches."""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.main as main
+from src.main import app
+from src.database import SessionLocal, Conversation, Message, init_db
+from src.services import branches
+
+client = TestClient(app)
+
+
+class TestBranches:
+    """Turns form a tree; history and context follow the active branch."""
+
+    @pytest.fixture(autouse=True)
+    def echo(self, monkeypatch, stub_provider):
+        init_db()
+        self.provider = stub_provider("echo", echo=True).provider
+        monkeypatch.setattr(main, "memory", None)
+        self.conversation_id = f"branch-{uuid.uuid4()}"
+        yield
+        db = SessionLocal()
+        db.query(Conversation).filter(Conversation.id == self.conversation_id).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    def say(self, content):
+        response = client.post("/chat", json={"content": content, "conversation_id": self.conversation_id})
+        assert response.status_code == 200
+        return response.json()
+
+    def context(self):
+        """User messages of the history given to the last provider call."""
+        return [user for user, _ in self.provider.calls[-1][2]]
+
+    def history(self):
+        return client.get(f"/conversation/{self.conversation_id}").json()
+
+    def test_turns_are_chained(self):
+        first, second = self.say("one"), self.say("two")
+        assert first["parent_id"] is None and second["parent_id"] == first["id"]
+        messages = self.history()["messages"]
+        assert [m["user_message"] for m in messages] == ["one", "two"]
+        assert [m["siblings"] for m in messages] == [1, 1]
+        assert self.context() == ["one"]
+
+    def test_regenerate_adds_active_sibling(self):
+        first, second = self.say("one"), self.say("two")
+        url = f"/conversation/{self.conversation_id}/messages/{second['id']}/regenerate"
+        again = client.post(url).json()
+        assert again["parent_id"] == first["id"] and again["user_message"] == "two"
+        assert again["siblings"] == 2
+        # The regenerated turn is answered from its parent, without itself.
+        assert self.context() == ["one"]
+
+        history = self.history()
+        assert [m["id"] for m in history["messages"]] == [first["id"], again["id"]]
+        assert history["total_messages"] == 2
+
+        self.say("three")
+        assert self.context() == ["one", "two"]
+        siblings = client.get(f"/conversation/{self.conversation_id}/messages/{second['id']}/siblings").json()
+        assert [m["id"] for m in siblings["siblings"]] == [second["id"], again["id"]]
+
+    def test_edit_and_switch_back(self):
+        first, second, third = self.say("one"), self.say("two"), self.say("three")
+        edited = client.post(
+            f"/conversation/{self.conversation_id}/messages/{second['id']}/edit", json={"content": "two, edited"}
+        ).json()
+        assert edited["user_message"] == "two, edited" and edited["ai_response"] == "re: two, edited"
+        assert edited["parent_id"] == first["id"]
+        assert [m["user_message"] for m in self.history()["messages"]] == ["one", "two, edited"]
+
+        before = client.get(f"/conversation/{self.conversation_id}")
+        updated_at = before.json()["updated_at"]
+        switched = client.put(f"/conversation/{self.conversation_id}/branch", json={"message_id": second["id"]})
+        # The branch continues down to its newest reply.
+        assert switched.json()["active_message_id"] == third["id"]
+
+        response = client.get(f"/conversation/{self.conversation_id}", headers={"If-None-Match": before.headers["etag"]})
+        assert response.status_code == 200
+        assert [m["user_message"] for m in response.json()["messages"]] == ["one", "two", "three"]
+        # Switching is not activity: the conversation keeps its place in the list.
+        assert response.json()["updated_at"] == updated_at
+
+    def test_unknown_turn_is_404(self):
+        self.say("one")
+        assert client.post(f"/conversation/{self.conversation_id}/messages/nope/regenerate").status_code == 404
+        assert client.put("/conversation/missing/branch", json={"message_id": "nope"}).status_code == 404
+
+
+class TestLegacyConversations:
+    """Conversations stored before branching are linked by created_at when first used."""
+
+    def setup_method(self):
+        init_db()
+        self.conversation_id = f"legacy-{uuid.uuid4()}"
+        start = datetime.utcnow() - timedelta(hours=1)
+        self.updated_at = start
+        db = SessionLocal()
+        db.add(Conversation(id=self.conversation_id, title="legacy", updated_at=start))
+        db.add_all(
+            Message(id=f"{self.conversation_id}-{i}", conversation_id=self.conversation_id,
+                    user_message=f"q{i}", ai_response=f"a{i}", created_at=start + timedelta(seconds=i))
+            for i in (2, 0, 1)
+        )
+        db.commit()
+        db.close()
+
+    def teardown_method(self):
+        db = SessionLocal()
+        db.query(Conversation).filter(Conversation.id == self.conversation_id).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    def test_linked_on_first_use(self):
+        db = SessionLocal()
+        try:
+            conversation = db.get(Conversation, self.conversation_id)
+            assert branches.active_leaf(db, conversation) == f"{self.conversation_id}-2"
+            assert conversation.updated_at == self.updated_at
+            path = branches.active_path(db, self.conversation_id, (Message.user_message,))
+            assert [row.user_message for row in path] == ["q0", "q1", "q2"]
+            assert [row.user_message for row in branches.path_to(db, conversation.active_message_id, (Message.user_message,), limit=2)] == ["q1", "q2"]
+        finally:
+            db.close()
@@ -0,0 +1,115 @@
+"""Tests for bulk export and import."""
+import io
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.database import SessionLocal, engine, init_db, Conversation, Message
+from src.main import app
+from src.services import bulk
+from src.services.archive import Archiver, LocalArchiveStore
+
+client = TestClient(app)
+ADMIN = {"X-Admin-Token": "secret"}
+CREATED = datetime(2024, 1, 2, 3, 4, 5)
+
+
+class TestBulkTransfer:
+    """Export/import round trips."""
+
+    def setup_method(self):
+        init_db()
+        db = SessionLocal()
+        db.add(Conversation(id="bulk-c1", user_id="bulk-alice", title="One", created_at=CREATED, updated_at=CREATED))
+        db.add(Conversation(id="bulk-c2", user_id="bulk-bob", title="Two", created_at=CREATED, updated_at=CREATED))
+        db.add_all([
+            Message(id=f"bulk-m{i}", conversation_id="bulk-c1" if i < 5 else "bulk-c2",
+                    user_message=f"pergunta {i} ção", ai_response=f"answer {i}", tokens_used=i,
+                    prompt_tokens=i, completion_tokens=0, cached_tokens=0, created_at=CREATED)
+            for i in range(8)
+        ])
+        db.commit()
+        db.close()
+
+    def teardown_method(self):
+        db = SessionLocal()
+        db.query(Message).filter(Message.id.like("bulk-%")).delete(synchronize_session=False)
+        db.query(Conversation).filter(Conversation.id.like("bulk-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    def _delete_fixture_rows(self):
+        self.teardown_method()
+
+    @pytest.mark.parametrize("fmt", bulk.FORMATS)
+    def test_round_trip(self, fmt):
+        db = SessionLocal()
+        stats = {}
+        data = b"".join(bulk.stream_export(db, fmt, user_id="bulk-alice", batch_size=2, stats=stats))
+        db.close()
+        assert stats["rows"] == 5
+
+        self._delete_fixture_rows()
+        with engine.connect() as conn:
+            assert bulk.import_from_file(conn, io.BytesIO(data), fmt, batch_size=2) == 5
+
+        db = SessionLocal()
+        message = db.get(Message, "bulk-m3")
+        assert message.user_message == "pergunta 3 ção"
+        assert message.tokens_used == 3
+        assert message.created_at == CREATED
+        conversation = db.get(Conversation, "bulk-c1")
+        assert (conversation.user_id, conversation.title, conversation.updated_at) == ("bulk-alice", "One", CREATED)
+        assert db.get(Conversation, "bulk-c2") is None
+        db.close()
+
+    def test_archived_conversations_are_exported(self, tmp_path):
+        archiver = Archiver(LocalArchiveStore(str(tmp_path)))
+        db = SessionLocal()
+        archiver.archive(db, db.get(Conversation, "bulk-c1"))
+        data = b"".join(bulk.stream_export(db, "ndjson", user_id="bulk-alice", archiver=archiver))
+        # Exporting reads the blob; the conversation stays archived.
+        assert db.get(Conversation, "bulk-c1").archived_at is not None
+        db.close()
+
+        rows = [row for batch in bulk.read_batches(io.BytesIO(data)) for row in batch]
+        assert sorted(row["message_id"] for row in rows) == [f"bulk-m{i}" for i in range(5)]
+        assert rows[0]["conversation_id"] == "bulk-c1" and rows[0]["title"] == "One"
+        assert rows[0]["created_at"] == CREATED
+
+    def test_import_is_idempotent(self):
+        db = SessionLocal()
+        data = b"".join(bulk.stream_export(db, "ndjson"))
+        db.close()
+        with engine.connect() as conn:
+            bulk.import_from_file(conn, io.BytesIO(data), "ndjson")
+        db = SessionLocal()
+        assert db.query(Message).filter(Message.id.like("bulk-%")).count() == 8
+        db.close()
+
+    def test_export_and_import_endpoints(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        response = client.get("/export", params={"format": "parquet", "user_id": "bulk-bob"}, headers=ADMIN)
+        assert response.status_code == 200
+        assert "conversations.parquet" in response.headers["content-disposition"]
+
+        self._delete_fixture_rows()
+        response = client.post(
+            "/import", params={"format": "parquet"},
+            files={"file": ("conversations.parquet", response.content)}, headers=ADMIN,
+        )
+        assert response.status_code == 200
+        assert response.json()["rows"] == 3
+
+    def test_import_rejects_invalid_input(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        response = client.post("/import", files={"file": ("x.ndjson.zst", b"not zstd")}, headers=ADMIN)
+        assert response.status_code == 400
+
+    def test_endpoints_require_admin_token(self, monkeypatch):
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert client.get("/export").status_code == 403
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        assert client.get("/export", headers={"X-Admin-Token": "nope"}).status_code == 401
+        assert client.post("/import", files={"file": ("x.ndjson.zst", b"")}).status_code == 401
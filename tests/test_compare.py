@@ -0,0 +1,96 @@
+"""Tests for the multi-model comparison endpoint."""
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.main as main
+from src.main import app
+from src.database import init_db
+from src.services.compare import ModelComparer, Target, parse_targets
+from src.services.metering import UsageMeter, parse_quotas
+from src.services.state import InMemoryStateBackend
+
+client = TestClient(app)
+
+
+def events(response):
+    return [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+
+class TestTargets:
+    """Targets are provider or provider:model."""
+
+    def test_parse(self):
+        assert parse_targets("openai:gpt-4o-mini, anthropic, openai:gpt-4o-mini") == [
+            Target("openai", "gpt-4o-mini"), Target("anthropic"),
+        ]
+        assert Target("openai", "gpt-4o-mini").label == "openai:gpt-4o-mini"
+
+    def test_unknown_provider(self):
+        with pytest.raises(ValueError):
+            parse_targets(["nope:model"])
+
+    def test_limits(self):
+        comparer = ModelComparer(max_targets=1)
+        with pytest.raises(ValueError):
+            comparer.resolve(None)
+        with pytest.raises(ValueError):
+            comparer.resolve(["openai", "anthropic"])
+
+
+class TestCompareEndpoint:
+    """Chunks are interleaved and tagged; results are stored at the deadline."""
+
+    @pytest.fixture(autouse=True)
+    def providers(self, monkeypatch, stub_provider):
+        init_db()
+        monkeypatch.setenv("PROVIDER_MAX_RETRIES", "0")
+        stub_provider("fast", chunks=["fast ", "answer"], model="fast-model", usage=(12, 2), delay=0.01)
+        stub_provider("slow", chunks=["slow ", "never"], model="slow-model", delay=30)
+        stub_provider("broken", error=ValueError("invalid API key"))
+        monkeypatch.setattr(main, "comparer", ModelComparer([Target("fast"), Target("slow")], deadline=0.5))
+
+    def test_deadline_returns_what_finished(self):
+        response = client.post("/chat/compare", json={"content": "compare me", "user_id": "cmp-user"})
+        received = events(response)
+        assert received[0]["type"] == "setup" and received[0]["models"] == ["fast", "slow"]
+
+        chunks = [(e["model"], e["content"]) for e in received if e["type"] == "content"]
+        assert ("slow", "slow ") in chunks and ("fast", "answer") in chunks
+        results = {e["model"]: e for e in received if e["type"] == "result"}
+        assert results["fast"]["status"] == "ok" and results["fast"]["resolved_model"] == "fast-model"
+        assert results["slow"]["status"] == "timeout"
+        # Cut off streams never report usage; what they generated is estimated.
+        assert results["slow"]["completion_tokens"] > 0
+        done = received[-1]
+        assert done["type"] == "done" and done["completed"] == ["fast"] and done["timed_out"] == ["slow"]
+
+        stored = client.get(f"/comparisons/{done['comparison_id']}").json()
+        assert stored["prompt"] == "compare me" and stored["deadline_ms"] == 500
+        fast, slow = stored["results"]
+        assert (fast["provider"], fast["output"], fast["total_tokens"]) == ("fast", "fast answer", 14)
+        assert fast["latency_ms"] < slow["latency_ms"] and fast["ttft_ms"] is not None
+        assert (slow["status"], slow["output"]) == ("timeout", "slow ")
+
+    def test_failed_target_does_not_fail_the_rest(self):
+        response = client.post("/chat/compare", json={"content": "hi", "targets": ["fast:pinned", "broken"], "deadline": 5})
+        results = {e["model"]: e for e in events(response) if e["type"] == "result"}
+        assert results["fast:pinned"]["status"] == "ok"
+        assert results["fast:pinned"]["resolved_model"] == "pinned"
+        assert results["broken"]["status"] == "error" and "invalid API key" in results["broken"]["error"]
+
+    def test_each_target_counts_against_the_request_quota(self, monkeypatch):
+        meter = UsageMeter(InMemoryStateBackend(), quotas=parse_quotas("requests/minute=3", "user"))
+        monkeypatch.setattr(main, "meter", meter)
+        body = {"content": "hi", "targets": ["fast", "fast:pinned"], "deadline": 5, "user_id": "compare-quota"}
+        assert client.post("/chat/compare", json=body).status_code == 200
+        assert client.post("/chat/compare", json=body).status_code == 429
+        status = asyncio.run(meter.quota_status(None, "compare-quota"))
+        assert status[0]["used"] == 2
+        assert client.post("/chat/compare", json={**body, "targets": ["fast"]}).status_code == 200
+
+    def test_invalid_targets_are_400(self):
+        assert client.post("/chat/compare", json={"content": "hi", "targets": ["nope"]}).status_code == 400
+        assert client.get("/comparisons/missing").status_code == 404
@@ -0,0 +1,168 @@
+"""Tests for response compression and conditional GETs."""
+import gzip
+import json
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.database import SessionLocal, Conversation, Message, init_db
+from src.services.compression import CompressionMiddleware, choose_encoding, etag_matches, make_etag
+
+client = TestClient(app)
+
+demo = FastAPI()
+demo.add_middleware(CompressionMiddleware, minimum_size=100)
+RAW = {"accept-encoding": "gzip"}
+
+
+@demo.get("/big")
+async def big():
+    return {"items": ["x" * 20] * 50}
+
+
+@demo.get("/small")
+async def small():
+    return {"ok": True}
+
+
+@demo.get("/events")
+async def events():
+    async def body():
+        for i in range(20):
+            yield f"data: {'y' * 50} {i}\n\n"
+    return StreamingResponse(body(), media_type="text/event-stream")
+
+
+@demo.get("/lines")
+async def lines():
+    async def body():
+        for i in range(20):
+            yield json.dumps({"row": i, "pad": "z" * 50}) + "\n"
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@demo.get("/encoded")
+async def encoded():
+    return JSONResponse({"pad": "w" * 500}, headers={"Content-Encoding": "identity"})
+
+
+@demo.get("/file")
+async def file():
+    return JSONResponse({"pad": "v" * 500}, headers={"ETag": '"abc"'})
+
+
+demo_client = TestClient(demo)
+
+
+class TestCompression:
+    """Text and JSON are compressed; SSE and small bodies are not."""
+
+    def test_large_json_is_gzipped(self):
+        response = demo_client.get("/big", headers=RAW)
+        assert response.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in response.headers["vary"].lower()
+        assert response.json()["items"][0] == "x" * 20
+        assert int(response.headers["content-length"]) < 1000
+
+    def test_small_and_unaccepted_are_plain(self):
+        assert "content-encoding" not in demo_client.get("/small", headers=RAW).headers
+        assert "content-encoding" not in demo_client.get("/big", headers={"accept-encoding": "identity"}).headers
+        assert "content-encoding" not in demo_client.get("/big", headers={"accept-encoding": "gzip;q=0"}).headers
+
+    def test_event_stream_is_never_compressed(self):
+        response = demo_client.get("/events", headers=RAW)
+        assert "content-encoding" not in response.headers
+        assert response.text.count("data: ") == 20
+
+    def test_streamed_body_is_compressed_incrementally(self):
+        with demo_client.stream("GET", "/lines", headers=RAW) as response:
+            assert response.headers["content-encoding"] == "gzip"
+            assert "content-length" not in response.headers
+            raw = b"".join(response.iter_raw())
+        rows = gzip.decompress(raw).decode().splitlines()
+        assert [json.loads(row)["row"] for row in rows] == list(range(20))
+
+    def test_strong_etag_is_weakened_when_compressed(self):
+        assert demo_client.get("/file", headers=RAW).headers["etag"] == 'W/"abc"'
+        assert demo_client.get("/file", headers={"accept-encoding": "identity"}).headers["etag"] == '"abc"'
+
+    def test_already_encoded_passes_through(self):
+        assert demo_client.get("/encoded", headers=RAW).headers["content-encoding"] == "identity"
+
+    def test_negotiation(self):
+        assert choose_encoding("gzip, deflate") == "gzip"
+        assert choose_encoding("deflate") is None
+        assert choose_encoding("*") == "gzip"
+
+
+@pytest.fixture
+def stub_service(stub_provider):
+    init_db()
+    return stub_provider()
+
+
+class TestConditionalRequests:
+    """ETags follow Conversation.updated_at and answer 304 while unchanged."""
+
+    def test_etag_helpers(self):
+        etag = make_etag("conversation", "c1", 3)
+        assert etag.startswith('W/"')
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", {etag[2:]}', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches(None, etag)
+
+    def test_history_revalidation(self, stub_service):
+        conversation_id = client.post("/chat", json={"content": "first"}).json()["conversation_id"]
+        first = client.get(f"/conversation/{conversation_id}")
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "private, no-cache"
+
+        cached = client.get(f"/conversation/{conversation_id}", headers={"If-None-Match": etag})
+        assert cached.status_code == 304 and cached.content == b""
+        assert cached.headers["etag"] == etag
+
+        # A new message bumps updated_at.
+        client.post("/chat", json={"content": "second", "conversation_id": conversation_id})
+        fresh = client.get(f"/conversation/{conversation_id}", headers={"If-None-Match": etag})
+        assert fresh.status_code == 200
+        assert fresh.json()["total_messages"] == 2
+
+    def test_missing_conversation(self, stub_service):
+        assert client.get(f"/conversation/{uuid.uuid4()}", headers={"If-None-Match": "*"}).status_code == 404
+
+    def test_list_revalidation(self, stub_service):
+        user_id = f"etag-{uuid.uuid4()}"
+        conversation_id = client.post("/chat", json={"content": "hello", "user_id": user_id}).json()["conversation_id"]
+        etag = client.get("/conversations", params={"user_id": user_id}).headers["etag"]
+        assert client.get("/conversations", params={"user_id": user_id}, headers={"If-None-Match": etag}).status_code == 304
+
+        # Generated titles keep updated_at but still change the list.
+        db = SessionLocal()
+        try:
+            db.query(Conversation).filter(Conversation.id == conversation_id).update(
+                {Conversation.title: "Greeting", Conversation.title_generated: True, Conversation.updated_at: Conversation.updated_at}
+            )
+            db.commit()
+        finally:
+            db.close()
+        response = client.get("/conversations", params={"user_id": user_id}, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["conversations"][0]["title"] == "Greeting"
+
+        # Rows imported into the conversation keep updated_at but change messages_count.
+        etag = response.headers["etag"]
+        db = SessionLocal()
+        try:
+            db.add(Message(id=f"{conversation_id}-imported", conversation_id=conversation_id,
+                           user_message="imported", ai_response="row"))
+            db.commit()
+        finally:
+            db.close()
+        response = client.get("/conversations", params={"user_id": user_id}, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["conversations"][0]["messages_count"] == 2
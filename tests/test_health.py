@@ -0,0 +1,101 @@
+"""Tests for the cached dependency health probes."""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.main as main
+from src.main import app
+from src.services.health import HealthMonitor
+
+client = TestClient(app)
+
+
+class TestHealthMonitor:
+    """Probe results, latency and readiness gating."""
+
+    @pytest.mark.asyncio
+    async def test_probe_records_status_and_latency(self):
+        monitor = HealthMonitor(critical=["database"])
+        monitor.register("database", lambda: "pool ok")
+
+        async def provider():
+            await asyncio.sleep(0.01)
+
+        monitor.register("ai_provider", provider)
+        assert monitor.snapshot()["database"]["status"] == "unknown"
+
+        await monitor.probe_all()
+        snapshot = monitor.snapshot()
+        assert snapshot["database"]["status"] == "ok"
+        assert snapshot["database"]["detail"] == "pool ok"
+        assert snapshot["ai_provider"]["latency_ms"] >= 10
+        assert monitor.ready and monitor.status == "healthy"
+
+    @pytest.mark.asyncio
+    async def test_non_critical_failure_degrades(self):
+        monitor = HealthMonitor(critical=["database"])
+        monitor.register("database", lambda: None)
+
+        async def provider():
+            raise ConnectionError("provider unreachable")
+
+        monitor.register("ai_provider", provider)
+        await monitor.probe_all()
+        await monitor.probe("ai_provider")
+
+        provider_status = monitor.get("ai_provider")
+        assert provider_status.status == "down"
+        assert provider_status.error == "provider unreachable"
+        assert provider_status.consecutive_failures == 2
+        assert monitor.ready and monitor.status == "degraded"
+
+    @pytest.mark.asyncio
+    async def test_critical_timeout_is_unhealthy(self):
+        monitor = HealthMonitor(timeout=0.05, critical=["database"])
+
+        async def hanging():
+            await asyncio.sleep(1)
+
+        monitor.register("database", hanging)
+        await monitor.probe_all()
+        assert monitor.get("database").error == "TimeoutError"
+        assert not monitor.ready and monitor.status == "unhealthy"
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("HEALTH_CRITICAL", "database, state")
+        monkeypatch.setenv("HEALTH_INTERVAL", "5")
+        monitor = HealthMonitor.from_env()
+        assert monitor.critical == {"database", "state"}
+        assert monitor.interval == 5
+
+
+class TestHealthEndpoints:
+    """Endpoints serve the cached results."""
+
+    def test_health_reports_probed_database(self):
+        asyncio.run(main.health.probe("database"))
+        data = client.get("/health").json()
+        assert data["status"] in ("healthy", "degraded")
+        assert data["database_connected"] is True
+        assert data["dependencies"]["database"]["status"] == "ok"
+        assert data["dependencies"]["database"]["detail"]
+
+    def test_ready_fails_when_critical_dependency_down(self, monkeypatch):
+        monitor = HealthMonitor(critical=["database"])
+
+        def broken():
+            raise RuntimeError("connection refused")
+
+        monitor.register("database", broken)
+        asyncio.run(monitor.probe_all())
+        monkeypatch.setattr(main, "health", monitor)
+        monkeypatch.setattr(main.lifecycle, "ready", True)
+
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["dependencies"]["database"]["error"] == "connection refused"
+        health = client.get("/health")
+        assert health.status_code == 200
+        assert health.json()["status"] == "unhealthy"
+        assert health.json()["database_connected"] is False
@@ -0,0 +1,149 @@
+"""Tests for readiness, stream tracking and graceful drain."""
+import asyncio
+import signal
+
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+
+import src.main as main
+from src.main import app
+from src.database import init_db
+from src.services.lifecycle import DrainingServer, Lifecycle
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def stub_service(stub_provider):
+    return stub_provider(chunks=["one ", "two ", "three"])
+
+
+class TestLifecycle:
+    """Drain state and in-flight stream accounting."""
+
+    @pytest.mark.asyncio
+    async def test_wait_for_streams_returns_when_idle(self):
+        lifecycle = Lifecycle(drain_timeout=1)
+        release = asyncio.Event()
+
+        async def stream():
+            async with lifecycle.track_stream():
+                await release.wait()
+
+        task = asyncio.create_task(stream())
+        await asyncio.sleep(0)
+        assert lifecycle.active_streams == 1
+
+        lifecycle.begin_drain()
+        assert lifecycle.draining and not lifecycle.ready
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        assert await lifecycle.wait_for_streams()
+        assert lifecycle.active_streams == 0
+        await task
+
+    @pytest.mark.asyncio
+    async def test_wait_for_streams_gives_up_at_deadline(self):
+        lifecycle = Lifecycle(drain_timeout=0.05)
+        release = asyncio.Event()
+
+        async def stream():
+            async with lifecycle.track_stream():
+                await release.wait()
+
+        task = asyncio.create_task(stream())
+        await asyncio.sleep(0)
+        lifecycle.begin_drain()
+        assert not await lifecycle.wait_for_streams()
+        assert lifecycle.deadline_passed
+        release.set()
+        await task
+
+    @pytest.mark.asyncio
+    async def test_subscriptions_end_when_draining_begins(self):
+        lifecycle = Lifecycle(drain_timeout=1)
+        closed = asyncio.Event()
+
+        async def endless():
+            try:
+                yield "first"
+                await asyncio.Event().wait()
+            finally:
+                closed.set()
+
+        received = []
+
+        async def subscriber():
+            async with lifecycle.track_stream():
+                async for message in lifecycle.until_drain(endless()):
+                    received.append(message)
+
+        task = asyncio.create_task(subscriber())
+        await asyncio.sleep(0.01)
+        assert received == ["first"] and lifecycle.active_streams == 1
+
+        lifecycle.begin_drain()
+        assert await lifecycle.wait_for_streams()
+        assert closed.is_set()
+        await task
+
+    def test_server_drains_on_exit_signal(self):
+        lifecycle = Lifecycle()
+        server = DrainingServer(uvicorn.Config(app), lifecycle)
+        server.handle_exit(signal.SIGTERM, None)
+        assert lifecycle.draining and server.should_exit
+
+
+class TestReadiness:
+    """Readiness endpoint and stream refusal while draining."""
+
+    def setup_method(self):
+        init_db()
+
+    def test_not_ready_before_startup(self, monkeypatch):
+        monkeypatch.setattr(main, "lifecycle", Lifecycle())
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["ready"] is False
+
+    def test_ready_after_warmup(self, monkeypatch, stub_service):
+        monkeypatch.setattr(main, "lifecycle", Lifecycle())
+        # The in-memory test database lives in its single pooled connection.
+        monkeypatch.setattr(main.engine, "dispose", lambda: None)
+        with TestClient(app) as started:
+            response = started.get("/ready")
+            assert response.status_code == 200
+            body = response.json()
+            assert body["ready"] is True and body["active_streams"] == 0
+            assert body["dependencies"]["database"]["status"] == "ok"
+            assert body["dependencies"]["ai_provider"]["status"] == "ok"
+        assert stub_service.provider.warmed
+        assert main.lifecycle.draining
+
+    def test_new_streams_refused_while_draining(self, monkeypatch, stub_service):
+        draining = Lifecycle()
+        draining.begin_drain()
+        monkeypatch.setattr(main, "lifecycle", draining)
+        response = client.post("/chat/stream", json={"content": "hello"})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert client.get("/ready").status_code == 503
+        assert client.get("/conversations/events").status_code == 503
+
+    def test_stream_interrupted_after_deadline(self, monkeypatch, stub_service):
+        lifecycle = Lifecycle(drain_timeout=0)
+        monkeypatch.setattr(main, "lifecycle", lifecycle)
+
+        async def stream_then_drain(prompt, conversation_history, model=None, usage=None, documents=None):
+            # SIGTERM arrives while the first chunk is being produced.
+            lifecycle.begin_drain()
+            for chunk in ("one ", "two ", "three"):
+                yield chunk
+
+        monkeypatch.setattr(stub_service.provider, "stream_response", stream_then_drain)
+        body = client.post("/chat/stream", json={"content": "hello"}).text
+
+        assert '"content": "one "' in body
+        assert '"content": "two "' not in body
+        assert '"interrupted": true' in body
+        assert lifecycle.active_streams == 0
@@ -0,0 +1,112 @@
+"""Tests for the OpenAI-compatible local provider against a stub server."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.services.ai_service import AIService, LocalProvider
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal `/v1/chat/completions` implementation."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.clients.add(self.client_address)
+        time.sleep(server.delay)
+        prompt = body["messages"][-1]["content"]
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in ("echo: ", prompt):
+                chunk = {
+                    "id": "c1", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+        else:
+            payload = json.dumps({
+                "id": "c1", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": f"echo: {prompt}"},
+                }],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        with server.lock:
+            server.in_flight -= 1
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.clients = set()
+    server.delay = 0.0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setenv("AI_PROVIDER", "local")
+    monkeypatch.setenv("LOCAL_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setenv("LOCAL_MODEL", "stub-model")
+    monkeypatch.setenv("LOCAL_MAX_CONCURRENCY", "2")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestLocalProvider:
+    """Local provider tests."""
+
+    @pytest.mark.asyncio
+    async def test_generate_response(self, stub_server):
+        service = AIService()
+        assert isinstance(service.provider, LocalProvider)
+
+        text, tokens = await service.generate_response("hi", [("a", "b")])
+        assert text == "echo: hi"
+        assert tokens == 5
+        await service.aclose()
+
+    @pytest.mark.asyncio
+    async def test_stream_response(self, stub_server):
+        service = AIService()
+        chunks = [c async for c in service.stream_response("hi", [])]
+        assert "".join(chunks) == "echo: hi"
+        await service.aclose()
+
+    @pytest.mark.asyncio
+    async def test_batch_respects_slots_and_reuses_connections(self, stub_server):
+        stub_server.delay = 0.05
+        service = AIService()
+
+        results = await service.generate_batch([(f"p{i}", []) for i in range(6)])
+        assert [text for text, _ in results] == [f"echo: p{i}" for i in range(6)]
+        assert stub_server.max_in_flight <= 2
+        # Keep-alive pool: never more connections than slots.
+        assert len(stub_server.clients) <= 2
+        await service.aclose()
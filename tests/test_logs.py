@@ -0,0 +1,95 @@
+"""Tests for structured queue-based logging."""
+import io
+import json
+import logging
+import random
+
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.services.logs import (
+    ContextQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    configure_logging,
+    request_id_var,
+    stop_logging,
+)
+
+client = TestClient(app)
+
+
+def make_record(msg, args=(), level=logging.INFO, **extra):
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestFormatting:
+    """JSON lines and deferred formatting."""
+
+    def test_json_fields(self):
+        record = make_record("Saved %d messages", (3,), conversation_id="c1", request_id="r1", trace_id="-")
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry["message"] == "Saved 3 messages"
+        assert entry["level"] == "INFO"
+        assert entry["conversation_id"] == "c1"
+        assert entry["request_id"] == "r1"
+
+    def test_plain_arguments_are_formatted_later(self):
+        handler = ContextQueueHandler(None)
+        token = request_id_var.set("req-1")
+        try:
+            deferred = handler.prepare(make_record("%s took %.1fs", ("export", 1.25)))
+            eager = handler.prepare(make_record("Counts: %s", ({"rows": 1},)))
+        finally:
+            request_id_var.reset(token)
+        assert deferred.args == ("export", 1.25) and deferred.request_id == "req-1"
+        # Mutable arguments are rendered at the call site.
+        assert eager.args is None and eager.msg == "Counts: {'rows': 1}"
+
+    def test_exception_rendered_before_queueing(self):
+        handler = ContextQueueHandler(None)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed", (), __import__("sys").exc_info())
+        prepared = handler.prepare(record)
+        assert prepared.exc_info is None
+        assert "ValueError: boom" in json.loads(JsonFormatter().format(prepared))["exception"]
+
+
+class TestSampling:
+    """Debug records are sampled, others always kept."""
+
+    def test_debug_sampling(self):
+        random.seed(1)
+        sampler = SamplingFilter(rate=0.1)
+        kept = sum(sampler.filter(make_record("tick", level=logging.DEBUG)) for _ in range(2000))
+        assert 100 < kept < 300
+        assert sampler.dropped == 2000 - kept
+        assert sampler.filter(make_record("important", level=logging.INFO))
+
+
+class TestPipeline:
+    """End to end through the queue listener."""
+
+    def test_records_reach_the_stream(self):
+        buffer = io.StringIO()
+        configure_logging(level="DEBUG", fmt="json", debug_sample_rate=0, stream=buffer)
+        try:
+            log = logging.getLogger("pipeline-test")
+            log.debug("dropped by sampling")
+            log.info("Processed %d items", 5, extra={"queue": "memory.index"})
+            stop_logging()
+            lines = [json.loads(line) for line in buffer.getvalue().splitlines()]
+        finally:
+            configure_logging()
+        assert [line["message"] for line in lines] == ["Processed 5 items"]
+        assert lines[0]["queue"] == "memory.index"
+
+    def test_request_id_header(self):
+        response = client.get("/health", headers={"X-Request-ID": "abc-123"})
+        assert response.headers["x-request-id"] == "abc-123"
+        generated = client.get("/health").headers["x-request-id"]
+        assert len(generated) == 32
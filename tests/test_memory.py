@@ -0,0 +1,128 @@
+"""Tests for long-term conversation memory."""
+import pytest
+from fastapi.testclient import TestClient
+
+import src.main as main
+from src.database import SessionLocal, init_db, Conversation, Message, MessageEmbedding
+from src.services.embeddings import HashingEmbedder
+from src.services.memory import ConversationMemory, backfill
+
+
+def make_memory(**kwargs) -> ConversationMemory:
+    return ConversationMemory(HashingEmbedder(), **kwargs)
+
+
+class TestConversationMemory:
+    """Recall, context assembly and backfill tests."""
+
+    def setup_method(self):
+        init_db()
+        db = SessionLocal()
+        db.add(Conversation(id="mem-old", user_id="mem-alice", title="Travel"))
+        db.add(Conversation(id="mem-new", user_id="mem-alice", title="Today"))
+        db.add(Conversation(id="mem-other", user_id="mem-bob", title="Bob"))
+        db.add_all([
+            Message(id="mem-1", conversation_id="mem-old",
+                    user_message="I am allergic to peanuts",
+                    ai_response="Noted, I will avoid recipes with peanuts."),
+            Message(id="mem-2", conversation_id="mem-old",
+                    user_message="Book a flight to Lisbon", ai_response="Flights to Lisbon found."),
+            Message(id="mem-3", conversation_id="mem-other",
+                    user_message="Peanuts recipes please", ai_response="Peanut butter cookies."),
+        ])
+        db.add_all([
+            Message(id=f"mem-recent-{i}", conversation_id="mem-new",
+                    user_message=f"Question {i}", ai_response=f"Answer {i}")
+            for i in range(5)
+        ])
+        db.commit()
+        db.close()
+
+    def teardown_method(self):
+        db = SessionLocal()
+        for message in db.query(Message).filter(Message.id.like("mem-%")):
+            db.delete(message)
+        db.query(Conversation).filter(Conversation.id.like("mem-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    @pytest.mark.asyncio
+    async def test_backfill_embeds_missing_messages_once(self):
+        memory = make_memory()
+        assert await backfill(memory, batch_size=2) >= 8
+        assert await backfill(memory, batch_size=2) == 0
+
+        db = SessionLocal()
+        row = db.get(MessageEmbedding, "mem-3")
+        assert row.user_id == "mem-bob"
+        assert len(row.vector) == memory.embedder.dimension * 4
+        db.close()
+
+    @pytest.mark.asyncio
+    async def test_context_is_recalled_turns_then_recent_turns(self):
+        memory = make_memory(recent_turns=2, recall_k=1, min_score=0.1)
+        await backfill(memory)
+
+        db = SessionLocal()
+        context = await memory.assemble_context(db, "mem-new", "mem-alice", "suggest a snack without peanuts")
+        db.close()
+
+        assert context[0][0] == "I am allergic to peanuts"
+        assert [turn[0] for turn in context[1:]] == ["Question 3", "Question 4"]
+
+    @pytest.mark.asyncio
+    async def test_recall_is_scoped_to_the_user(self):
+        memory = make_memory(recall_k=5, min_score=0.0)
+        await backfill(memory)
+
+        db = SessionLocal()
+        recalled = await memory.recall(db, "mem-alice", "peanuts recipes", exclude=[])
+        db.close()
+
+        assert "mem-3" not in recalled
+        assert "mem-1" in recalled
+
+    @pytest.mark.asyncio
+    async def test_new_turns_are_indexed_into_cached_index(self):
+        memory = make_memory(recall_k=1, min_score=0.1)
+        db = SessionLocal()
+        assert await memory.recall(db, "mem-alice", "kayak rental", exclude=[]) == []
+
+        await memory.index_messages([("mem-2", "mem-alice", "Where can I rent a kayak?", "At the harbour.")])
+        assert await memory.recall(db, "mem-alice", "kayak rental", exclude=[]) == ["mem-2"]
+        db.close()
+
+    @pytest.mark.asyncio
+    async def test_anonymous_users_get_recent_turns_only(self):
+        memory = make_memory(recent_turns=3)
+        db = SessionLocal()
+        context = await memory.assemble_context(db, "mem-new", None, "peanuts")
+        db.close()
+        assert [turn[0] for turn in context] == ["Question 2", "Question 3", "Question 4"]
+
+    def test_disabled_by_default_with_hashing_embedder(self, monkeypatch):
+        monkeypatch.delenv("MEMORY_ENABLED", raising=False)
+        monkeypatch.setenv("EMBEDDING_PROVIDER", "hashing")
+        assert ConversationMemory.from_env() is None
+        monkeypatch.setenv("MEMORY_ENABLED", "True")
+        assert ConversationMemory.from_env() is not None
+
+    @pytest.mark.parametrize("path", ["/chat", "/chat/stream", "/chat/compare"])
+    def test_context_recalls_the_conversation_owner(self, monkeypatch, stub_provider, path):
+        stub_provider("quiet")
+        monkeypatch.setattr(main, "memory", None)
+        owners = []
+
+        async def load_context(db, leaf_id, user_id, prompt):
+            owners.append(user_id)
+            return []
+
+        monkeypatch.setattr(main, "_load_context", load_context)
+        body = {"content": "peanuts?", "conversation_id": "mem-old", "user_id": "mem-bob"}
+        if path == "/chat/compare":
+            body["targets"] = ["quiet"]
+        with TestClient(main.app).stream("POST", path, json=body) as response:
+            assert response.status_code == 200
+            response.read()
+        # Another user's id never selects whose turns are recalled.
+        assert owners == ["mem-alice"]
@@ -0,0 +1,140 @@
+"""Tests for the usage ledger, rollups and quotas."""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.main as main
+from src.main import app
+from src.database import SessionLocal, UsageEvent, UsageRollup, init_db
+from src.services import metering
+from src.services.ai_service import TokenUsage
+from src.services.metering import QuotaExceeded, UsageMeter, parse_quotas, tenant_subject, user_subject
+from src.services.state import InMemoryStateBackend
+
+client = TestClient(app)
+
+
+def usage(prompt=10, completion=5):
+    return TokenUsage(prompt_tokens=prompt, completion_tokens=completion)
+
+
+class TestQuotaConfig:
+    """Quota specs are parsed strictly."""
+
+    def test_parse(self):
+        rules = parse_quotas("requests/minute=20, tokens/day=200000", "user")
+        assert [(r.metric, r.window, r.limit, r.seconds) for r in rules] == [
+            ("requests", "minute", 20, 60), ("tokens", "day", 200000, 86400),
+        ]
+        assert parse_quotas("", "tenant") == []
+
+    @pytest.mark.parametrize("spec", ["requests/week=1", "bytes/day=5", "tokens=5", "tokens/day=lots"])
+    def test_invalid(self, spec):
+        with pytest.raises(ValueError):
+            parse_quotas(spec, "user")
+
+
+class TestLedger:
+    """Events are buffered, then written with rollup increments in one flush."""
+
+    def setup_method(self):
+        init_db()
+        self.tenant = f"tenant-{uuid.uuid4()}"
+        self.meter = UsageMeter(InMemoryStateBackend())
+
+    def test_flush_writes_events_and_adds_to_rollups(self):
+        asyncio.run(self.meter.record(self.tenant, "ledger-user", "c1", "stub", usage()))
+        asyncio.run(self.meter.record(self.tenant, None, "c2", "stub", usage(20, 0)))
+        assert self.meter.flush() == 2
+        asyncio.run(self.meter.record(self.tenant, "ledger-user", "c1", "stub", usage()))
+        assert self.meter.flush() == 1
+
+        db = SessionLocal()
+        try:
+            assert db.query(UsageEvent).filter(UsageEvent.tenant_id == self.tenant).count() == 3
+            rollups = db.query(UsageRollup).filter(UsageRollup.subject == tenant_subject(self.tenant)).all()
+            assert {r.granularity for r in rollups} == {"hour", "day"}
+            day = next(r for r in rollups if r.granularity == "day")
+            assert (day.requests, day.prompt_tokens, day.total_tokens) == (3, 40, 50)
+        finally:
+            db.close()
+
+    def test_usage_includes_pending_increments(self):
+        asyncio.run(self.meter.record(self.tenant, None, "c1", "stub", usage()))
+        self.meter.flush()
+        asyncio.run(self.meter.record(self.tenant, None, "c1", "stub", usage()))
+        db = SessionLocal()
+        try:
+            (bucket,) = self.meter.usage(db, tenant_subject(self.tenant), datetime.utcnow() - timedelta(days=1))
+        finally:
+            db.close()
+        assert bucket["requests"] == 2 and bucket["total_tokens"] == 30
+
+    def test_failed_flush_keeps_events(self, monkeypatch):
+        asyncio.run(self.meter.record(self.tenant, None, "c1", "stub", usage()))
+
+        def broken(db, rollups):
+            raise RuntimeError("database unavailable")
+
+        monkeypatch.setattr(metering, "_add_rollups", broken)
+        with pytest.raises(RuntimeError):
+            self.meter.flush()
+        assert self.meter.stats()["pending"] == 1 and self.meter.flush_failures == 1
+        monkeypatch.undo()
+        assert self.meter.flush() == 1
+
+
+class TestQuotas:
+    """Quotas are checked before the provider call."""
+
+    def test_request_quota_reserves_slots(self):
+        meter = UsageMeter(InMemoryStateBackend(), quotas=parse_quotas("requests/minute=2", "user"))
+        asyncio.run(meter.admit(None, "quota-user"))
+        asyncio.run(meter.admit(None, "quota-user"))
+        with pytest.raises(QuotaExceeded) as excinfo:
+            asyncio.run(meter.admit(None, "quota-user"))
+        assert excinfo.value.subject == user_subject("quota-user")
+        assert 1 <= excinfo.value.retry_after <= 61
+        # Rejections do not use up the quota, and other users are unaffected.
+        status = asyncio.run(meter.quota_status(None, "quota-user"))
+        assert status[0]["used"] == 2 and status[0]["remaining"] == 0
+        asyncio.run(meter.admit(None, "other-user"))
+
+    def test_token_quota_per_tenant(self):
+        meter = UsageMeter(InMemoryStateBackend(), quotas=parse_quotas("tokens/day=100", "tenant"))
+        asyncio.run(meter.admit("acme", "u1"))
+        asyncio.run(meter.record("acme", "u1", "c1", "stub", usage(90, 20)))
+        with pytest.raises(QuotaExceeded):
+            asyncio.run(meter.admit("acme", "u2"))
+        asyncio.run(meter.admit("globex", "u2"))
+
+
+class TestEndpoints:
+    """Chat routes reject over-quota requests; usage is read from the meter."""
+
+    @pytest.fixture(autouse=True)
+    def stub(self, monkeypatch, stub_provider):
+        init_db()
+        stub_provider(usage=(40, 10))
+        self.meter = UsageMeter(InMemoryStateBackend(), quotas=parse_quotas("requests/minute=1", "user"))
+        monkeypatch.setattr(main, "meter", self.meter)
+
+    def test_quota_exceeded_is_429(self):
+        headers = {"X-Tenant-ID": "endpoint-tenant"}
+        assert client.post("/chat", json={"content": "hi", "user_id": "limited"}, headers=headers).status_code == 200
+        for path in ("/chat", "/chat/stream"):
+            response = client.post(path, json={"content": "again", "user_id": "limited"}, headers=headers)
+            assert response.status_code == 429
+            assert int(response.headers["retry-after"]) >= 1
+            assert response.json()["detail"]["metric"] == "requests"
+
+        quota = client.get("/users/limited/quota", headers=headers).json()
+        assert quota["tenant_id"] == "endpoint-tenant"
+        assert quota["quotas"][0]["remaining"] == 0
+
+        tenant = client.get("/tenants/endpoint-tenant/usage", params={"granularity": "hour"}).json()
+        assert tenant["messages"] == 1 and tenant["total_tokens"] == 50
+        assert tenant["daily"][0]["date"].endswith(":00")
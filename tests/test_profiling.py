@@ -0,0 +1,134 @@
+"""Tests for the sampling profiler and slow-request capture."""
+import asyncio
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import src.main as main
+from src.main import app
+from src.database import init_db
+from src.services.profiling import Profiler, SlowRequestMiddleware, StackSampler, fold, to_collapsed, to_tree
+
+client = TestClient(app)
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+def spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestSampler:
+    """Stacks are sampled, idle threads skipped and folded into flamegraphs."""
+
+    def test_busy_thread_is_sampled(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=spin, args=(stop,))
+        waiter = threading.Thread(target=stop.wait)
+        worker.start()
+        waiter.start()
+        sampler = StackSampler(interval=0.001)
+        try:
+            for _ in range(5):
+                sampler.sample_once()
+                time.sleep(0.002)
+            stacks, truncated = sampler.window(0, time.perf_counter(), {worker.ident, waiter.ident})
+        finally:
+            stop.set()
+            worker.join()
+            waiter.join()
+        assert not truncated
+        folded = fold(stacks)
+        assert all("spin (test_profiling.py" in stack for stack in folded)
+        assert sum(folded.values()) == 5
+
+    def test_on_demand_profile(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=spin, args=(stop,))
+        worker.start()
+        try:
+            stacks = asyncio.run(StackSampler(interval=0.005).profile(0.1))
+        finally:
+            stop.set()
+            worker.join()
+        assert any("spin" in line for line in fold(stacks))
+
+    def test_flamegraph_formats(self):
+        folded = {"main (a.py:1);handle (a.py:5)": 3, "main (a.py:1);query (b.py:9)": 1}
+        assert to_collapsed(folded) == "main (a.py:1);handle (a.py:5) 3\nmain (a.py:1);query (b.py:9) 1\n"
+        tree = to_tree(folded)
+        assert tree["value"] == 4
+        (main_node,) = tree["children"]
+        assert [(child["name"], child["value"]) for child in main_node["children"]] == [
+            ("handle (a.py:5)", 3), ("query (b.py:9)", 1),
+        ]
+
+
+class TestAdminEndpoints:
+    """Profiling endpoints require the admin token."""
+
+    def test_disabled_without_token(self, monkeypatch):
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert client.get("/admin/slow-requests").status_code == 403
+
+    def test_wrong_token(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        assert client.get("/admin/slow-requests", headers={"X-Admin-Token": "nope"}).status_code == 401
+
+    def test_profile(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        response = client.get("/admin/profile?seconds=0.05&format=collapsed", headers=ADMIN)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        tree = client.get("/admin/profile?seconds=0.05&idle=true", headers=ADMIN).json()
+        assert tree["name"] == "root" and tree["value"] > 0
+
+
+class TestSlowRequests:
+    """Slow requests are kept with their SQL statements."""
+
+    def setup_method(self):
+        init_db()
+
+    def test_slow_request_is_captured(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        monkeypatch.setattr(main.profiler, "slow_threshold_ms", 0.001)
+        client.get("/conversations", headers={"X-Request-ID": "slow-1"})
+        monkeypatch.setattr(main.profiler, "slow_threshold_ms", 60_000)
+
+        listing = client.get("/admin/slow-requests", headers=ADMIN).json()
+        summary = next(entry for entry in listing["requests"] if entry["request_id"] == "slow-1")
+        assert summary["route"] == "/conversations" and summary["status"] == 200
+        assert summary["query_count"] >= 1
+        assert "queries" not in summary
+
+        detail = client.get(f"/admin/slow-requests/{summary['id']}", headers=ADMIN).json()
+        assert any(query["statement"].lstrip().upper().startswith("SELECT") for query in detail["queries"])
+        assert detail["flamegraph"]["name"] == "root"
+        assert client.get("/admin/slow-requests/missing", headers=ADMIN).status_code == 404
+
+    def test_fast_requests_are_not_captured(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        before = main.profiler.captured
+        client.get("/health")
+        assert main.profiler.captured == before
+
+    def test_event_streams_release_the_sampler(self):
+        profiler = Profiler()
+        demo = FastAPI()
+        demo.add_middleware(SlowRequestMiddleware, profiler=profiler)
+        held = []
+
+        @demo.get("/events")
+        async def events():
+            async def body():
+                yield "data: {}\n\n"
+                held.append(profiler.sampler._users)
+            return StreamingResponse(body(), media_type="text/event-stream")
+
+        assert TestClient(demo).get("/events").status_code == 200
+        # Streams are never captured, so the sampler is let go once the response starts.
+        assert held == [0] and profiler.sampler._users == 0
@@ -0,0 +1,62 @@
+"""Tests for prompt-prefix caching support."""
+from types import SimpleNamespace
+
+from src.services.ai_service import AnthropicProvider, OpenAIProvider, TokenUsage
+
+
+class TestAnthropicCaching:
+    """Anthropic cache breakpoint tests."""
+
+    def setup_method(self):
+        self.provider = AnthropicProvider.__new__(AnthropicProvider)
+        self.provider.system_prompt = "system"
+        self.provider.prompt_caching = True
+
+    def test_system_prompt_breakpoint(self):
+        (block,) = self.provider._build_system()
+        assert block["text"] == "system"
+        assert block["cache_control"] == {"type": "ephemeral"}
+
+    def test_history_breakpoint_on_last_stored_turn(self):
+        messages = self.provider._build_messages("new", [("q1", "a1"), ("q2", "a2")])
+        assert messages[-1] == {"role": "user", "content": "new"}
+        assert messages[-2]["content"][0]["cache_control"] == {"type": "ephemeral"}
+        assert all(isinstance(m["content"], str) for m in messages[:-2])
+
+    def test_no_breakpoints_when_disabled(self):
+        self.provider.prompt_caching = False
+        assert "cache_control" not in self.provider._build_system()[0]
+        messages = self.provider._build_messages("new", [("q1", "a1")])
+        assert all(isinstance(m["content"], str) for m in messages)
+
+    def test_cached_tokens_count_towards_prompt(self):
+        usage = TokenUsage()
+        AnthropicProvider._read_usage(
+            SimpleNamespace(input_tokens=10, output_tokens=5,
+                            cache_read_input_tokens=900, cache_creation_input_tokens=100),
+            usage,
+        )
+        assert usage.prompt_tokens == 1010
+        assert usage.cached_tokens == 900
+        assert usage.cache_creation_tokens == 100
+
+
+class TestOpenAICaching:
+    """OpenAI prefix ordering and cached token tests."""
+
+    def test_stable_prefix_first(self):
+        provider = OpenAIProvider.__new__(OpenAIProvider)
+        provider.system_prompt = "system"
+        first = provider._build_messages("q2", [("q1", "a1")])
+        second = provider._build_messages("q3", [("q1", "a1"), ("q2", "a2")])
+        assert second[:len(first)] == first
+
+    def test_cached_tokens_from_usage(self):
+        usage = TokenUsage()
+        OpenAIProvider._read_usage(
+            SimpleNamespace(prompt_tokens=2000, completion_tokens=50,
+                            prompt_tokens_details=SimpleNamespace(cached_tokens=1536)),
+            usage,
+        )
+        assert usage.prompt_tokens == 2000
+        assert usage.cached_tokens == 1536
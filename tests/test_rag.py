@@ -0,0 +1,141 @@
+"""Tests for retrieval-augmented generation."""
+import threading
+
+import numpy as np
+import pytest
+
+from src.services.ai_service import OpenAIProvider, build_user_content
+from src.services.embeddings import HashingEmbedder
+from src.services.rag import Retriever, chunk_text, ingest
+from src.services.vector_index import FlatIndex, IVFIndex, load_index
+
+
+class TestChunking:
+    """Chunking tests."""
+
+    def test_small_text_is_one_chunk(self):
+        assert chunk_text("Hello world.") == ["Hello world."]
+
+    def test_chunks_respect_size_and_overlap(self):
+        text = "\n\n".join(f"Paragraph {i} " + "word " * 30 for i in range(20))
+        chunks = chunk_text(text, chunk_size=300, overlap=50)
+        assert len(chunks) > 1
+        assert all(len(c) <= 300 + 50 + 1 for c in chunks)
+        assert chunks[1][:50] == chunks[0][-50:]
+
+
+class TestVectorIndex:
+    """Vector index tests."""
+
+    def setup_method(self):
+        # Real embeddings are clustered by topic; IVF relies on that structure.
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(50, 32))
+        vectors = (centers[rng.integers(50, size=5000)] + rng.normal(scale=0.3, size=(5000, 32))).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.ids = [f"v{i}" for i in range(len(vectors))]
+
+    def test_flat_is_exact(self):
+        index = FlatIndex(np.asarray(self.ids), self.vectors)
+        hits = index.search(self.vectors[42], k=3)
+        assert hits[0][0] == "v42"
+        assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    def test_ivf_recall(self):
+        index = IVFIndex.build(self.ids, self.vectors, nlist=32, nprobe=8)
+        exact = FlatIndex(np.asarray(self.ids), self.vectors)
+        rng = np.random.default_rng(1)
+        recall = []
+        for row in rng.choice(len(self.vectors), 50, replace=False):
+            query = self.vectors[row] + rng.normal(scale=0.05, size=32).astype(np.float32)
+            query /= np.linalg.norm(query)
+            truth = {i for i, _ in exact.search(query, 10)}
+            found = {i for i, _ in index.search(query, 10)}
+            recall.append(len(truth & found) / 10)
+        assert np.mean(recall) > 0.8
+
+    @pytest.mark.parametrize("kind", ["flat", "ivf"])
+    def test_save_and_mmap_load(self, tmp_path, kind):
+        if kind == "flat":
+            index = FlatIndex(np.asarray(self.ids), self.vectors)
+        else:
+            index = IVFIndex.build(self.ids, self.vectors, nlist=16)
+        index.save(tmp_path)
+
+        loaded = load_index(tmp_path)
+        assert loaded.kind == kind
+        assert isinstance(loaded.vectors, np.memmap)
+        assert loaded.search(self.vectors[7], 1)[0][0] == "v7"
+
+    def test_missing_index(self, tmp_path):
+        assert load_index(tmp_path) is None
+
+
+class TestRetriever:
+    """Ingestion and retrieval tests."""
+
+    @pytest.mark.asyncio
+    async def test_ingest_and_retrieve(self, tmp_path):
+        docs = tmp_path / "docs"
+        docs.mkdir()
+        (docs / "refunds.md").write_text("Refunds are issued within 14 days of the purchase date.")
+        (docs / "shipping.txt").write_text("Shipping to Brazil takes five business days by courier.")
+        (docs / "ignored.bin").write_text("binary")
+        embedder = HashingEmbedder()
+
+        assert await ingest([str(docs)], str(tmp_path / "index"), embedder) == 2
+
+        retriever = Retriever(str(tmp_path / "index"), embedder, top_k=1, min_score=0.0)
+        assert not retriever.stats()["loaded"]
+        chunks = await retriever.retrieve("shipping to Brazil")
+        assert chunks[0].source.endswith("shipping.txt")
+        assert "Brazil" in chunks[0].text
+
+        stats = retriever.stats()
+        assert stats["loaded"] and stats["queries"] == 1 and stats["chunks"] == 2
+
+    @pytest.mark.asyncio
+    async def test_blocking_work_runs_off_the_event_loop(self, tmp_path, monkeypatch):
+        (tmp_path / "a.txt").write_text("Refunds are issued within 14 days.")
+        embedder = HashingEmbedder()
+        await ingest([str(tmp_path / "a.txt")], str(tmp_path / "index"), embedder)
+        retriever = Retriever(str(tmp_path / "index"), embedder, min_score=0.0)
+
+        loop_thread = threading.get_ident()
+        threads = []
+        for name in ("_ensure_loaded", "_search"):
+            original = getattr(retriever, name)
+
+            def spy(*args, original=original, name=name):
+                threads.append((name, threading.get_ident() != loop_thread))
+                return original(*args)
+
+            monkeypatch.setattr(retriever, name, spy)
+        embed_sync = embedder.embed_sync
+        monkeypatch.setattr(embedder, "embed_sync", lambda texts: threads.append(
+            ("embed", threading.get_ident() != loop_thread)) or embed_sync(texts))
+
+        assert len(await retriever.retrieve("refunds")) == 1
+        assert threads == [("_ensure_loaded", True), ("embed", True), ("_search", True)]
+
+    @pytest.mark.asyncio
+    async def test_dimension_mismatch_disables_retrieval(self, tmp_path):
+        (tmp_path / "a.txt").write_text("some text")
+        await ingest([str(tmp_path / "a.txt")], str(tmp_path / "index"), HashingEmbedder(64))
+        retriever = Retriever(str(tmp_path / "index"), HashingEmbedder(128))
+        assert await retriever.retrieve("text") == []
+
+
+class TestContextInjection:
+    """Prompt assembly tests."""
+
+    def test_documents_go_into_final_user_message(self):
+        provider = OpenAIProvider.__new__(OpenAIProvider)
+        provider.system_prompt = "system"
+        messages = provider._build_messages("question?", [("q", "a")], ["doc one", "doc two"])
+        assert messages[0] == {"role": "system", "content": "system"}
+        assert messages[-1]["content"] == build_user_content("question?", ["doc one", "doc two"])
+        assert "[2] doc two" in messages[-1]["content"]
+
+    def test_no_documents(self):
+        assert build_user_content("question?") == "question?"
@@ -0,0 +1,180 @@
+"""Tests for circuit breakers, retry budgets and typed provider errors."""
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.database import SessionLocal, init_db, Message
+from src.services import resilience
+from src.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ProviderError,
+    RetryBudget,
+    call_with_retries,
+    classify,
+    stream_with_retries,
+)
+
+client = TestClient(app)
+
+
+class StatusError(Exception):
+    """Stand-in for an SDK error carrying an HTTP status."""
+
+    def __init__(self, status_code: int, message: str = "failed"):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class TestClassify:
+    """Mapping of SDK exceptions to error kinds."""
+
+    def test_kinds(self):
+        assert classify("p", TimeoutError()).kind == "timeout"
+        assert classify("p", APIConnectionError("reset")).kind == "unavailable"
+        assert classify("p", StatusError(503)).retryable
+        rate_limited = classify("p", StatusError(429))
+        assert rate_limited.kind == "rate_limited" and rate_limited.status_code == 429
+        bad_request = classify("p", StatusError(400))
+        assert bad_request.kind == "bad_request" and not bad_request.retryable
+        assert classify("p", ValueError("boom")).kind == "error"
+
+
+class TestCircuitBreaker:
+    """Closed, open and half-open transitions."""
+
+    def test_opens_after_threshold_and_recovers(self):
+        breaker = CircuitBreaker("p", failure_threshold=2, recovery_time=0.05)
+        breaker.record_failure()
+        breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+
+        time.sleep(0.06)
+        breaker.allow()
+        assert breaker.state == "half_open"
+        # Only one trial call at a time while half-open.
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed"
+        assert breaker.stats()["times_opened"] == 1
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker("p", failure_threshold=1, recovery_time=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+
+class TestRetries:
+    """Bounded retries with a shared budget."""
+
+    @pytest.mark.asyncio
+    async def test_retries_then_succeeds(self):
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise StatusError(502)
+            return "ok"
+
+        breaker = CircuitBreaker("p", failure_threshold=5)
+        result = await call_with_retries("p", flaky, max_retries=2, backoff=0, breaker=breaker, budget=RetryBudget())
+        assert result == "ok" and len(attempts) == 3
+        assert breaker.state == "closed" and breaker.failures == 0
+
+    @pytest.mark.asyncio
+    async def test_bad_request_is_not_retried(self):
+        attempts = []
+
+        async def invalid():
+            attempts.append(1)
+            raise StatusError(400, "bad input")
+
+        with pytest.raises(ProviderError) as excinfo:
+            await call_with_retries("p", invalid, backoff=0, breaker=CircuitBreaker("p"), budget=RetryBudget())
+        assert excinfo.value.kind == "bad_request"
+        assert len(attempts) == 1
+
+    @pytest.mark.asyncio
+    async def test_budget_limits_retries(self):
+        budget = RetryBudget(ratio=0, min_per_second=0.1, window=10)
+        attempts = []
+
+        async def down():
+            attempts.append(1)
+            raise StatusError(503)
+
+        breaker = CircuitBreaker("p", failure_threshold=100)
+        for _ in range(3):
+            with pytest.raises(ProviderError):
+                await call_with_retries("p", down, max_retries=3, backoff=0, breaker=breaker, budget=budget)
+        # A floor of one retry per 10s window: 3 first attempts plus a single retry.
+        assert len(attempts) == 4
+        assert budget.stats()["exhausted"] == 3
+
+    @pytest.mark.asyncio
+    async def test_stream_not_retried_after_first_chunk(self):
+        opened = []
+
+        async def stream():
+            opened.append(1)
+            yield "partial"
+            raise StatusError(503)
+
+        chunks = []
+        with pytest.raises(ProviderError):
+            async for chunk in stream_with_retries("p", stream, backoff=0, breaker=CircuitBreaker("p"),
+                                                   budget=RetryBudget()):
+                chunks.append(chunk)
+        assert chunks == ["partial"] and len(opened) == 1
+
+
+@pytest.fixture
+def failing_service(monkeypatch, stub_provider):
+    monkeypatch.setenv("PROVIDER_RETRY_BACKOFF", "0")
+    monkeypatch.setitem(resilience._breakers, "failing", CircuitBreaker("failing", failure_threshold=3))
+    return stub_provider("failing", error=APIConnectionError("connection reset"))
+
+
+class TestChatErrors:
+    """Provider failures reach clients as typed errors and are never saved."""
+
+    def setup_method(self):
+        init_db()
+
+    def test_stream_emits_typed_error_event(self, failing_service):
+        body = client.post("/chat/stream", json={"content": "hello", "conversation_id": "res-stream"}).text
+        assert '"type": "error"' in body
+        assert '"error": "unavailable"' in body
+        assert "Error:" not in body and '"type": "done"' not in body
+        assert len(failing_service.provider.calls) == 3
+
+        db = SessionLocal()
+        try:
+            assert db.query(Message).filter(Message.conversation_id == "res-stream").count() == 0
+        finally:
+            db.close()
+
+    def test_open_circuit_fails_fast(self, failing_service):
+        client.post("/chat/stream", json={"content": "hello"})
+        assert failing_service.breaker.state == "open"
+        calls = len(failing_service.provider.calls)
+
+        response = client.post("/chat", json={"content": "hello"})
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        assert len(failing_service.provider.calls) == calls
+        assert client.get("/providers/stats").json()["breakers"]["failing"]["state"] == "open"
@@ -0,0 +1,101 @@
+"""Tests for retention policies and bulk deletes."""
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from src.database import SessionLocal, init_db, Conversation, Message, MessageEmbedding, RetentionPolicy
+from src.main import app
+from src.services.retention import RetentionEngine
+
+client = TestClient(app)
+OLD = datetime.utcnow() - timedelta(days=40)
+
+
+class TestRetention:
+    """Bulk delete, erasure and policy tests."""
+
+    def setup_method(self):
+        init_db()
+        db = SessionLocal()
+        conversations = [
+            ("ret-a-old", "ret-alice", OLD), ("ret-a-new", "ret-alice", datetime.utcnow()),
+            ("ret-b-old", "ret-bob", OLD), ("ret-anon-old", None, OLD),
+        ]
+        for cid, user_id, updated_at in conversations:
+            db.add(Conversation(id=cid, user_id=user_id, title=cid, updated_at=updated_at))
+        db.flush()
+        for cid, user_id, _ in conversations:
+            for i in range(3):
+                db.add(Message(id=f"{cid}-m{i}", conversation_id=cid, user_message="q", ai_response="a"))
+        db.flush()
+        db.add(MessageEmbedding(message_id="ret-a-old-m0", user_id="ret-alice", model="hashing", vector=b"\0" * 8))
+        db.commit()
+        db.close()
+
+    def teardown_method(self):
+        db = SessionLocal()
+        db.query(MessageEmbedding).filter(MessageEmbedding.message_id.like("ret-%")).delete(synchronize_session=False)
+        db.query(Message).filter(Message.id.like("ret-%")).delete(synchronize_session=False)
+        db.query(Conversation).filter(Conversation.id.like("ret-%")).delete(synchronize_session=False)
+        db.query(RetentionPolicy).filter(RetentionPolicy.user_id.like("ret-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    def _remaining(self):
+        db = SessionLocal()
+        ids = {c.id for c in db.query(Conversation.id).filter(Conversation.id.like("ret-%"))}
+        messages = db.query(Message).filter(Message.id.like("ret-%")).count()
+        db.close()
+        return ids, messages
+
+    def test_erase_user_in_batches(self):
+        engine = RetentionEngine(batch_size=1, pause=0)
+        db = SessionLocal()
+        counts = engine.erase_user(db, "ret-alice")
+        db.close()
+
+        assert counts == {"conversations": 2, "messages": 6, "embeddings": 1}
+        ids, messages = self._remaining()
+        assert ids == {"ret-b-old", "ret-anon-old"}
+        assert messages == 6
+        assert engine.stats()["deleted"]["messages"] == 6
+
+    def test_policies_override_default(self):
+        db = SessionLocal()
+        db.add(RetentionPolicy(user_id="ret-bob", days=60))
+        db.commit()
+        counts = RetentionEngine(default_days=30, pause=0).apply_policies(db)
+        db.close()
+
+        ids, _ = self._remaining()
+        # Bob keeps 60 days; Alice's and anonymous old conversations fall under the 30-day default.
+        assert {"ret-a-new", "ret-b-old"} <= ids
+        assert not ids & {"ret-a-old", "ret-anon-old"}
+        assert counts["conversations"] >= 2
+
+    def test_database_cascades_deletes(self):
+        db = SessionLocal()
+        db.query(Conversation).filter(Conversation.id == "ret-b-old").delete(synchronize_session=False)
+        db.commit()
+        assert db.query(Message).filter(Message.conversation_id == "ret-b-old").count() == 0
+        db.close()
+
+    def test_endpoints(self, monkeypatch):
+        assert client.delete("/conversation/ret-b-old").status_code == 200
+        assert client.delete("/conversation/ret-b-old").status_code == 404
+
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert client.delete("/users/ret-alice/data").status_code == 403
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        assert client.delete("/users/ret-alice/data", headers={"X-Admin-Token": "nope"}).status_code == 401
+        response = client.delete("/users/ret-alice/data", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert response.json()["messages"] == 6
+
+        admin = {"X-Admin-Token": "secret"}
+        assert client.put("/users/ret-bob/retention", json={"days": 1}).status_code == 401
+        assert client.delete("/users/ret-bob/retention").status_code == 401
+        response = client.put("/users/ret-bob/retention", json={"days": 7}, headers=admin)
+        assert response.json() == {"user_id": "ret-bob", "days": 7}
+        assert client.put("/users/ret-bob/retention", json={"days": 0}, headers=admin).status_code == 422
+        assert client.get("/retention/stats").json()["deleted"]["conversations"] >= 3
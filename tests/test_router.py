@@ -0,0 +1,49 @@
+"""Tests for complexity-based model routing."""
+from src.services.router import ModelRouter, LIGHT, HEAVY, PINNED
+
+
+class TestModelRouter:
+    """Model router tests."""
+
+    def setup_method(self):
+        self.router = ModelRouter(heavy_model="big", light_model="small")
+
+    def test_short_prompt_goes_light(self):
+        route = self.router.select("Oi, tudo bem?", [])
+        assert route.name == LIGHT
+        assert route.model == "small"
+
+    def test_complex_prompt_goes_heavy(self):
+        route = self.router.select("Explain why this fails:\n```python\nx = 1/0\n```", [])
+        assert route.name == HEAVY
+        assert route.model == "big"
+
+    def test_long_prompt_goes_heavy(self):
+        assert self.router.classify("a" * 1000, []) == HEAVY
+
+    def test_long_history_adds_weight(self):
+        history = [("q", "a")] * 10
+        assert self.router.classify("a" * 250, []) == LIGHT
+        assert self.router.classify("a" * 250, history) == HEAVY
+
+    def test_disabled_without_light_model(self):
+        router = ModelRouter(heavy_model="big")
+        assert not router.enabled
+        assert router.select("hi", []).model == "big"
+
+    def test_pinned_model(self):
+        route = self.router.select("hi", [], model="custom")
+        assert route.name == PINNED
+        assert route.model == "custom"
+
+    def test_stats(self):
+        route = self.router.select("hi", [])
+        self.router.record(route, 0.2, tokens=10)
+        self.router.record(route, 0.4, error=True)
+
+        stats = self.router.stats()["routes"][LIGHT]["small"]
+        assert stats["requests"] == 2
+        assert stats["errors"] == 1
+        assert stats["total_tokens"] == 10
+        assert stats["avg_latency_ms"] == 300.0
+        assert stats["max_latency_ms"] == 400.0
@@ -0,0 +1,96 @@
+"""Tests for full-text search."""
+from fastapi.testclient import TestClient
+
+from src.database import SessionLocal, get_db, init_db, Conversation, Message
+from src.main import app
+from src.services.search import build_fts5_query
+
+client = TestClient(app)
+
+
+class TestQueryBuilder:
+    """FTS5 query sanitisation tests."""
+
+    def test_terms_are_quoted(self):
+        assert build_fts5_query('docker "compose') == '"docker" "compose"*'
+
+    def test_operators_are_neutralised(self):
+        assert build_fts5_query("NOT OR (*)") == '"NOT" "OR"*'
+
+    def test_empty_query(self):
+        assert build_fts5_query("?!") is None
+
+
+class TestSearchEndpoint:
+    """Search endpoint tests."""
+
+    def setup_method(self):
+        init_db()
+        db = SessionLocal()
+        db.add(Conversation(id="search-c1", user_id="search-alice", title="Docker"))
+        db.add(Conversation(id="search-c2", user_id="search-bob", title="Python"))
+        db.add_all([
+            Message(id="search-m1", conversation_id="search-c1",
+                    user_message="How do I use docker compose?",
+                    ai_response="Run docker compose up to start every service."),
+            Message(id="search-m2", conversation_id="search-c1",
+                    user_message="And volumes?", ai_response="Declare volumes in the compose file."),
+            Message(id="search-m3", conversation_id="search-c2",
+                    user_message="Como usar docker com Python?", ai_response="Use uma imagem python:3.11-slim."),
+        ])
+        db.commit()
+        db.close()
+
+    def teardown_method(self):
+        db = SessionLocal()
+        for message in db.query(Message).filter(Message.id.like("search-%")):
+            db.delete(message)
+        db.query(Conversation).filter(Conversation.id.like("search-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    def test_ranked_results_with_snippets(self):
+        response = client.get("/search", params={"q": "docker compose"})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["message_id"] == "search-m1"
+        assert "<mark>" in results[0]["snippet"]
+        assert {r["message_id"] for r in results} == {"search-m1"}
+
+    def test_user_scope(self):
+        response = client.get("/search", params={"q": "docker", "user_id": "search-bob"})
+        assert [r["message_id"] for r in response.json()["results"]] == ["search-m3"]
+
+    def test_prefix_and_pagination(self):
+        first = client.get("/search", params={"q": "dock", "limit": 1}).json()["results"]
+        second = client.get("/search", params={"q": "dock", "limit": 1, "offset": 1}).json()["results"]
+        assert len(first) == len(second) == 1
+        assert first[0]["message_id"] != second[0]["message_id"]
+
+    def test_index_follows_updates_and_deletes(self):
+        db = SessionLocal()
+        message = db.get(Message, "search-m2")
+        message.ai_response = "Declare kubernetes volumes instead."
+        db.commit()
+        db.close()
+        assert client.get("/search", params={"q": "kubernetes"}).json()["results"][0]["message_id"] == "search-m2"
+
+        db = SessionLocal()
+        db.delete(db.get(Message, "search-m2"))
+        db.commit()
+        db.close()
+        assert client.get("/search", params={"q": "kubernetes"}).json()["results"] == []
+
+    def test_unsupported_dialect_is_501(self, monkeypatch):
+        def mysql_db():
+            db = SessionLocal()
+            monkeypatch.setattr(db.get_bind().dialect, "name", "mysql")
+            try:
+                yield db
+            finally:
+                db.close()
+
+        monkeypatch.setitem(app.dependency_overrides, get_db, mysql_db)
+        response = client.get("/search", params={"q": "docker"})
+        assert response.status_code == 501
+        assert "mysql" in response.json()["detail"]
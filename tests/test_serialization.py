@@ -0,0 +1,49 @@
+"""Tests for the projected, orjson-serialized read endpoints."""
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.database import SessionLocal, Conversation, Message, init_db
+from src.models.schemas import ConversationHistory
+
+client = TestClient(app)
+
+
+class TestProjections:
+    """Column projections produce the documented response shapes."""
+
+    def setup_method(self):
+        init_db()
+        self.user_id = f"proj-{uuid.uuid4()}"
+        self.conversation_id = str(uuid.uuid4())
+        start = datetime(2024, 1, 15, 10, 0, 0, 123456)
+        db = SessionLocal()
+        try:
+            db.add(Conversation(id=self.conversation_id, user_id=self.user_id, title="Projected"))
+            for i in range(3):
+                db.add(Message(
+                    conversation_id=self.conversation_id,
+                    user_message=f"question {i}",
+                    ai_response=f"answer {i}",
+                    tokens_used=None if i == 0 else 10,
+                    created_at=start + timedelta(minutes=i),
+                ))
+            db.commit()
+        finally:
+            db.close()
+
+    def test_history_matches_schema(self):
+        response = client.get(f"/conversation/{self.conversation_id}")
+        assert response.headers["content-type"] == "application/json"
+        body = response.json()
+        history = ConversationHistory.model_validate(body)
+        assert history.total_messages == 3
+        assert [m.user_message for m in history.messages] == ["question 0", "question 1", "question 2"]
+        assert body["messages"][0]["tokens_used"] == 0
+        assert body["messages"][0]["timestamp"] == "2024-01-15T10:00:00.123456"
+
+    def test_list_counts_messages(self):
+        listed = client.get("/conversations", params={"user_id": self.user_id}).json()["conversations"]
+        assert [(c["id"], c["title"], c["messages_count"]) for c in listed] == [(self.conversation_id, "Projected", 3)]
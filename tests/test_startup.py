@@ -0,0 +1,68 @@
+"""Tests for startup: lazy provider loading and the gunicorn worker profile."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SDKS = ("openai", "anthropic", "google.generativeai", "pyarrow")
+
+
+def loaded_modules(code: str, **env) -> set:
+    """Run ``code`` in a fresh interpreter and return which SDKs it imported."""
+    script = f"{code}\nimport sys\nprint('SDKS=' + ','.join(m for m in {SDKS!r} if m in sys.modules))"
+    environment = {k: v for k, v in os.environ.items() if not k.endswith("_API_KEY")}
+    environment.update({"DATABASE_URL": "sqlite:///:memory:", **env})
+    stdout = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, env=environment,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    output = stdout.rsplit("SDKS=", 1)[1].strip()
+    return set(filter(None, output.split(",")))
+
+
+def test_importing_the_app_loads_no_provider_sdk():
+    # No API keys set either: the provider is only built on startup.
+    assert loaded_modules("import src.main") == set()
+
+
+def test_only_the_selected_sdk_is_loaded():
+    code = "from src.services.ai_service import AIService\nAIService()"
+    assert loaded_modules(code, AI_PROVIDER="anthropic", ANTHROPIC_API_KEY="k") == {"anthropic"}
+    assert loaded_modules(code, AI_PROVIDER="openai", OPENAI_API_KEY="k") == {"openai"}
+
+
+def gunicorn_workers(**env) -> subprocess.CompletedProcess:
+    environment = {k: v for k, v in os.environ.items() if k not in ("WEB_CONCURRENCY", "STATE_BACKEND_URL")}
+    environment.update(env)
+    return subprocess.run(
+        [sys.executable, "-c", "import runpy; print(runpy.run_path('gunicorn.conf.py')['workers'])"],
+        cwd=ROOT, env=environment, capture_output=True, text=True,
+    )
+
+
+def test_gunicorn_defaults_to_one_worker_without_shared_state():
+    assert gunicorn_workers().stdout.strip() == "1"
+    assert int(gunicorn_workers(STATE_BACKEND_URL="redis://redis:6379/0").stdout) >= 1
+    refused = gunicorn_workers(WEB_CONCURRENCY="4", STATE_BACKEND_URL="memory://")
+    assert refused.returncode != 0 and "shared STATE_BACKEND_URL" in refused.stderr
+
+
+def test_main_refuses_several_workers():
+    environment = {**os.environ, "DATABASE_URL": "sqlite:///:memory:", "API_DEBUG": "False", "WEB_CONCURRENCY": "4"}
+    refused = subprocess.run(
+        [sys.executable, "-m", "src.main"], cwd=ROOT, env=environment, capture_output=True, text=True, timeout=60,
+    )
+    assert refused.returncode != 0 and "gunicorn -c gunicorn.conf.py" in refused.stderr
+
+
+def test_services_package_does_not_load_every_service():
+    script = (
+        "import sys\nimport src.services.state\n"
+        "print(','.join(m for m in ('zstandard', 'src.database', 'src.services.archive', "
+        "'src.services.memory', 'src.services.retention') if m in sys.modules))"
+    )
+    loaded = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert loaded == ""
@@ -0,0 +1,85 @@
+"""Tests for the shared state backends."""
+import asyncio
+
+import pytest
+
+from src.services.state import InMemoryStateBackend, RedisStateBackend, create_state_backend
+
+
+def make_memory():
+    return InMemoryStateBackend()
+
+
+def make_fakeredis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStateBackend("redis://fake", client=fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+@pytest.fixture(params=[make_memory, make_fakeredis], ids=["memory", "fakeredis"])
+def backend(request):
+    return request.param()
+
+
+class TestStateBackend:
+    """Backend contract tests, run against every implementation."""
+
+    @pytest.mark.asyncio
+    async def test_counters(self, backend):
+        assert await backend.incr("hits") == 1
+        assert await backend.incr("hits", 5) == 6
+        assert await backend.get("hits") == "6"
+
+    @pytest.mark.asyncio
+    async def test_ttl_entries(self, backend):
+        await backend.set("short", "v", ttl=0.05)
+        await backend.set("long", "v")
+        await backend.incr("window", ttl=0.05)
+        assert await backend.get("short") == "v"
+        await asyncio.sleep(0.1)
+        assert await backend.get("short") is None
+        assert await backend.get("window") is None
+        assert await backend.get("long") == "v"
+        await backend.delete("long")
+        assert await backend.get("long") is None
+
+    @pytest.mark.asyncio
+    async def test_pubsub(self, backend):
+        received = []
+
+        async def consume():
+            subscription = backend.subscribe("events")
+            try:
+                async for message in subscription:
+                    received.append(message)
+                    if len(received) == 2:
+                        break
+            finally:
+                await subscription.aclose()
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        await backend.publish("events", "one")
+        await backend.publish("events", "two")
+        await asyncio.wait_for(task, 2)
+        assert received == ["one", "two"]
+        await backend.aclose()
+
+
+@pytest.mark.asyncio
+async def test_redis_incr_always_sets_missing_ttl():
+    backend = make_fakeredis()
+    # Left behind without a TTL (e.g. by a crash between two separate commands).
+    await backend.client.set("window", "3")
+    assert await backend.incr("window", ttl=60) == 4
+    assert 0 < await backend.client.pttl("window") <= 60_000
+    # An existing expiry is kept, not extended.
+    await backend.client.pexpire("window", 5_000)
+    await backend.incr("window", 2, ttl=60)
+    assert await backend.client.pttl("window") <= 5_000
+    await backend.aclose()
+
+
+def test_create_state_backend():
+    assert isinstance(create_state_backend("memory://"), InMemoryStateBackend)
+    with pytest.raises(ValueError):
+        create_state_backend("bogus://")
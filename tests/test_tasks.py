@@ -0,0 +1,101 @@
+"""Tests for the background task queue."""
+import asyncio
+
+import pytest
+
+from src.services.tasks import TaskQueue
+
+
+class TestTaskQueue:
+    """Batching, retry, drain and metrics tests."""
+
+    @pytest.mark.asyncio
+    async def test_items_are_micro_batched(self):
+        batches = []
+
+        async def handler(items):
+            batches.append(list(items))
+
+        tasks = TaskQueue()
+        tasks.register("collect", handler, batch_size=4, max_wait=0.05)
+        await tasks.start()
+        for i in range(10):
+            assert tasks.submit("collect", i)
+        await tasks.drain(timeout=1)
+
+        assert [item for batch in batches for item in batch] == list(range(10))
+        assert [len(batch) for batch in batches] == [4, 4, 2]
+        stats = tasks.stats()["queues"]["collect"]
+        assert stats["processed"] == 10
+        assert stats["batches"] == 3
+        assert stats["depth"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_batches_are_retried(self):
+        calls = []
+
+        async def flaky(items):
+            calls.append(items)
+            if len(calls) < 3:
+                raise RuntimeError("provider unavailable")
+
+        tasks = TaskQueue()
+        tasks.register("flaky", flaky, retries=3, backoff=0.001)
+        await tasks.start()
+        tasks.submit("flaky", "x")
+        await tasks.drain(timeout=1)
+
+        stats = tasks.stats()["queues"]["flaky"]
+        assert len(calls) == 3
+        assert stats["retries"] == 2
+        assert stats["processed"] == 1
+        assert stats["failed"] == 0
+
+    @pytest.mark.asyncio
+    async def test_exhausted_retries_count_as_failed(self):
+        async def broken(items):
+            raise RuntimeError("boom")
+
+        tasks = TaskQueue()
+        tasks.register("broken", broken, retries=1, backoff=0.001)
+        await tasks.start()
+        tasks.submit("broken", 1)
+        tasks.submit("broken", 2)
+        await tasks.drain(timeout=1)
+        assert tasks.stats()["queues"]["broken"]["failed"] == 2
+
+    @pytest.mark.asyncio
+    async def test_bounded_queue_drops_when_full(self):
+        release = asyncio.Event()
+
+        async def slow(items):
+            await release.wait()
+
+        tasks = TaskQueue()
+        tasks.register("slow", slow, batch_size=1, max_queue=2)
+        await tasks.start()
+        results = [tasks.submit("slow", i) for i in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        await tasks.drain(timeout=1)
+
+        assert results.count(False) >= 2
+        assert tasks.stats()["queues"]["slow"]["dropped"] == results.count(False)
+
+    @pytest.mark.asyncio
+    async def test_drain_stops_accepting(self):
+        async def handler(items):
+            pass
+
+        tasks = TaskQueue()
+        tasks.register("q", handler)
+        await tasks.start()
+        await tasks.drain(timeout=1)
+        assert tasks.submit("q", 1) is False
+        assert tasks.stats()["running"] is False
+
+    @pytest.mark.asyncio
+    async def test_run_cpu_uses_worker_pool(self):
+        tasks = TaskQueue(cpu_workers=2)
+        assert await tasks.run_cpu(sum, [1, 2, 3]) == 6
+        await tasks.drain(timeout=1)
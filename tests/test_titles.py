@@ -0,0 +1,95 @@
+"""Tests for generated conversation titles."""
+import pytest
+
+from src.database import SessionLocal, init_db, Conversation
+from src.services.metering import UsageMeter
+from src.services.resilience import ProviderError, get_breaker
+from src.services.state import InMemoryStateBackend
+from src.services.titles import TitleGenerator
+
+
+class TestTitleParsing:
+    """Parsing of the batched model reply."""
+
+    def test_titles_in_input_order(self):
+        reply = 'Sure:\n```json\n{"2": "Receita de bolo.", "1": "  \\"Docker volumes\\" "}\n```'
+        assert TitleGenerator.parse(reply, 3) == ["Docker volumes", "Receita de bolo", None]
+
+    def test_invalid_reply(self):
+        assert TitleGenerator.parse("no json here", 2) == [None, None]
+        assert TitleGenerator.parse("[1, 2]", 1) == [None]
+
+
+class TestTitleConversations:
+    """Batch title generation and storage."""
+
+    def setup_method(self):
+        init_db()
+        db = SessionLocal()
+        db.add_all([
+            Conversation(id="title-1", user_id="title-alice", title="how do i mount a vol"),
+            Conversation(id="title-2", user_id="title-bob", title="bolo de cenoura"),
+        ])
+        db.commit()
+        db.close()
+
+    def teardown_method(self):
+        db = SessionLocal()
+        db.query(Conversation).filter(Conversation.id.like("title-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+    @pytest.mark.asyncio
+    async def test_one_call_titles_the_batch(self, stub_provider):
+        service = stub_provider("titles-test", chunks=['{"1": "Docker volumes", "2": "Bolo de cenoura"}'])
+        provider = service.provider
+        meter = UsageMeter(InMemoryStateBackend())
+        generator = TitleGenerator(service, model="cheap-model", meter=meter)
+
+        updates = await generator.title_conversations([
+            ("title-1", "how do i mount a volume in docker?", "Use -v host:container."),
+            ("title-2", "bolo de cenoura", "Ingredientes: cenoura, ovos..."),
+        ])
+
+        assert len(provider.calls) == 1
+        assert provider.calls[0][1] == "cheap-model"
+        assert {u["conversation_id"]: u["title"] for u in updates} == {
+            "title-1": "Docker volumes", "title-2": "Bolo de cenoura",
+        }
+        assert updates[0]["user_id"] in ("title-alice", "title-bob")
+        # The call is metered (estimated locally, the fake reports no usage).
+        assert meter.stats()["pending"] == 1
+
+        db = SessionLocal()
+        conversation = db.get(Conversation, "title-1")
+        assert conversation.title == "Docker volumes"
+        assert conversation.title_generated is True
+        db.close()
+
+    @pytest.mark.asyncio
+    async def test_titles_are_generated_once_and_keep_updated_at(self, stub_provider):
+        db = SessionLocal()
+        before = db.get(Conversation, "title-1").updated_at
+        db.close()
+
+        generator = TitleGenerator(stub_provider("titles-test", chunks=['{"1": "First"}']))
+        assert len(await generator.title_conversations([("title-1", "q", "a")])) == 1
+        generator = TitleGenerator(stub_provider("titles-test", chunks=['{"1": "Second"}']))
+        assert await generator.title_conversations([("title-1", "q", "a")]) == []
+
+        db = SessionLocal()
+        conversation = db.get(Conversation, "title-1")
+        assert conversation.title == "First"
+        assert conversation.updated_at == before
+        db.close()
+
+    @pytest.mark.asyncio
+    async def test_open_breaker_stops_title_calls(self, stub_provider):
+        service = stub_provider("titles-breaker", chunks=['{"1": "Never"}'])
+        provider = service.provider
+        breaker = get_breaker("titles-breaker")
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        with pytest.raises(ProviderError):
+            await TitleGenerator(service).title_conversations([("title-1", "q", "a")])
+        assert provider.calls == []
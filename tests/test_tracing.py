@@ -0,0 +1,90 @@
+"""Tests for request, database and provider tracing."""
+import json
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from src.main import app
+from src.database import init_db
+from src.services.tracing import current_trace_id, setup_tracing, tracer
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def exporter():
+    exporter = InMemorySpanExporter()
+    setup_tracing(exporter)
+    yield exporter
+    exporter.shutdown()
+
+
+@pytest.fixture
+def spans(exporter, stub_provider):
+    init_db()
+    stub_provider("chunks", chunks=["first ", "second"])
+    exporter.clear()
+    return exporter
+
+
+def by_name(finished):
+    return {span.name: span for span in finished}
+
+
+class TestRequestTracing:
+    """Spans for a chat request share one trace."""
+
+    def test_stream_spans(self, spans):
+        response = client.post("/chat/stream", json={"content": "hello", "user_id": "trace-user"})
+        trace_id = response.headers["x-trace-id"]
+        setup = json.loads(response.text.split("\n\n")[0][len("data: "):])
+        assert setup["trace_id"] == trace_id
+
+        finished = spans.get_finished_spans()
+        names = by_name(finished)
+        assert {"POST /chat/stream", "chat.context", "llm.stream", "chat.persist"} <= set(names)
+        assert all(format(span.context.trace_id, "032x") == trace_id for span in finished)
+
+        server = names["POST /chat/stream"]
+        assert server.attributes["http.route"] == "/chat/stream"
+        assert server.attributes["http.response.status_code"] == 200
+        # The server span covers the whole streamed body.
+        assert server.end_time >= names["chat.persist"].end_time
+
+        llm = names["llm.stream"]
+        assert llm.attributes["llm.provider"] == "chunks"
+        assert [event.name for event in llm.events] == ["first_token"]
+        assert llm.attributes["llm.ttft_ms"] >= 0
+
+        db_spans = [span for span in finished if span.name.startswith("db.")]
+        assert any(span.attributes["db.operation"] == "INSERT" for span in db_spans)
+        persist = names["chat.persist"]
+        assert any(span.parent.span_id == persist.context.span_id for span in db_spans)
+
+    def test_incoming_traceparent_is_continued(self, spans):
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+        response = client.get("/health", headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+        assert response.headers["x-trace-id"] == trace_id
+
+    def test_untraced_queries_make_no_spans(self, spans):
+        from src.database import ping_db
+
+        ping_db()
+        assert spans.get_finished_spans() == ()
+
+
+class TestLogCorrelation:
+    """Log records carry the trace id."""
+
+    def test_records_have_trace_id(self, exporter, caplog):
+        log = logging.getLogger("trace-test")
+        with caplog.at_level(logging.INFO, logger="trace-test"):
+            log.info("outside")
+            with tracer.start_as_current_span("work"):
+                log.info("inside")
+                trace_id = current_trace_id()
+        outside, inside = caplog.records
+        assert outside.trace_id == "-"
+        assert inside.trace_id == trace_id
@@ -0,0 +1,102 @@
+"""Tests for token accounting and usage aggregates."""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.database import SessionLocal, init_db, Conversation, Message, UsageEvent, UsageRollup
+from src.main import app
+from src.services.ai_service import TokenUsage
+from src.services.metering import backfill
+from src.services.tokenizer import count_tokens, count_prompt_tokens
+
+
+SILENT = ["four ", "words ", "of ", "output"]
+
+
+class TestTokenizer:
+    """Local tokenizer tests."""
+
+    def test_count_tokens(self):
+        assert count_tokens("") == 0
+        assert count_tokens("hello world") >= 2
+        assert count_tokens("a" * 400) >= 100
+
+    def test_prompt_tokens_include_history(self):
+        without = count_prompt_tokens("hi", [])
+        with_history = count_prompt_tokens("hi", [("question", "answer")])
+        assert with_history > without
+
+
+class TestUsageCapture:
+    """Usage fallback tests."""
+
+    @pytest.mark.asyncio
+    async def test_generate_estimates_missing_usage(self, stub_provider):
+        # Like some local servers, the provider reports no usage.
+        service = stub_provider("silent", chunks=SILENT, model="silent")
+        usage = TokenUsage()
+        _, tokens = await service.generate_response("hi", [], usage=usage)
+        assert usage.estimated
+        assert usage.prompt_tokens > 0
+        assert usage.completion_tokens > 0
+        assert tokens == usage.total_tokens
+
+    @pytest.mark.asyncio
+    async def test_stream_estimates_missing_usage(self, stub_provider):
+        service = stub_provider("silent", chunks=SILENT, model="silent")
+        usage = TokenUsage()
+        chunks = [c async for c in service.stream_response("hi", [], usage=usage)]
+        assert "".join(chunks) == "four words of output"
+        assert usage.completion_tokens == count_tokens("four words of output", "silent")
+
+
+class TestUsageEndpoint:
+    """Per-user usage aggregate tests."""
+
+    def setup_method(self):
+        init_db()
+        db = SessionLocal()
+        now = datetime.utcnow()
+        db.add(Conversation(id="usage-c1", user_id="usage-user"))
+        db.add(Conversation(id="usage-c2", user_id="usage-user"))
+        db.add(Conversation(id="usage-c3", user_id="someone-else"))
+        rows = [
+            ("usage-c1", now, 10, 5),
+            ("usage-c1", now - timedelta(days=1), 20, 10),
+            ("usage-c2", now, 30, 15),
+            ("usage-c3", now, 1000, 1000),
+            ("usage-c2", now - timedelta(days=90), 500, 500),
+        ]
+        for i, (cid, created, prompt, completion) in enumerate(rows):
+            db.add(Message(
+                id=f"usage-m{i}", conversation_id=cid, user_message="q", ai_response="a",
+                prompt_tokens=prompt, completion_tokens=completion,
+                tokens_used=prompt + completion, created_at=created,
+            ))
+        db.commit()
+        # Usage is served from rollups; messages written outside the API are counted by a backfill.
+        db.query(UsageEvent).delete()
+        db.query(UsageRollup).delete()
+        backfill(db)
+        db.close()
+
+    def teardown_method(self):
+        db = SessionLocal()
+        db.query(Message).filter(Message.id.like("usage-%")).delete(synchronize_session=False)
+        db.query(Conversation).filter(Conversation.id.like("usage-%")).delete(synchronize_session=False)
+        db.query(UsageRollup).delete()
+        db.commit()
+        db.close()
+
+    def test_user_usage(self):
+        response = TestClient(app).get("/users/usage-user/usage", params={"days": 30})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["conversations"] == 2
+        assert data["messages"] == 3
+        assert data["prompt_tokens"] == 60
+        assert data["completion_tokens"] == 30
+        assert data["total_tokens"] == 90
+        assert len(data["daily"]) == 2
+        assert sum(d["messages"] for d in data["daily"]) == 3